@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""Push-mode collection agent for GPU/NPU monitor.
+
+Runs the server's monitor probes locally every interval and pushes the raw
+section output to the server's /ingest endpoint, gzip-compressed. Reports that
+cannot be delivered are kept (up to MAX_BUFFERED_REPORTS) and sent in the next
+batch; when the server refuses the token they are kept too, pushes back off,
+and agent.json is re-read in case the token was rotated. Only the standard
+library is used so it runs on any host with python3.
+
+The server installs it together with agent.json (server URL, token, probe
+command); run `python3 monitor_agent.py --config agent.json --once` to print
+a single report without sending it.
+"""
+import argparse
+import gzip
+import json
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+AGENT_VERSION = "1"
+MAX_BUFFERED_REPORTS = 60
+PUSH_TIMEOUT_SECONDS = 15
+AUTH_BACKOFF_MAX_SECONDS = 600
+
+PUSH_SENT = "sent"
+PUSH_RETRY = "retry"  # keep the batch, push again next interval
+PUSH_AUTH_FAILED = "auth_failed"  # keep the batch, back off until the token is fixed
+PUSH_REJECTED = "rejected"  # drop the batch, it will never be accepted
+
+def log(message):
+    print(time.strftime("%Y-%m-%d %H:%M:%S") + " - " + message, flush=True)
+
+def load_config(path):
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    for key in ("server_url", "token", "ip", "command", "delimiter"):
+        if not config.get(key):
+            raise ValueError("agent config is missing " + key)
+    config.setdefault("interval_seconds", 60)
+    config.setdefault("command_timeout_seconds", 30)
+    return config
+
+def collect(config):
+    report = {
+        "ip": config["ip"],
+        "ts": time.time(),
+        "interval": int(config["interval_seconds"]),
+        "agent_version": AGENT_VERSION,
+    }
+    try:
+        proc = subprocess.run(
+            ["/bin/sh", "-c", config["command"]],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            timeout=config["command_timeout_seconds"],
+        )
+        report["sections"] = proc.stdout.decode("utf-8", "replace").strip().split(config["delimiter"])
+    except Exception as e:
+        report["error"] = str(e) or e.__class__.__name__
+    return report
+
+def push(config, reports):
+    """Sends a batch; returns one of the PUSH_* outcomes."""
+    body = gzip.compress(json.dumps({"reports": reports}, separators=(",", ":")).encode("utf-8"))
+    request = urllib.request.Request(
+        config["server_url"].rstrip("/") + "/ingest",
+        data=body,
+        method="POST",
+        headers={
+            "Content-Type": "application/json",
+            "Content-Encoding": "gzip",
+            "X-Agent-Token": config["token"],
+        },
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=PUSH_TIMEOUT_SECONDS) as response:
+            response.read()
+        return PUSH_SENT
+    except urllib.error.HTTPError as e:
+        if e.code in (401, 403):
+            # Token rotated or ingest disabled; the reports are still good once that is fixed
+            log("Server refused the agent token (HTTP {}), keeping {} reports".format(e.code, len(reports)))
+            return PUSH_AUTH_FAILED
+        log("Server rejected {} reports: HTTP {}".format(len(reports), e.code))
+        # Other client errors will not succeed on retry; server errors will be retried
+        return PUSH_REJECTED if e.code < 500 else PUSH_RETRY
+    except Exception as e:
+        log("Push failed, keeping {} reports: {}".format(len(reports), e))
+        return PUSH_RETRY
+
+def auth_backoff_seconds(failures, interval):
+    return min(interval * 2 ** failures, AUTH_BACKOFF_MAX_SECONDS)
+
+def reload_token(config, config_path):
+    """Picks up a token rewritten into agent.json; returns whether it changed."""
+    if not config_path:
+        return False
+    try:
+        token = load_config(config_path)["token"]
+    except Exception as e:
+        log("Could not re-read {}: {}".format(config_path, e))
+        return False
+    if token == config["token"]:
+        return False
+    config["token"] = token
+    log("Agent token changed in {}, pushing again".format(config_path))
+    return True
+
+def run(config, config_path=None):
+    interval = max(1, int(config["interval_seconds"]))
+    pending = []
+    auth_failures = 0
+    next_push_ts = 0
+    log("Agent {} started for {}, pushing to {} every {}s".format(
+        AGENT_VERSION, config["ip"], config["server_url"], interval))
+
+    next_ts = time.time()
+    while True:
+        pending.append(collect(config))
+        del pending[:-MAX_BUFFERED_REPORTS]
+        if time.time() >= next_push_ts or reload_token(config, config_path):
+            result = push(config, pending)
+            if result in (PUSH_SENT, PUSH_REJECTED):
+                pending = []
+            if result == PUSH_AUTH_FAILED:
+                auth_failures += 1
+                next_push_ts = time.time() + auth_backoff_seconds(auth_failures, interval)
+            else:
+                auth_failures = 0
+                next_push_ts = 0
+
+        next_ts += interval
+        delay = next_ts - time.time()
+        if delay < 0:
+            # Fell behind (slow probes or a long push); realign instead of bursting
+            next_ts = time.time()
+            delay = 0
+        time.sleep(delay)
+
+def main():
+    parser = argparse.ArgumentParser(description="GPU/NPU monitor push agent")
+    parser.add_argument("--config", default="agent.json")
+    parser.add_argument("--once", action="store_true", help="print one report and exit")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    if args.once:
+        print(json.dumps(collect(config), indent=2, ensure_ascii=False))
+        return
+    try:
+        run(config, args.config)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""Compares FastAPI's default JSON path with services/json_response.py for dashboard payloads.
+
+Usage (from backend/):
+    python benchmarks/bench_api_json.py [--seconds 1]
+
+"before" is what FastAPI does for a returned dict (jsonable_encoder, then
+JSONResponse); "after" is json_response's FAST_JSON_RESPONSES serialization,
+enabled here regardless of the environment. Both outputs are
+decoded and compared first; any difference exits with status 1.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from models import Machine
+from services import json_response as fast
+
+fast.FAST_JSON = True
+
+# Columns the dashboard requests with fields=
+LIST_FIELDS = (
+    "id", "ip", "port", "username", "password", "status", "os_info", "arch",
+    "accelerator_type", "accelerator_count", "idle_count", "busy_count", "warning_count", "accelerator_status",
+    "last_updated", "error_message", "remark", "ibmc_ip", "ibmc_username", "ibmc_password", "is_own",
+    "poll_min_interval", "poll_max_interval", "stream_enabled", "stream_interval",
+)
+
+def make_machine(i: int) -> Machine:
+    cards = [
+        {
+            "id": c,
+            "name": "Ascend910B3",
+            "health": "OK",
+            "power": f"{random.randint(80, 350)}W",
+            "temp": f"{random.randint(35, 80)}C",
+            "memory_used": random.randint(0, 65536),
+            "memory_total": 65536,
+            "util": random.randint(0, 100),
+            "busy": random.random() < 0.5,
+            "processes": [],
+        }
+        for c in range(8)
+    ]
+    return Machine(
+        id=i + 1,
+        ip=f"10.{i // 256}.{i % 256}.1",
+        username="root",
+        password="secret",
+        status="Online",
+        os_info="Ubuntu 22.04.4 LTS",
+        arch="aarch64",
+        accelerator_type="Huawei Ascend",
+        accelerator_count=8,
+        idle_count=4,
+        busy_count=4,
+        accelerator_status=json.dumps(cards),
+        last_updated=datetime.now(),
+        remark="rack B, row 3",
+        hw_fingerprint="f" * 64,
+        topo_fingerprint="f" * 64,
+    )
+
+def make_topology(nodes: int = 1500) -> str:
+    return json.dumps({
+        "nodes": [
+            {
+                "id": f"0000:{n // 32:02x}:{n % 32:02x}.0",
+                "label": f"PCI bridge {n}",
+                "vendor": "Huawei Technologies Co., Ltd.",
+                "device": "Hi1822 Family",
+                "link": {"speed": "16GT/s", "width": "x16"},
+                "numa_node": n % 4,
+                "children": [f"0000:{(n + 1) // 32:02x}:{(n + 1) % 32:02x}.0"],
+            }
+            for n in range(nodes)
+        ],
+        "edges": [[n, n + 1] for n in range(nodes - 1)],
+    })
+
+def list_payload(machines, projected: bool) -> dict:
+    items = [{f: getattr(m, f) for f in LIST_FIELDS} for m in machines] if projected else machines
+    return {"items": items, "total": 20000, "page": 1, "size": len(machines), "next_cursor": "MTAuMC4xMC4x", "version": 1}
+
+def before_dict(payload) -> bytes:
+    return JSONResponse(content=jsonable_encoder(payload)).body
+
+def before_topology(blob: str) -> bytes:
+    return before_dict(json.loads(blob))
+
+def after_dict(payload) -> bytes:
+    return fast.dumps(payload)
+
+def after_topology(blob: str) -> bytes:
+    return blob.encode("utf-8")
+
+def rate(fn, arg, seconds: float) -> float:
+    """Milliseconds per call."""
+    count = 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        fn(arg)
+        count += 1
+    return (time.perf_counter() - start) / count * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=1.0, help="time spent per measurement")
+    args = parser.parse_args()
+
+    random.seed(1)
+    machines = [make_machine(i) for i in range(100)]
+    cases = [
+        ("list size=10", list_payload(machines[:10], False), before_dict, after_dict),
+        ("list size=100", list_payload(machines, False), before_dict, after_dict),
+        ("list size=100 fields=", list_payload(machines, True), before_dict, after_dict),
+        ("fleet topology", make_topology(), before_topology, after_topology),
+    ]
+
+    failed = False
+    for name, payload, before, after in cases:
+        if json.loads(before(payload)) != json.loads(after(payload)):
+            print(f"MISMATCH: {name}")
+            failed = True
+    if failed:
+        sys.exit(1)
+
+    print(f"encoder: {'orjson' if fast.orjson else 'json'}, brotli: {'yes' if fast.brotli else 'no'}")
+    print(f"{'payload':<24}{'before ms':>10}{'after ms':>10}{'speedup':>9}{'bytes':>10}{'gzip':>9}{'br':>9}{'gzip ms':>9}")
+    for name, payload, before, after in cases:
+        before_ms = rate(before, payload, args.seconds)
+        after_ms = rate(after, payload, args.seconds)
+        body = after(payload)
+        gzip_ms = rate(lambda b: fast.compress(b, "gzip"), body, args.seconds)
+        gzipped = len(fast.compress(body, "gzip"))
+        br = str(len(fast.compress(body, "br"))) if fast.brotli else "-"
+        print(
+            f"{name:<24}{before_ms:>10.3f}{after_ms:>10.3f}{before_ms / after_ms:>8.1f}x"
+            f"{len(body):>10}{gzipped:>9}{br:>9}{gzip_ms:>9.3f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Checks services/smi_parser.py against the original parsers and measures parses per second.
+
+Usage (from backend/):
+    python benchmarks/bench_smi_parser.py [--seconds 2]
+
+Every file in benchmarks/corpus is parsed by both implementations, as is every
+line-truncated prefix of it (partial output from a timed-out command). Any
+difference is printed and the script exits with status 1.
+"""
+import argparse
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import legacy_smi_parser as legacy
+from services import smi_parser as fast
+
+CORPUS_DIR = os.path.join(BENCH_DIR, "corpus")
+
+def load_corpus():
+    samples = {"nvidia": [], "npu": []}
+    for file_name in sorted(os.listdir(CORPUS_DIR)):
+        kind = file_name.split("_", 1)[0]
+        if kind not in samples:
+            continue
+        with open(os.path.join(CORPUS_DIR, file_name), encoding="utf-8") as f:
+            # check_machine strips each section before parsing
+            samples[kind].append((file_name, f.read().strip()))
+    return samples
+
+def _prefixes(text):
+    lines = text.splitlines()
+    for i in range(len(lines)):
+        yield "\n".join(lines[:i + 1])
+
+def verify(samples) -> int:
+    parsers = {
+        "nvidia": (legacy.parse_nvidia_output, fast.parse_nvidia_output),
+        "npu": (legacy.parse_huawei_output, fast.parse_huawei_output),
+    }
+    mismatches = 0
+    checked = 0
+    for kind, items in samples.items():
+        old_parser, new_parser = parsers[kind]
+        for file_name, text in items:
+            for variant in [text, *_prefixes(text)]:
+                checked += 1
+                expected = old_parser(variant)
+                actual = new_parser(variant)
+                if expected != actual:
+                    mismatches += 1
+                    print(f"MISMATCH {file_name} ({len(variant.splitlines())} lines)")
+                    print(f"  legacy: {expected}")
+                    print(f"  fast:   {actual}")
+    print(f"Verified {checked} inputs from {sum(len(v) for v in samples.values())} corpus files: {mismatches} mismatches")
+    return mismatches
+
+def measure(parser, texts, seconds: float) -> float:
+    parses = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for text in texts:
+            parser(text)
+        parses += len(texts)
+    return parses / (time.perf_counter() - start)
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--seconds", type=float, default=2.0, help="measurement time per parser")
+    args = arg_parser.parse_args()
+
+    samples = load_corpus()
+    if verify(samples):
+        sys.exit(1)
+
+    print(f"{'parser':<8}{'legacy/s':>12}{'fast/s':>12}{'speedup':>10}")
+    for kind, old_parser, new_parser in (
+        ("nvidia", legacy.parse_nvidia_output, fast.parse_nvidia_output),
+        ("npu", legacy.parse_huawei_output, fast.parse_huawei_output),
+    ):
+        texts = [text for _, text in samples[kind]]
+        old_rate = measure(old_parser, texts, args.seconds)
+        new_rate = measure(new_parser, texts, args.seconds)
+        print(f"{kind:<8}{old_rate:>12.0f}{new_rate:>12.0f}{new_rate / old_rate:>9.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,167 @@
 from sqlmodel import SQLModel, Session, create_engine
+from sqlalchemy import event, inspect, text
+from sqlalchemy.exc import IntegrityError
 from typing import Generator
 
+from logger import logger
+
 sqlite_file_name = "database.db"
 sqlite_url = f"sqlite:///{sqlite_file_name}"
 
-connect_args = {"check_same_thread": False}
-engine = create_engine(sqlite_url, connect_args=connect_args)
+# Seconds a connection waits on a locked database before raising "database is locked"
+SQLITE_BUSY_TIMEOUT_SECONDS = 15
+
+connect_args = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_SECONDS}
+engine = create_engine(
+    sqlite_url,
+    connect_args=connect_args,
+    pool_size=10,
+    max_overflow=20,
+    pool_timeout=30,
+)
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL lets API reads proceed while the poller writes
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_SECONDS * 1000}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-16000")  # ~16 MB page cache per connection
+    cursor.close()
+
+def _column_default_sql(column) -> str:
+    default = column.default
+    if default is None or not getattr(default, "is_scalar", False):
+        return ""
+    value = default.arg
+    if isinstance(value, bool):
+        return f" DEFAULT {int(value)}"
+    if isinstance(value, (int, float)):
+        return f" DEFAULT {value}"
+    if isinstance(value, str):
+        escaped = value.replace("'", "''")
+        return f" DEFAULT '{escaped}'"
+    return ""
+
+def _add_missing_columns():
+    """Adds columns declared on the models but missing from an existing database."""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(
+                    f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}{_column_default_sql(column)}'
+                ))
+                logger.info(f"Added column {table.name}.{column.name}")
+
+def _duplicate_rows_message(index) -> str:
+    columns = [column.name for column in index.columns]
+    column_list = ", ".join(f'"{name}"' for name in columns)
+    with engine.connect() as conn:
+        duplicates = conn.execute(text(
+            f'SELECT {column_list}, COUNT(*) FROM "{index.table.name}" '
+            f"GROUP BY {column_list} HAVING COUNT(*) > 1 LIMIT 20"
+        )).all()
+    listed = ", ".join(f"{'/'.join(str(v) for v in row[:-1])} (x{row[-1]})" for row in duplicates)
+    return (
+        f"Cannot create unique index {index.name}: {index.table.name}.{'/'.join(columns)} has duplicate values: {listed}. "
+        f"Delete or change the duplicate rows in {sqlite_file_name}, then start the server again."
+    )
+
+def _create_missing_indexes():
+    """create_all only creates indexes for new tables, so build them in place for old databases."""
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(engine, checkfirst=True)
+            except IntegrityError:
+                # Writers rely on unique indexes to reject duplicates, so running without one is not safe
+                message = _duplicate_rows_message(index)
+                logger.error(message)
+                raise RuntimeError(message) from None
+            except Exception as e:
+                logger.error(f"Failed to create index {index.name}: {e}")
+
+# Trigram full-text index over the searchable machine columns, kept in sync by triggers
+SEARCH_INDEX_TABLE = "machine_search"
+SEARCH_INDEX_COLUMNS = ("ip", "username", "accelerator_type")
+# Set by _create_search_index; callers fall back to LIKE scans when SQLite lacks FTS5 trigram
+search_index_available = False
+
+def _create_search_index():
+    global search_index_available
+    columns = ", ".join(SEARCH_INDEX_COLUMNS)
+    new_values = ", ".join(f"new.{c}" for c in SEARCH_INDEX_COLUMNS)
+    old_values = ", ".join(f"old.{c}" for c in SEARCH_INDEX_COLUMNS)
+    delete_old = (
+        f"INSERT INTO {SEARCH_INDEX_TABLE}({SEARCH_INDEX_TABLE}, rowid, {columns}) "
+        f"VALUES ('delete', old.id, {old_values});"
+    )
+    insert_new = f"INSERT INTO {SEARCH_INDEX_TABLE}(rowid, {columns}) VALUES (new.id, {new_values});"
+    try:
+        with engine.begin() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {"name": SEARCH_INDEX_TABLE},
+            ).first()
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_INDEX_TABLE} USING fts5("
+                f"{columns}, content='machine', content_rowid='id', tokenize='trigram')"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {SEARCH_INDEX_TABLE}_ai AFTER INSERT ON machine BEGIN {insert_new} END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {SEARCH_INDEX_TABLE}_ad AFTER DELETE ON machine BEGIN {delete_old} END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {SEARCH_INDEX_TABLE}_au AFTER UPDATE OF {columns} ON machine "
+                f"BEGIN {delete_old} {insert_new} END"
+            ))
+            if not exists:
+                # Index the rows of a database created before the search index existed
+                conn.execute(text(f"INSERT INTO {SEARCH_INDEX_TABLE}({SEARCH_INDEX_TABLE}) VALUES ('rebuild')"))
+                logger.info(f"Built search index {SEARCH_INDEX_TABLE}")
+        search_index_available = True
+    except Exception as e:
+        search_index_available = False
+        logger.error(f"Search index unavailable, machine search falls back to LIKE scans: {e}")
+
+def _move_topology_out_of_machine_rows():
+    """Copies topologies stored on machine.pci_topo_json by older versions into machine_topology."""
+    columns = {c["name"] for c in inspect(engine).get_columns("machine")}
+    if "pci_topo_json" not in columns:
+        return
+    with engine.begin() as conn:
+        moved = conn.execute(text(
+            "INSERT OR IGNORE INTO machine_topology (machine_id, pci_topo_json, updated_at) "
+            "SELECT id, pci_topo_json, last_updated FROM machine WHERE pci_topo_json IS NOT NULL"
+        )).rowcount
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE machine DROP COLUMN pci_topo_json"))
+    except Exception as e:
+        # SQLite before 3.35 cannot drop columns; clearing the blobs still shrinks the rows
+        logger.warning(f"Could not drop machine.pci_topo_json, clearing it instead: {e}")
+        with engine.begin() as conn:
+            conn.execute(text("UPDATE machine SET pci_topo_json = NULL"))
+    logger.info(f"Moved {moved} topologies into machine_topology")
 
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    _add_missing_columns()
+    _create_missing_indexes()
+    _move_topology_out_of_machine_rows()
+    _create_search_index()
 
 def get_session() -> Generator[Session, None, None]:
     with Session(engine) as session:
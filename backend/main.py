@@ -8,10 +8,21 @@ from fastapi.responses import FileResponse
 from sqlmodel import SQLModel
 
 from database import engine, create_db_and_tables
-from routers import machines, settings
+from routers import machines, settings, ingest, metrics, fleet
 from scheduler import scheduler
-from services.monitor_service import update_all_machines
-from services.topo_service import update_all_machines_topo
+from services.monitor_service import ssh_pool
+from services.poll_scheduler import apply_poll_schedule, sync_poll_schedule, staggered_poll_scheduler
+from services.topo_service import update_all_machines_topo, topo_scheduler
+from services.telemetry_store import telemetry_store
+from services.stream_collector import stream_collector
+from services.machine_events import machine_events
+from services.metrics_exporter import metrics_exporter
+from services.fleet_summary import fleet_summary
+from services.machine_search import machine_count_cache
+from services.fleet_snapshot import fleet_snapshot
+from services.refresh_jobs import refresh_jobs
+from services.cluster import cluster, HEARTBEAT_SECONDS
+from services.change_feed import change_feed, FEED_SYNC_SECONDS
 from logger import setup_logging
 
 __version__ = "1.0.2"
@@ -23,17 +34,57 @@ async def lifespan(app: FastAPI):
     
     # Initialize DB
     create_db_and_tables()
+
+    # Join the other instances sharing this database before taking a share of the machines
+    cluster.start()
+    cluster.add_rebalance_listener(stream_collector.sync)
     
+    # Keep the Prometheus exposition, fleet totals and list snapshot current from machine events,
+    # including the ones other instances publish through the change feed
+    change_feed.start()
+    machine_events.add_listener(change_feed.on_event)
+    machine_events.add_listener(metrics_exporter.on_event)
+    machine_events.add_listener(fleet_summary.on_event)
+    machine_events.add_listener(machine_count_cache.on_event)
+    machine_events.add_listener(fleet_snapshot.on_event)
+    # Fleet-wide refreshes started on another instance refresh this instance's machines
+    machine_events.add_listener(refresh_jobs.on_event)
+    for view in (metrics_exporter.load, fleet_summary.load, machine_count_cache.clear, fleet_snapshot.load):
+        change_feed.add_resync_callback(view)
+    metrics_exporter.load()
+    fleet_summary.load()
+    fleet_snapshot.ensure_loaded()
+
     # Start scheduler
     # Check if job already exists to avoid duplicate job error on reload
     if not scheduler.get_job('monitor_job'):
-        scheduler.add_job(update_all_machines, 'interval', minutes=1, id='monitor_job')
+        apply_poll_schedule()
+    if not scheduler.get_job('ssh_pool_evict_job'):
+        scheduler.add_job(ssh_pool.evict_idle, 'interval', minutes=1, id='ssh_pool_evict_job')
+    if not scheduler.get_job('cluster_heartbeat_job'):
+        scheduler.add_job(cluster.heartbeat, 'interval', seconds=HEARTBEAT_SECONDS, id='cluster_heartbeat_job')
+    if not scheduler.get_job('change_feed_job'):
+        scheduler.add_job(
+            change_feed.sync, 'interval', seconds=FEED_SYNC_SECONDS, id='change_feed_job',
+            max_instances=1, coalesce=True,
+        )
+    if not scheduler.get_job('fleet_snapshot_load_job'):
+        scheduler.add_job(fleet_snapshot.ensure_loaded, 'interval', minutes=1, id='fleet_snapshot_load_job')
+    if not scheduler.get_job('schedule_sync_job'):
+        scheduler.add_job(sync_poll_schedule, 'interval', seconds=HEARTBEAT_SECONDS, id='schedule_sync_job')
+    # Shared tables are maintained once per deployment, by the leader
+    if not scheduler.get_job('telemetry_compact_job'):
+        scheduler.add_job(cluster.leader_only(telemetry_store.compact), 'interval', hours=1, id='telemetry_compact_job')
+    if not scheduler.get_job('change_feed_prune_job'):
+        scheduler.add_job(cluster.leader_only(change_feed.prune), 'interval', minutes=1, id='change_feed_prune_job')
     
     if not scheduler.running:
         scheduler.start()
 
-    # Trigger initial topo update in background
-    # This runs in a separate thread to avoid blocking startup
+    # Open streaming channels for machines that opted in
+    stream_collector.start()
+
+    # Queue the initial topo sweep of this instance's machines in the background
     threading.Thread(target=update_all_machines_topo, daemon=True).start()
     
     yield
@@ -42,6 +93,26 @@ async def lifespan(app: FastAPI):
     if scheduler.running:
         scheduler.shutdown()
 
+    # Finish in-flight staggered polls
+    staggered_poll_scheduler.stop()
+
+    # Close streaming channels and write their last records
+    stream_collector.stop()
+
+    # Drop queued manual refreshes and topology jobs
+    refresh_jobs.shutdown()
+    topo_scheduler.stop()
+
+    # Close pooled SSH connections
+    ssh_pool.close_all()
+
+    # Persist partially filled telemetry chunks
+    telemetry_store.flush(force=True)
+
+    # Publish the last local events and hand this instance's machines to the others
+    change_feed.sync()
+    cluster.stop()
+
 app = FastAPI(lifespan=lifespan)
 
 # CORS
@@ -56,6 +127,9 @@ app.add_middleware(
 # Include routers
 app.include_router(machines.router)
 app.include_router(settings.router)
+app.include_router(ingest.router)
+app.include_router(metrics.router)
+app.include_router(fleet.router)
 
 @app.get("/version")
 def get_version():
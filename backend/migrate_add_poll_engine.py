@@ -0,0 +1,36 @@
+from sqlmodel import Session, create_engine, text
+import os
+
+# Try to locate the database file
+db_name = "database.db"
+if os.path.exists(db_name) and os.path.getsize(db_name) > 0:
+    sqlite_file_name = db_name
+elif os.path.exists(f"../{db_name}") and os.path.getsize(f"../{db_name}") > 0:
+    sqlite_file_name = f"../{db_name}"
+else:
+    # Default fallback
+    sqlite_file_name = db_name
+
+print(f"Using database: {os.path.abspath(sqlite_file_name)}")
+sqlite_url = f"sqlite:///{sqlite_file_name}"
+
+engine = create_engine(sqlite_url)
+
+def migrate():
+    with Session(engine) as session:
+        try:
+            session.exec(text("ALTER TABLE settings ADD COLUMN poll_engine VARCHAR DEFAULT 'thread'"))
+            print("Added column poll_engine")
+        except Exception as e:
+            print(f"Column poll_engine might already exist: {e}")
+
+        try:
+            session.exec(text("ALTER TABLE settings ADD COLUMN poll_concurrency INTEGER DEFAULT 64"))
+            print("Added column poll_concurrency")
+        except Exception as e:
+            print(f"Column poll_concurrency might already exist: {e}")
+            
+        session.commit()
+
+if __name__ == "__main__":
+    migrate()
@@ -1,23 +1,34 @@
 from typing import Optional
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel
 from datetime import datetime
 
+POLL_ENGINE_THREAD = "thread"
+POLL_ENGINE_ASYNCIO = "asyncio"
+POLL_ENGINES = (POLL_ENGINE_THREAD, POLL_ENGINE_ASYNCIO)
+# Each in-flight host of the asyncio engine holds one SSH worker thread
+MAX_POLL_CONCURRENCY = 128
+
+SCHEDULE_MODE_BURST = "burst"
+SCHEDULE_MODE_STAGGERED = "staggered"
+SCHEDULE_MODES = (SCHEDULE_MODE_BURST, SCHEDULE_MODE_STAGGERED)
+
 class Machine(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    ip: str
+    ip: str = Field(unique=True, index=True)
     port: int = 22
     username: str
     password: str
     
     # 监控数据
-    status: str = "Unknown" # Online, Offline, Error
+    status: str = Field(default="Unknown", index=True) # Online, Offline, Error
     os_info: Optional[str] = None
-    arch: Optional[str] = None # x86_64, aarch64
+    arch: Optional[str] = Field(default=None, index=True) # x86_64, aarch64
     accelerator_type: Optional[str] = None # NVIDIA, Huawei, AMD, None
-    accelerator_count: int = 0
-    idle_count: int = 0
-    busy_count: int = 0
-    warning_count: int = 0
+    accelerator_count: int = Field(default=0, index=True)
+    idle_count: int = Field(default=0, index=True)
+    busy_count: int = Field(default=0, index=True)
+    warning_count: int = Field(default=0, index=True)
     accelerator_status: Optional[str] = None # JSON string or detailed text
     last_updated: Optional[datetime] = None
     error_message: Optional[str] = None
@@ -26,7 +37,20 @@ class Machine(SQLModel, table=True):
     ibmc_username: Optional[str] = None
     ibmc_password: Optional[str] = None
     is_own: bool = Field(default=False)
-    pci_topo_json: Optional[str] = None  # JSON string for PCIe topology
+    hw_fingerprint: Optional[str] = None  # 最近一次检测到的硬件指纹 (lspci 树 + 加速卡清单)
+    topo_fingerprint: Optional[str] = None  # 生成当前拓扑时的硬件指纹，保存拓扑后才会设置
+    poll_min_interval: Optional[int] = None  # 自适应轮询的最短间隔(秒)，为空使用默认值
+    poll_max_interval: Optional[int] = None  # 自适应轮询的最长间隔(秒)，为空使用默认值
+    stream_enabled: bool = Field(default=False)  # 是否通过常驻 SSH 通道流式采集加速卡状态
+    stream_interval: Optional[int] = None  # 流式采集的采样间隔(秒)，为空使用默认值
+
+class MachineTopology(SQLModel, table=True):
+    """PCIe topology of one machine, kept out of the machine row so list queries never load it."""
+    __tablename__ = "machine_topology"
+
+    machine_id: int = Field(primary_key=True)
+    pci_topo_json: str  # JSON string for PCIe topology
+    updated_at: Optional[datetime] = None
 
 class MachineUpdate(SQLModel):
     ip: Optional[str] = None
@@ -38,7 +62,95 @@ class MachineUpdate(SQLModel):
     ibmc_username: Optional[str] = None
     ibmc_password: Optional[str] = None
     is_own: Optional[bool] = None
+    poll_min_interval: Optional[int] = None
+    poll_max_interval: Optional[int] = None
+    stream_enabled: Optional[bool] = None
+    stream_interval: Optional[int] = None
 
 class Settings(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     interval_seconds: int = 60 # 默认60秒检测一次
+    poll_engine: str = POLL_ENGINE_THREAD # thread: 线程池轮询; asyncio: 异步高并发轮询
+    poll_concurrency: int = 64 # asyncio 引擎同时在途主机数，即 SSH 工作线程数，上限 MAX_POLL_CONCURRENCY
+    schedule_mode: str = SCHEDULE_MODE_BURST # burst: 每个周期集中轮询; staggered: 按哈希时间槽错峰轮询
+    ingest_token: Optional[str] = None # 推送代理上报 /ingest 使用的令牌，首次安装代理时生成
+
+class SettingsRead(SQLModel):
+    """Settings as returned by the API; ingest_token stays server-side and only reaches agents over SSH."""
+    id: Optional[int] = None
+    interval_seconds: int
+    poll_engine: str
+    poll_concurrency: int
+    schedule_mode: str
+
+class TelemetryChunk(SQLModel, table=True):
+    """A compressed columnar block of accelerator samples for one card."""
+    __tablename__ = "telemetry_chunk"
+    __table_args__ = (
+        Index("ix_telemetry_chunk_series", "machine_id", "card_id", "tier", "start_ts"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    machine_id: int = Field(index=True)
+    card_id: str
+    tier: int = Field(default=0, index=True) # 0: 原始采样, 1: 15 分钟聚合, 2: 1 小时聚合
+    start_ts: int
+    end_ts: int
+    count: int = 0
+    payload: bytes # zlib 压缩的列式数组
+
+class RefreshJob(SQLModel, table=True):
+    """A refresh queued through the API; stored so every instance can report it and restarts do not lose it."""
+    __tablename__ = "refresh_job"
+
+    id: str = Field(primary_key=True)
+    target: str = Field(index=True) # 去重键：机器 ID 或 all
+    machine_id: Optional[int] = None
+    force_topo: bool = False
+    state: str = Field(index=True) # queued, running, done, failed
+    owner: str # 执行任务的实例 instance_id
+    requests: int = 1
+    created_ts: float
+    started_ts: Optional[float] = None
+    finished_ts: Optional[float] = Field(default=None, index=True)
+    result: Optional[str] = None # 结果 JSON
+    error: Optional[str] = None
+
+class AgentPresence(SQLModel, table=True):
+    """The last report of a machine's push agent, shared so every instance skips SSH for it."""
+    __tablename__ = "agent_presence"
+
+    machine_id: int = Field(primary_key=True)
+    received_ts: float = Field(index=True) # 服务端收到上报的时间
+    report_ts: float # 代理采集时间，用于丢弃乱序的旧上报
+    interval: int # 代理上报间隔(秒)
+    agent_version: Optional[str] = None
+
+class ClusterMember(SQLModel, table=True):
+    """A running backend instance; instances with a recent heartbeat share the polling."""
+    __tablename__ = "cluster_member"
+
+    instance_id: str = Field(primary_key=True)
+    hostname: str
+    pid: int
+    started_ts: float
+    heartbeat_ts: float = Field(index=True)
+
+class ClusterLease(SQLModel, table=True):
+    """A named lease held by one instance until expires_ts, used for singleton jobs."""
+    __tablename__ = "cluster_lease"
+
+    name: str = Field(primary_key=True)
+    holder: str
+    expires_ts: float
+
+class MachineChange(SQLModel, table=True):
+    """Machine events of every instance, replayed into the in-memory views of the others."""
+    __tablename__ = "machine_change"
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    seq: Optional[int] = Field(default=None, primary_key=True)
+    origin: str # 发布事件的实例 instance_id
+    event_type: str
+    payload: str # 事件数据 JSON
+    created_ts: float = Field(index=True)
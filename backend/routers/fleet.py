@@ -0,0 +1,11 @@
+from fastapi import APIRouter, Request
+
+from services.fleet_summary import fleet_summary
+from services.json_response import json_response
+
+router = APIRouter(prefix="/fleet", tags=["fleet"])
+
+@router.get("/summary")
+def get_fleet_summary(request: Request):
+    """Machine and card totals overall and by accelerator type, arch, status and is_own."""
+    return json_response(request, fleet_summary.snapshot())
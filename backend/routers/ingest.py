@@ -0,0 +1,71 @@
+import gzip
+import hmac
+import io
+import json
+import zlib
+
+from fastapi import APIRouter, HTTPException, Request, Header
+from starlette.concurrency import run_in_threadpool
+
+from services.monitor_service import get_poll_settings
+from services.agent_service import ingest_reports, IngestError
+from services.agent_presence import agent_presence
+
+router = APIRouter(prefix="/ingest", tags=["ingest"])
+
+# Request bodies are rejected beyond this size, as sent and once inflated
+MAX_INGEST_BODY_BYTES = 64 * 1024 * 1024
+
+async def _read_body(request: Request, limit: int) -> bytes:
+    """Reads the body, stopping with 413 as soon as it exceeds `limit` bytes."""
+    too_large = HTTPException(status_code=413, detail="Report batch too large")
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > limit:
+        raise too_large
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise too_large
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+@router.post("")
+async def ingest(request: Request, x_agent_token: str = Header(None)):
+    """Batched reports pushed by machine agents (see backend/agent/monitor_agent.py)."""
+    token = get_poll_settings().ingest_token
+    if not token:
+        raise HTTPException(status_code=403, detail="Agent ingest is not enabled")
+    if not x_agent_token or not hmac.compare_digest(x_agent_token, token):
+        raise HTTPException(status_code=401, detail="Invalid agent token")
+
+    body = await _read_body(request, MAX_INGEST_BODY_BYTES)
+    if request.headers.get("content-encoding", "").lower() == "gzip":
+        try:
+            decompressor = gzip.GzipFile(fileobj=io.BytesIO(body))
+            body = decompressor.read(MAX_INGEST_BODY_BYTES + 1)
+        except (OSError, EOFError, zlib.error):
+            # Not gzip, truncated or corrupt
+            raise HTTPException(status_code=400, detail="Invalid gzip body")
+        if len(body) > MAX_INGEST_BODY_BYTES:
+            raise HTTPException(status_code=413, detail="Report batch too large")
+
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    reports = payload.get("reports") if isinstance(payload, dict) else payload
+
+    try:
+        results = await run_in_threadpool(ingest_reports, reports)
+    except IngestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    applied = sum(1 for r in results if r["result"] == "applied")
+    return {"received": len(results), "applied": applied, "results": results}
+
+@router.get("/agents")
+def list_agents():
+    """Machines that have pushed agent reports, from the shared agent_presence table (all instances, kept across restarts)."""
+    return agent_presence.snapshot()
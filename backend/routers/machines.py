@@ -1,29 +1,93 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Header, Response, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlmodel import Session, select, func
+from sqlalchemy.exc import IntegrityError
 from typing import List
 import threading
 
 from database import get_session, engine
-from models import Machine, MachineUpdate
-from services.monitor_service import check_machine, update_single_machine_sync, update_all_machines, create_ssh_client, execute_command
-from services.topo_service import trigger_topo_update_async, update_all_machines_topo
-import json
+from models import Machine, MachineTopology, MachineUpdate
+from services.monitor_service import check_new_machines, ssh_pool, MONITOR_COMMAND, MONITOR_SECTION_DELIM
+from services.topo_service import trigger_topo_update_async, TOPO_PRIORITY_USER
+from services.telemetry_store import telemetry_store, RESOLUTION_TIERS
+from services.machine_events import machine_events, machine_event_payload, sse_event_stream
+from services.adaptive_interval import adaptive_intervals
+from services.bulk_import import parse_import_payload, import_machines, BulkImportError
+from services.agent_service import install_agent, uninstall_agent
+from services.agent_presence import agent_presence
+from services.stream_collector import stream_collector
+from services.poll_timing import poll_timings
+from services.refresh_jobs import refresh_jobs
+from services.machine_search import search_condition, encode_cursor, decode_cursor, machine_count_cache
+from services.json_response import json_response
+from services.fleet_snapshot import fleet_snapshot
 
 router = APIRouter(prefix="/machines", tags=["machines"])
 
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: proxies may add or strip the W/ prefix
+    bare = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == bare:
+            return True
+    return False
+
+def _validator_headers(etag: str) -> dict:
+    # Cache, but revalidate every time so the browser sends If-None-Match
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=_validator_headers(etag))
+
+@router.get("/stream")
+def stream_machine_events(last_event_id: str = Header(None)):
+    """Server-sent events with per-machine deltas committed by the poller and write endpoints."""
+    return StreamingResponse(
+        sse_event_stream(last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _topo_etag(machine_id: int, updated_at) -> str:
+    # Derived from the stored row, so tags survive restarts and agree between instances
+    stamp = int(updated_at.timestamp() * 1_000_000) if updated_at else 0
+    return f'W/"topo-{machine_id}-{stamp}"'
+
 @router.get("/{machine_id}/topo")
-def get_machine_topo(machine_id: int, session: Session = Depends(get_session)):
-    machine = session.get(Machine, machine_id)
-    if not machine:
+def get_machine_topo(
+    machine_id: int,
+    request: Request,
+    if_none_match: str = Header(None),
+    session: Session = Depends(get_session)
+):
+    if not session.get(Machine, machine_id):
         raise HTTPException(status_code=404, detail="Machine not found")
-    
-    if not machine.pci_topo_json:
+
+    # Check the timestamp alone first, so a 304 never loads the topology itself
+    if if_none_match:
+        stored = session.exec(
+            select(MachineTopology.machine_id, MachineTopology.updated_at).where(MachineTopology.machine_id == machine_id)
+        ).first()
+        if stored:
+            etag = _topo_etag(machine_id, stored.updated_at)
+            if _etag_matches(if_none_match, etag):
+                return _not_modified(etag)
+
+    topology = session.get(MachineTopology, machine_id)
+    if not topology:
         return {"error": "Topology not available yet"}
-        
-    try:
-        return json.loads(machine.pci_topo_json)
-    except json.JSONDecodeError:
-        return {"error": "Invalid topology data"}
+
+    # Stored as serialized JSON by the topo job; sent without decoding
+    etag = _topo_etag(machine_id, topology.updated_at)
+    return json_response(request, body=topology.pci_topo_json.encode("utf-8"), headers=_validator_headers(etag))
 
 @router.post("/{machine_id}/topo/refresh")
 def refresh_machine_topo(machine_id: int, session: Session = Depends(get_session)):
@@ -34,28 +98,48 @@ def refresh_machine_topo(machine_id: int, session: Session = Depends(get_session
     if machine.status != "Online":
         raise HTTPException(status_code=400, detail="Machine is not online")
     
-    trigger_topo_update_async(machine.id)
-    return {"message": "Topology refresh triggered"}
+    # Explicit user request: regenerate even if the hardware fingerprint is unchanged
+    state = trigger_topo_update_async(machine.id, force=True, priority=TOPO_PRIORITY_USER)
+    return {"message": "Topology refresh triggered", "state": state}
 
-@router.get("")
-def read_machines(
-    page: int = Query(1, ge=1),
-    size: int = Query(10, ge=1),
-    search: str = Query(None),
-    arch: str = Query(None),
-    status: str = Query(None),
-    acc_type: str = Query(None),
+@router.get("/{machine_id}/history")
+def get_machine_history(
+    machine_id: int,
+    card: str = Query(None),
+    start: int = Query(None, description="Unix timestamp, defaults to one hour before end"),
+    end: int = Query(None, description="Unix timestamp, defaults to now"),
+    resolution: str = Query(None, description="raw, 15m or 1h; chosen from the range if omitted"),
     session: Session = Depends(get_session)
 ):
-    # Base statement
-    statement = select(Machine)
+    machine = session.get(Machine, machine_id)
+    if not machine:
+        raise HTTPException(status_code=404, detail="Machine not found")
+    if resolution and resolution not in RESOLUTION_TIERS:
+        raise HTTPException(status_code=400, detail=f"Unsupported resolution: {resolution}")
+
+    return telemetry_store.query(machine_id, card_id=card, start_ts=start, end_ts=end, resolution=resolution)
+
+def _projection_names(fields: str) -> list:
+    """Machine columns named in a `fields=` list; id and ip are always included."""
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in Machine.__table__.columns]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    # id keys rows in the dashboard and ip is the pagination key
+    return list(dict.fromkeys(["id", "ip", *names]))
+
+def _query_machines_db(names, search, arch, status, acc_type, offset, size, after_ip) -> tuple:
+    """(total, items) straight from SQLite, used while the fleet snapshot is not loaded.
+
+    A deliberate fallback for startup and for a snapshot load that failed: the
+    FTS search index, the ip index walked by cursors and machine_count_cache
+    serve this path, and tests keep its pages equal to the snapshot's.
+    """
+    columns = Machine.__table__.columns
+    statement = select(*(columns[name] for name in names)) if names else select(Machine)
     
     if search:
-        statement = statement.where(
-            (Machine.ip.contains(search)) | 
-            (Machine.username.contains(search)) |
-            (Machine.accelerator_type.contains(search))
-        )
+        statement = statement.where(search_condition(search))
     
     if arch:
         statement = statement.where(Machine.arch == arch)
@@ -73,35 +157,111 @@ def read_machines(
         elif acc_type == "Warning":
             statement = statement.where(Machine.warning_count > 0)
     
-    # Get total count with filter
-    total_statement = select(func.count()).select_from(statement.subquery())
-    total = session.exec(total_statement).one()
-    
-    # Get paginated results
-    statement = statement.order_by(Machine.ip).offset((page - 1) * size).limit(size)
-    machines = session.exec(statement).all()
+    with Session(engine) as session:
+        # Total for the filter, reused until a filtered field changes
+        count_key = (search, arch, status, acc_type)
+        generation = machine_count_cache.generation
+        total = machine_count_cache.get(count_key)
+        if total is None:
+            total_statement = select(func.count()).select_from(statement.subquery())
+            total = session.exec(total_statement).one()
+            machine_count_cache.put(count_key, generation, total)
+        
+        # Keyset pagination walks the ip index instead of skipping `offset` rows
+        statement = statement.order_by(Machine.ip)
+        if after_ip is not None:
+            statement = statement.where(Machine.ip > after_ip)
+        else:
+            statement = statement.offset(offset)
+        machines = session.exec(statement.limit(size)).all()
+    return total, [dict(row._mapping) for row in machines] if names else machines
+
+@router.get("")
+def read_machines(
+    request: Request,
+    page: int = Query(1, ge=1),
+    size: int = Query(10, ge=1),
+    cursor: str = Query(None, description="next_cursor of the previous page; replaces page for deep scrolling"),
+    fields: str = Query(None, description="Comma-separated columns to return, e.g. id,ip,status; all columns if omitted"),
+    search: str = Query(None),
+    arch: str = Query(None),
+    status: str = Query(None),
+    acc_type: str = Query(None),
+    if_none_match: str = Header(None),
+):
+    """Served from the in-memory fleet snapshot; SQLite is queried while it is not loaded (see _query_machines_db)."""
+    from_snapshot = fleet_snapshot.loaded
+    # The tag covers the whole fleet; the URL already keys the query parameters.
+    # Read the version before querying so a concurrent write can only make the tag stale.
+    version = fleet_snapshot.version if from_snapshot else machine_events.version
+    etag = f'W/"machines-{machine_events.epoch}-{"s" if from_snapshot else "d"}{version}"'
+    if _etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+
+    after_ip = None
+    if cursor:
+        try:
+            after_ip = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    names = _projection_names(fields) if fields else None
+    offset = (page - 1) * size
+
+    if from_snapshot:
+        version, total, items = fleet_snapshot.query(search, arch, status, acc_type, offset, size, after_ip, names)
+        etag = f'W/"machines-{machine_events.epoch}-s{version}"'
+    else:
+        total, items = _query_machines_db(names, search, arch, status, acc_type, offset, size, after_ip)
     
-    return {
-        "items": machines,
+    last_ip = (items[-1]["ip"] if isinstance(items[-1], dict) else items[-1].ip) if items else None
+    return json_response(request, {
+        "items": items,
         "total": total,
         "page": page,
-        "size": size
-    }
+        "size": size,
+        "next_cursor": encode_cursor(last_ip) if len(items) == size else None,
+        "version": version
+    }, headers=_validator_headers(etag))
 
 @router.post("", response_model=Machine)
 def create_machine(machine: Machine, session: Session = Depends(get_session)):
-    # Check for duplicate IP
-    existing = session.exec(select(Machine).where(Machine.ip == machine.ip)).first()
-    if existing:
-        raise HTTPException(status_code=400, detail="该 IP 已存在")
-    
     session.add(machine)
-    session.commit()
+    try:
+        session.commit()
+    except IntegrityError:
+        # Duplicate IP rejected by the unique index
+        session.rollback()
+        raise HTTPException(status_code=400, detail="该 IP 已存在")
     session.refresh(machine)
-    # Trigger a check in background or immediately? Let's do immediately for better UX
-    threading.Thread(target=lambda: update_single_machine_sync(machine.id)).start()
+    machine_events.publish("created", machine_event_payload(machine))
+    if machine.stream_enabled:
+        stream_collector.sync()
+    # Check it right away through the refresh queue
+    refresh_jobs.submit_machine(machine.id)
     return machine
 
+@router.post("/bulk")
+async def bulk_import_machines(request: Request):
+    """Imports machines from a CSV file or JSON array in one transaction.
+
+    Returns a per-row report; initial checks run in the background through the poller.
+    """
+    body = await request.body()
+    try:
+        rows = parse_import_payload(body, request.headers.get("content-type", ""))
+        report, created_ids = await run_in_threadpool(import_machines, rows)
+    except BulkImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if created_ids:
+        # One background cycle for the whole batch, bounded by the poll engine's concurrency
+        threading.Thread(target=check_new_machines, args=(created_ids,), daemon=True).start()
+
+    summary = {}
+    for entry in report:
+        summary[entry["result"]] = summary.get(entry["result"], 0) + 1
+    return {"total": len(report), "summary": summary, "rows": report}
+
 @router.put("/{machine_id}", response_model=Machine)
 def update_machine(machine_id: int, machine_update: MachineUpdate, session: Session = Depends(get_session)):
     db_machine = session.get(Machine, machine_id)
@@ -109,12 +269,32 @@ def update_machine(machine_id: int, machine_update: MachineUpdate, session: Sess
         raise HTTPException(status_code=404, detail="Machine not found")
     
     machine_data = machine_update.model_dump(exclude_unset=True)
+    # Credentials may change, drop the connection pooled under the old fingerprint
+    ssh_pool.discard(db_machine)
     for key, value in machine_data.items():
         setattr(db_machine, key, value)
+
+    for key in ("poll_min_interval", "poll_max_interval"):
+        value = getattr(db_machine, key)
+        if value is not None and value < 1:
+            raise HTTPException(status_code=400, detail=f"{key} must be at least 1 second")
+    if db_machine.poll_min_interval and db_machine.poll_max_interval and db_machine.poll_min_interval > db_machine.poll_max_interval:
+        raise HTTPException(status_code=400, detail="poll_min_interval must not exceed poll_max_interval")
+    if db_machine.stream_interval is not None and db_machine.stream_interval < 1:
+        raise HTTPException(status_code=400, detail="stream_interval must be at least 1 second")
+    # Edited hosts (new address, credentials or bounds) are retried at the normal cadence
+    adaptive_intervals.forget(machine_id)
         
     session.add(db_machine)
-    session.commit()
+    try:
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+        raise HTTPException(status_code=400, detail="该 IP 已存在")
     session.refresh(db_machine)
+    machine_events.publish("machine", machine_event_payload(db_machine))
+    # Start, restart (new credentials or interval) or stop its streaming session
+    stream_collector.sync()
     return db_machine
 
 @router.delete("/{machine_id}")
@@ -122,34 +302,62 @@ def delete_machine(machine_id: int, session: Session = Depends(get_session)):
     machine = session.get(Machine, machine_id)
     if not machine:
         raise HTTPException(status_code=404, detail="Machine not found")
+    ssh_pool.discard(machine)
+    topology = session.get(MachineTopology, machine_id)
+    if topology:
+        session.delete(topology)
     session.delete(machine)
     session.commit()
+    telemetry_store.drop_machine(machine_id)
+    adaptive_intervals.forget(machine_id)
+    agent_presence.forget(machine_id)
+    poll_timings.forget(machine_id)
+    stream_collector.sync()
+    machine_events.publish("deleted", {"id": machine_id})
     return {"ok": True}
 
-@router.post("/{machine_id}/refresh")
-def refresh_machine(machine_id: int, session: Session = Depends(get_session)):
+@router.post("/{machine_id}/refresh", status_code=202)
+def refresh_machine(machine_id: int, force_topo: bool = Query(False), session: Session = Depends(get_session)):
+    """Queues a check of one machine; repeated requests while it is pending share the job."""
     machine = session.get(Machine, machine_id)
     if not machine:
         raise HTTPException(status_code=404, detail="Machine not found")
-    
-    # Run check synchronously for manual refresh
-    check_machine(machine)
-    session.add(machine)
-    session.commit()
-    session.refresh(machine)
-    
-    # Always trigger topo update when manually refreshing
-    if machine.status == "Online":
-        trigger_topo_update_async(machine.id)
-        
-    return machine
+    job, coalesced = refresh_jobs.submit_machine(machine_id, force_topo)
+    return {**job, "coalesced": coalesced}
 
-@router.post("/refresh_all")
-def refresh_all_machines_endpoint(session: Session = Depends(get_session)):
-    update_all_machines()
-    # Always trigger global topo update when manually refreshing all
-    threading.Thread(target=update_all_machines_topo).start()
-    return {"message": "All machines updated and topo update triggered"}
+@router.post("/{machine_id}/agent/install")
+def install_machine_agent(machine_id: int, request: Request, server_url: str = Query(None), session: Session = Depends(get_session)):
+    """Installs the push agent; server_url defaults to the address this request came in on."""
+    machine = session.get(Machine, machine_id)
+    if not machine:
+        raise HTTPException(status_code=404, detail="Machine not found")
+    result = install_agent(machine, (server_url or str(request.base_url)).rstrip("/"))
+    if not result["ok"]:
+        raise HTTPException(status_code=502, detail=result["message"])
+    return result
+
+@router.post("/{machine_id}/agent/uninstall")
+def uninstall_machine_agent(machine_id: int, session: Session = Depends(get_session)):
+    machine = session.get(Machine, machine_id)
+    if not machine:
+        raise HTTPException(status_code=404, detail="Machine not found")
+    result = uninstall_agent(machine)
+    if not result["ok"]:
+        raise HTTPException(status_code=502, detail=result["message"])
+    return result
+
+@router.post("/refresh_all", status_code=202)
+def refresh_all_machines_endpoint(force_topo: bool = Query(False)):
+    """Queues a fleet-wide poll followed by a topo update; only one runs at a time."""
+    job, coalesced = refresh_jobs.submit_all(force_topo)
+    return {**job, "coalesced": coalesced}
+
+@router.get("/jobs/{job_id}")
+def get_refresh_job(job_id: str):
+    job = refresh_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 @router.get("/{machine_id}/raw_monitor")
 def get_raw_monitor(machine_id: int, session: Session = Depends(get_session)):
@@ -158,54 +366,47 @@ def get_raw_monitor(machine_id: int, session: Session = Depends(get_session)):
         raise HTTPException(status_code=404, detail="Machine not found")
     
     # Run the same command as check_machine to get raw output
-    client = create_ssh_client(machine.ip, machine.port, machine.username, machine.password)
-    if not client:
-        return {"output": "Connection failed"}
-        
-    try:
-        # Use the same combined command as check_machine
-        DELIM = "|||SECTION|||"
-        
-        cmd = (
-            f"uname -m; echo '{DELIM}';"
-            f"(grep PRETTY_NAME /etc/os-release | cut -d'=' -f2 | tr -d '\"') || uname -sr; echo '{DELIM}';"
-            f"nvidia-smi --query-gpu=index,name,memory.total,memory.used,temperature.gpu --format=csv,noheader 2>/dev/null || echo 'NVIDIA_NOT_FOUND'; echo '{DELIM}';"
-            f"npu-smi info 2>/dev/null || echo 'HUAWEI_NOT_FOUND'"
-        )
-        
-        stdout, stderr = execute_command(client, cmd)
-        
-        # Format the output for better readability
-        parts = stdout.split(DELIM)
-        
-        formatted_output = f"=== System Info ===\n"
-        if len(parts) > 0:
-            formatted_output += f"Arch: {parts[0].strip()}\n"
-        if len(parts) > 1:
-            formatted_output += f"OS: {parts[1].strip()}\n"
+    with ssh_pool.lease(machine) as conn:
+        if not conn.client:
+            return {"output": "Connection failed"}
+
+        try:
+            stdout, stderr = conn.execute(MONITOR_COMMAND)
             
-        formatted_output += f"\n=== NVIDIA GPU Status ===\n"
-        if len(parts) > 2:
-            nvidia_out = parts[2].strip()
-            if nvidia_out == "NVIDIA_NOT_FOUND":
-                formatted_output += "No NVIDIA GPU found or nvidia-smi not available.\n"
-            else:
-                formatted_output += nvidia_out + "\n"
+            # Format the output for better readability
+            parts = stdout.split(MONITOR_SECTION_DELIM)
+            
+            formatted_output = f"=== System Info ===\n"
+            if len(parts) > 0:
+                formatted_output += f"Arch: {parts[0].strip()}\n"
+            if len(parts) > 1:
+                formatted_output += f"OS: {parts[1].strip()}\n"
                 
-        formatted_output += f"\n=== Huawei NPU Status ===\n"
-        if len(parts) > 3:
-            npu_out = parts[3].strip()
-            if npu_out == "HUAWEI_NOT_FOUND":
-                formatted_output += "No Huawei NPU found or npu-smi not available.\n"
-            else:
-                formatted_output += npu_out + "\n"
-
-        if stderr:
-             formatted_output += f"\n=== STDERR ===\n{stderr}\n"
-             
-        return {"output": formatted_output}
-        
-    except Exception as e:
-        return {"output": f"Error executing command: {e}"}
-    finally:
-        client.close()
+            formatted_output += f"\n=== NVIDIA GPU Status ===\n"
+            if len(parts) > 2:
+                nvidia_out = parts[2].strip()
+                if nvidia_out == "NVIDIA_NOT_FOUND":
+                    formatted_output += "No NVIDIA GPU found or nvidia-smi not available.\n"
+                else:
+                    formatted_output += nvidia_out + "\n"
+                    
+            formatted_output += f"\n=== Huawei NPU Status ===\n"
+            if len(parts) > 3:
+                npu_out = parts[3].strip()
+                if npu_out == "HUAWEI_NOT_FOUND":
+                    formatted_output += "No Huawei NPU found or npu-smi not available.\n"
+                else:
+                    formatted_output += npu_out + "\n"
+
+            if len(parts) > 4:
+                formatted_output += f"\n=== Hardware Fingerprint ===\n"
+                formatted_output += f"PCI tree digest: {parts[4].strip()}\n"
+                formatted_output += f"Recorded fingerprint: {machine.hw_fingerprint or 'N/A'}\n"
+
+            if stderr:
+                 formatted_output += f"\n=== STDERR ===\n{stderr}\n"
+                 
+            return {"output": formatted_output}
+            
+        except Exception as e:
+            return {"output": f"Error executing command: {e}"}
@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Request, Response
+
+from services.metrics_exporter import metrics_exporter, PROMETHEUS_CONTENT_TYPE
+
+router = APIRouter(tags=["metrics"])
+
+@router.get("/metrics")
+def get_metrics(request: Request):
+    """Prometheus scrape endpoint, served from the exporter's in-memory rendering."""
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        return Response(
+            content=metrics_exporter.render(gzipped=True),
+            media_type=PROMETHEUS_CONTENT_TYPE,
+            headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"},
+        )
+    return Response(content=metrics_exporter.render(), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -1,32 +1,84 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlmodel import Session, select
 from database import get_session
-from models import Settings
-from services.monitor_service import update_all_machines
-from scheduler import scheduler
+from models import Settings, SettingsRead, POLL_ENGINES, SCHEDULE_MODES, MAX_POLL_CONCURRENCY
+from services.poll_scheduler import apply_poll_schedule, staggered_poll_scheduler
+from services.stream_collector import stream_collector
+from services.poll_timing import poll_timings
+from services.topo_service import topo_scheduler
+from services.cluster import cluster
+from services.change_feed import change_feed
 
 router = APIRouter(prefix="/settings", tags=["settings"])
 
-@router.get("", response_model=Settings)
+@router.get("", response_model=SettingsRead)
 def get_settings(session: Session = Depends(get_session)):
     settings = session.exec(select(Settings)).first()
     return settings
 
-@router.post("", response_model=Settings)
+@router.post("", response_model=SettingsRead)
 def update_settings(new_settings: Settings, session: Session = Depends(get_session)):
     settings = session.exec(select(Settings)).first()
     if not settings:
         settings = Settings()
     
     settings.interval_seconds = new_settings.interval_seconds
+    if "poll_engine" in new_settings.model_fields_set:
+        if new_settings.poll_engine not in POLL_ENGINES:
+            raise HTTPException(status_code=400, detail=f"Unsupported poll engine: {new_settings.poll_engine}")
+        settings.poll_engine = new_settings.poll_engine
+    if "poll_concurrency" in new_settings.model_fields_set:
+        if not 1 <= new_settings.poll_concurrency <= MAX_POLL_CONCURRENCY:
+            raise HTTPException(
+                status_code=400,
+                detail=f"poll_concurrency must be between 1 and {MAX_POLL_CONCURRENCY} (one SSH worker thread each)",
+            )
+        settings.poll_concurrency = new_settings.poll_concurrency
+    if "schedule_mode" in new_settings.model_fields_set:
+        if new_settings.schedule_mode not in SCHEDULE_MODES:
+            raise HTTPException(status_code=400, detail=f"Unsupported schedule mode: {new_settings.schedule_mode}")
+        settings.schedule_mode = new_settings.schedule_mode
     session.add(settings)
     session.commit()
     session.refresh(settings)
     
     # Reschedule job
-    try:
-        scheduler.reschedule_job('monitor_job', trigger='interval', seconds=settings.interval_seconds)
-    except:
-        scheduler.add_job(update_all_machines, 'interval', seconds=settings.interval_seconds, id='monitor_job')
+    apply_poll_schedule(settings)
         
     return settings
+
+@router.get("/schedule_status")
+def get_schedule_status(session: Session = Depends(get_session)):
+    """Staggered scheduler state and the lag of the last completed cycle."""
+    settings = session.exec(select(Settings)).first() or Settings()
+    return {"schedule_mode": settings.schedule_mode, **staggered_poll_scheduler.stats()}
+
+@router.get("/stream_status")
+def get_stream_status():
+    """Streaming collection sessions and how many records were written or superseded."""
+    return stream_collector.stats()
+
+@router.get("/topo_queue_status")
+def get_topo_queue_status():
+    """Topology jobs queued per priority and the ones running now."""
+    return topo_scheduler.stats()
+
+@router.get("/cluster_status")
+def get_cluster_status():
+    """Instances sharing the polling, which one is leader, and the change feed between them."""
+    return {**cluster.stats(), "change_feed": change_feed.stats()}
+
+@router.get("/diagnostics/latency")
+def get_latency_diagnostics(slowest: int = Query(10, ge=1, le=1000)):
+    """Poll pipeline latency per phase (p50/p95/p99) and the slowest hosts of their latest poll."""
+    return poll_timings.report(slowest)
+
+@router.put("/diagnostics/latency")
+def set_latency_diagnostics(enabled: bool = Query(...)):
+    poll_timings.enabled = enabled
+    return {"enabled": poll_timings.enabled}
+
+@router.delete("/diagnostics/latency")
+def reset_latency_diagnostics():
+    poll_timings.reset()
+    return {"ok": True}
@@ -0,0 +1,92 @@
+import threading
+import time
+
+from models import Machine
+
+# Defaults when a machine sets no bounds of its own
+DEFAULT_MIN_INTERVAL_SECONDS = 15
+DEFAULT_MAX_INTERVAL_SECONDS = 1800
+
+# Hosts whose busy/idle counts changed within this window are sampled at the minimum interval
+ACTIVITY_WINDOW_SECONDS = 300
+MAX_BACKOFF_EXPONENT = 16
+
+class AdaptiveIntervals:
+    """Per-machine poll intervals derived from recent poll results.
+
+    Unreachable hosts back off exponentially from the global interval (the first
+    failure keeps the normal cadence, so a single blip costs nothing). Hosts whose
+    accelerator busy/idle counts changed recently are polled at their minimum
+    interval. Everything is clamped to the machine's own min/max when set.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {}
+
+    def observe(self, machine: Machine, polled_ts: float = None):
+        """Records the outcome of a finished poll."""
+        if machine.id is None:
+            return
+        polled_ts = polled_ts or time.time()
+        counts = (machine.busy_count, machine.idle_count)
+        with self._lock:
+            state = self._state.setdefault(machine.id, {
+                "failures": 0,
+                "counts": None,
+                "last_activity_ts": 0.0,
+            })
+            state["last_poll_ts"] = polled_ts
+            if machine.status == "Offline":
+                state["failures"] += 1
+                return
+            state["failures"] = 0
+            if state["counts"] is not None and counts != state["counts"]:
+                state["last_activity_ts"] = polled_ts
+            state["counts"] = counts
+
+    def effective_interval(self, machine: Machine, base_interval: float, now: float = None) -> float:
+        now = now or time.time()
+        low = machine.poll_min_interval or min(base_interval, DEFAULT_MIN_INTERVAL_SECONDS)
+        high = machine.poll_max_interval or max(base_interval, DEFAULT_MAX_INTERVAL_SECONDS)
+        low = min(low, high)
+
+        with self._lock:
+            state = self._state.get(machine.id)
+            failures = state["failures"] if state else 0
+            active = bool(state) and now - state["last_activity_ts"] < ACTIVITY_WINDOW_SECONDS
+
+        if failures > 1:
+            interval = base_interval * (2 ** min(failures - 1, MAX_BACKOFF_EXPONENT))
+        elif active:
+            interval = low
+        else:
+            interval = base_interval
+        return max(low, min(interval, high))
+
+    def next_poll_ts(self, machine: Machine, base_interval: float, now: float = None):
+        """When the machine should next be polled, or None if it was never polled."""
+        with self._lock:
+            state = self._state.get(machine.id)
+            last_poll_ts = state.get("last_poll_ts") if state else None
+        if last_poll_ts is None:
+            return None
+        return last_poll_ts + self.effective_interval(machine, base_interval, now)
+
+    def is_due(self, machine: Machine, base_interval: float, now: float = None, slack: float = 0) -> bool:
+        now = now or time.time()
+        next_ts = self.next_poll_ts(machine, base_interval, now)
+        return next_ts is None or next_ts <= now + slack
+
+    def forget(self, machine_id: int):
+        with self._lock:
+            self._state.pop(machine_id, None)
+
+    def stats(self, now: float = None) -> dict:
+        now = now or time.time()
+        with self._lock:
+            backed_off = sum(1 for s in self._state.values() if s["failures"] > 1)
+            active = sum(1 for s in self._state.values() if now - s["last_activity_ts"] < ACTIVITY_WINDOW_SECONDS)
+        return {"backed_off": backed_off, "active": active}
+
+adaptive_intervals = AdaptiveIntervals()
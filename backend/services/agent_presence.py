@@ -0,0 +1,114 @@
+import time
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert
+
+from models import AgentPresence as AgentPresenceRow
+from database import engine
+
+# An agent counts as alive while its last report is younger than this many report intervals
+AGENT_STALE_INTERVALS = 3
+AGENT_MIN_STALE_SECONDS = 30
+QUERY_CHUNK = 500
+
+def _stale_after(interval: int) -> float:
+    return max(interval * AGENT_STALE_INTERVALS, AGENT_MIN_STALE_SECONDS)
+
+class AgentPresence:
+    """Tracks machines that push reports through an agent, so SSH polling can skip them.
+
+    Stored in the agent_presence table, so a report received by any instance
+    stops every instance from pulling that machine over SSH, and restarts keep it.
+    """
+
+    def __init__(self):
+        self._table = AgentPresenceRow.__table__
+
+    def mark(self, machine_id: int, report_ts: float, interval: int, agent_version: str = None):
+        with engine.begin() as conn:
+            self.write(conn, [self.entry(machine_id, report_ts, interval, agent_version)])
+
+    @staticmethod
+    def entry(machine_id: int, report_ts: float, interval: int, agent_version: str = None) -> dict:
+        """One row for `write`, stamped with the time the report was received."""
+        return {
+            "machine_id": machine_id,
+            "received_ts": time.time(),
+            "report_ts": report_ts,
+            "interval": interval,
+            "agent_version": agent_version,
+        }
+
+    def write(self, conn, entries):
+        """Upserts `entry` rows in one executemany on the caller's transaction."""
+        if not entries:
+            return
+        table = self._table
+        statement = insert(table)
+        conn.execute(
+            statement.on_conflict_do_update(
+                index_elements=["machine_id"],
+                set_={name: statement.excluded[name] for name in ("received_ts", "report_ts", "interval", "agent_version")},
+                # Another instance may have stored a newer report of the same agent meanwhile
+                where=table.c.report_ts < statement.excluded.report_ts,
+            ),
+            list(entries),
+        )
+
+    def last_report_ts(self, machine_id: int):
+        return self.last_report_ts_many([machine_id]).get(machine_id)
+
+    def last_report_ts_many(self, machine_ids) -> dict:
+        """machine_id -> report_ts of the last stored report, in one query per chunk."""
+        table = self._table
+        machine_ids = list(machine_ids)
+        result = {}
+        with engine.connect() as conn:
+            # Chunked to stay under SQLite's bound parameter limit
+            for i in range(0, len(machine_ids), QUERY_CHUNK):
+                chunk = machine_ids[i:i + QUERY_CHUNK]
+                result.update(conn.execute(
+                    select(table.c.machine_id, table.c.report_ts).where(table.c.machine_id.in_(chunk))
+                ).all())
+        return result
+
+    def _fresh_clause(self, now: float):
+        table = self._table
+        stale_after = func.max(table.c.interval * AGENT_STALE_INTERVALS, AGENT_MIN_STALE_SECONDS)
+        return table.c.received_ts >= now - stale_after
+
+    def is_fresh(self, machine_id: int, now: float = None) -> bool:
+        now = now or time.time()
+        table = self._table
+        with engine.connect() as conn:
+            return conn.execute(
+                select(table.c.machine_id).where(table.c.machine_id == machine_id).where(self._fresh_clause(now))
+            ).first() is not None
+
+    def fresh_ids(self, now: float = None) -> set:
+        """Ids of all machines whose agent reported recently, in one query."""
+        now = now or time.time()
+        table = self._table
+        with engine.connect() as conn:
+            return set(conn.execute(select(table.c.machine_id).where(self._fresh_clause(now))).scalars())
+
+    def forget(self, machine_id: int):
+        with engine.begin() as conn:
+            conn.execute(delete(self._table).where(self._table.c.machine_id == machine_id))
+
+    def snapshot(self) -> list:
+        now = time.time()
+        with engine.connect() as conn:
+            rows = conn.execute(select(self._table).order_by(self._table.c.machine_id)).all()
+        return [
+            {
+                "machine_id": row.machine_id,
+                "agent_version": row.agent_version,
+                "interval": row.interval,
+                "last_report_age_seconds": round(now - row.received_ts, 1),
+                "fresh": now - row.received_ts <= _stale_after(row.interval),
+            }
+            for row in rows
+        ]
+
+agent_presence = AgentPresence()
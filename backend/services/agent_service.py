@@ -0,0 +1,211 @@
+import hashlib
+import json
+import secrets
+import shlex
+import time
+from datetime import datetime
+from pathlib import Path
+
+from sqlmodel import Session, select
+
+from models import Machine, Settings
+from logger import logger
+from database import engine
+from services.monitor_service import (
+    ssh_pool,
+    apply_monitor_sections,
+    get_poll_settings,
+    MONITOR_COMMAND,
+    MONITOR_SECTION_DELIM,
+)
+from services.result_writer import MachineResultWriter, capture_monitor_fields
+from services.adaptive_interval import adaptive_intervals
+from services.telemetry_store import telemetry_store
+from services.agent_presence import agent_presence
+from services.ssh_pool import SSHConnectionLost
+
+AGENT_SCRIPT_PATH = Path(__file__).parent.parent / "agent" / "monitor_agent.py"
+
+# Relative to the SSH user's home directory, so no root access is needed
+REMOTE_AGENT_DIR = ".gpu_monitor_agent"
+# Stops a running agent and starts a detached one; also used as the @reboot crontab entry
+AGENT_START_COMMAND = (
+    f"cd ~/{REMOTE_AGENT_DIR} || exit 1; "
+    "test -f agent.pid && kill $(cat agent.pid) 2>/dev/null; "
+    "nohup python3 monitor_agent.py --config agent.json >> agent.log 2>&1 < /dev/null & "
+    "echo $! > agent.pid"
+)
+
+MAX_INGEST_REPORTS = 2000
+MAX_SECTION_BYTES = 256 * 1024
+MACHINE_QUERY_CHUNK = 500
+
+class IngestError(ValueError):
+    """The ingest payload as a whole is invalid."""
+
+def ensure_ingest_token() -> str:
+    with Session(engine) as session:
+        settings = session.exec(select(Settings)).first()
+        if not settings:
+            settings = Settings()
+        if not settings.ingest_token:
+            settings.ingest_token = secrets.token_urlsafe(32)
+            session.add(settings)
+            session.commit()
+            logger.info("Generated agent ingest token")
+        return settings.ingest_token
+
+def install_agent(machine: Machine, server_url: str) -> dict:
+    """Uploads the agent to a reachable machine over SSH and (re)starts it."""
+    script = AGENT_SCRIPT_PATH.read_bytes()
+    version = hashlib.sha256(script).hexdigest()[:16]
+    settings = get_poll_settings()
+    config = {
+        "server_url": server_url,
+        "token": ensure_ingest_token(),
+        "ip": machine.ip,
+        "interval_seconds": max(1, settings.interval_seconds),
+        "command": MONITOR_COMMAND,
+        "delimiter": MONITOR_SECTION_DELIM,
+    }
+
+    with ssh_pool.lease(machine) as conn:
+        if not conn.client:
+            return {"ok": False, "message": f"SSH connection failed: {conn.error_message}"}
+
+        try:
+            stdout, _ = conn.execute("command -v python3")
+            if not stdout:
+                return {"ok": False, "message": "python3 not found on the machine"}
+
+            conn.execute(f"mkdir -p ~/{REMOTE_AGENT_DIR} && chmod 700 ~/{REMOTE_AGENT_DIR}")
+            sftp = conn.open_sftp()
+            try:
+                with sftp.file(f"{REMOTE_AGENT_DIR}/monitor_agent.py", "wb") as f:
+                    f.write(script)
+                with sftp.file(f"{REMOTE_AGENT_DIR}/agent.json", "wb") as f:
+                    f.write(json.dumps(config, ensure_ascii=False, indent=2).encode("utf-8"))
+                sftp.chmod(f"{REMOTE_AGENT_DIR}/agent.json", 0o600)
+            finally:
+                sftp.close()
+
+            # Restart, and start again after reboots via the user's crontab
+            conn.execute(AGENT_START_COMMAND)
+            reboot_entry = f"@reboot {AGENT_START_COMMAND}"
+            conn.execute(
+                f"(crontab -l 2>/dev/null | grep -v {REMOTE_AGENT_DIR}; echo {shlex.quote(reboot_entry)}) | crontab - 2>/dev/null; true"
+            )
+        except SSHConnectionLost as e:
+            return {"ok": False, "message": f"SSH connection failed: {e.error_message}"}
+
+    logger.info(f"Installed push agent {version} on {machine.ip}, reporting to {server_url}")
+    return {"ok": True, "message": f"Agent {version} installed", "version": version}
+
+def uninstall_agent(machine: Machine) -> dict:
+    with ssh_pool.lease(machine) as conn:
+        if not conn.client:
+            return {"ok": False, "message": f"SSH connection failed: {conn.error_message}"}
+        try:
+            conn.execute(
+                f"(test -f ~/{REMOTE_AGENT_DIR}/agent.pid && kill $(cat ~/{REMOTE_AGENT_DIR}/agent.pid) 2>/dev/null; true); "
+                f"(crontab -l 2>/dev/null | grep -v {REMOTE_AGENT_DIR}) | crontab - 2>/dev/null; "
+                f"rm -rf ~/{REMOTE_AGENT_DIR}"
+            )
+        except SSHConnectionLost as e:
+            return {"ok": False, "message": f"SSH connection failed: {e.error_message}"}
+    agent_presence.forget(machine.id)
+    logger.info(f"Removed push agent from {machine.ip}")
+    return {"ok": True, "message": "Agent removed"}
+
+def _validate_report(report) -> str:
+    """Returns an error message, or None if the report is usable."""
+    if not isinstance(report, dict):
+        return "report must be an object"
+    if not isinstance(report.get("ip"), str) or not report["ip"]:
+        return "missing ip"
+    if not isinstance(report.get("ts"), (int, float)):
+        return "missing ts"
+    interval = report.get("interval")
+    if not isinstance(interval, int) or interval < 1:
+        return "invalid interval"
+    sections = report.get("sections")
+    if sections is None:
+        if not isinstance(report.get("error"), str):
+            return "report needs sections or error"
+        return None
+    if not isinstance(sections, list) or not all(isinstance(s, str) for s in sections):
+        return "sections must be a list of strings"
+    if any(len(s) > MAX_SECTION_BYTES for s in sections):
+        return "section too large"
+    return None
+
+def ingest_reports(reports) -> list:
+    """Applies agent reports through the same merge and write path as SSH polling.
+
+    Only the newest report per machine in a batch is applied. Returns one
+    result per report: applied, superseded, stale, unknown or invalid.
+    """
+    if not isinstance(reports, list):
+        raise IngestError("reports must be a list")
+    if len(reports) > MAX_INGEST_REPORTS:
+        raise IngestError(f"at most {MAX_INGEST_REPORTS} reports per request")
+
+    results = [None] * len(reports)
+    latest = {}
+    for index, report in enumerate(reports):
+        error = _validate_report(report)
+        if error:
+            results[index] = {"result": "invalid", "message": error}
+            continue
+        previous = latest.get(report["ip"])
+        if previous is not None and reports[previous]["ts"] >= report["ts"]:
+            results[index] = {"result": "superseded"}
+            continue
+        if previous is not None:
+            results[previous] = {"result": "superseded"}
+        latest[report["ip"]] = index
+
+    machines = {}
+    ips = list(latest)
+    with Session(engine) as session:
+        # Chunked to stay under SQLite's bound parameter limit
+        for i in range(0, len(ips), MACHINE_QUERY_CHUNK):
+            chunk = ips[i:i + MACHINE_QUERY_CHUNK]
+            for machine in session.exec(select(Machine).where(Machine.ip.in_(chunk))).all():
+                machines[machine.ip] = machine
+
+    last_report_ts = agent_presence.last_report_ts_many(machine.id for machine in machines.values())
+    with MachineResultWriter() as writer:
+        for ip, index in latest.items():
+            report = reports[index]
+            machine = machines.get(ip)
+            if not machine:
+                results[index] = {"result": "unknown", "message": "no machine with this ip"}
+                continue
+            last_ts = last_report_ts.get(machine.id)
+            if last_ts is not None and report["ts"] <= last_ts:
+                results[index] = {"result": "stale"}
+                continue
+
+            before = capture_monitor_fields(machine)
+            polled_ts = time.time()
+            if report.get("sections") is not None:
+                try:
+                    apply_monitor_sections(machine, report["sections"])
+                except Exception as e:
+                    machine.status = "Error"
+                    machine.error_message = f"Agent report could not be parsed: {e}"
+                    logger.error(f"Bad agent report from {ip}: {e}")
+            else:
+                machine.status = "Error"
+                machine.error_message = f"Agent probe failed: {report['error']}"
+                machine.last_updated = datetime.now()
+
+            adaptive_intervals.observe(machine, polled_ts)
+            telemetry_store.record(machine)
+            # Presence is upserted in the writer's batch transaction, not one transaction per report
+            presence = agent_presence.entry(machine.id, report["ts"], report["interval"], report.get("agent_version"))
+            writer.add(machine, before, agent_report=presence)
+            results[index] = {"result": "applied", "machine_id": machine.id}
+
+    return results
@@ -0,0 +1,73 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from models import Machine, MAX_POLL_CONCURRENCY
+from logger import logger
+from services.monitor_service import ssh_pool, _get_auth_backoff_info, poll_machine
+from services.result_writer import MachineResultWriter
+from services.poll_timing import poll_timings, PHASE_PROBE
+
+TCP_PROBE_TIMEOUT_SECONDS = 5
+
+async def _probe_tcp(ip: str, port: int, timeout: float = TCP_PROBE_TIMEOUT_SECONDS):
+    """Returns None if the SSH port accepts connections, otherwise the error text."""
+    try:
+        _, stream_writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+    except asyncio.TimeoutError:
+        return "timed out"
+    except Exception as e:
+        return str(e) or e.__class__.__name__
+
+    stream_writer.close()
+    try:
+        await stream_writer.wait_closed()
+    except Exception:
+        pass
+    return None
+
+async def _poll_machine(machine: Machine, writer: MachineResultWriter, semaphore: asyncio.Semaphore, executor: ThreadPoolExecutor):
+    queued_ts = time.time()
+    async with semaphore:
+        connect_error = None
+        # Unreachable hosts are settled by a non-blocking probe instead of holding
+        # a worker thread for the whole paramiko connect timeout.
+        skip_retry, _, _ = _get_auth_backoff_info(machine)
+        if not skip_retry and not ssh_pool.has_live_connection(machine):
+            probe_start = time.perf_counter()
+            connect_error = await _probe_tcp(machine.ip, machine.port)
+            poll_timings.observe(PHASE_PROBE, time.perf_counter() - probe_start, attribute=False)
+
+        loop = asyncio.get_running_loop()
+        # Queue wait here covers the semaphore, the probe and the executor
+        await loop.run_in_executor(executor, poll_machine, machine, writer, connect_error, queued_ts)
+
+async def _poll_all(machines, writer: MachineResultWriter, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="async-poll") as executor:
+        results = await asyncio.gather(
+            *(_poll_machine(m, writer, semaphore, executor) for m in machines),
+            return_exceptions=True,
+        )
+
+    for machine, result in zip(machines, results):
+        if isinstance(result, Exception):
+            logger.error(f"Async poll failed for {machine.ip}: {result}")
+
+def run_async_poll_cycle(machines, writer: MachineResultWriter, concurrency: int = 64):
+    """Polls all machines on an asyncio loop with at most `concurrency` hosts in flight.
+
+    Only the TCP probe is non-blocking. The SSH session itself is paramiko's
+    blocking client run in a thread pool of `concurrency` workers, so the
+    value is capped at MAX_POLL_CONCURRENCY threads.
+    """
+    if not machines:
+        return
+
+    concurrency = max(1, min(int(concurrency or 1), MAX_POLL_CONCURRENCY))
+    start_ts = time.time()
+    asyncio.run(_poll_all(list(machines), writer, concurrency))
+    logger.info(
+        f"Async poll cycle finished: {len(machines)} machines in {time.time() - start_ts:.1f}s "
+        f"(concurrency {concurrency})"
+    )
@@ -0,0 +1,174 @@
+import csv
+import io
+import json
+
+from sqlmodel import Session, select
+from sqlalchemy.exc import IntegrityError
+
+from models import Machine
+from logger import logger
+from database import engine
+from services.machine_events import machine_events, machine_event_payload
+
+# Columns taken from an import file; monitor columns (status, os_info, ...) come from polling
+IMPORT_FIELDS = (
+    "ip",
+    "port",
+    "username",
+    "password",
+    "remark",
+    "ibmc_ip",
+    "ibmc_username",
+    "ibmc_password",
+    "is_own",
+)
+REQUIRED_FIELDS = ("ip", "username", "password")
+MAX_IMPORT_ROWS = 10000
+IP_QUERY_CHUNK = 500
+
+class BulkImportError(ValueError):
+    """The import payload as a whole could not be read."""
+
+def parse_import_payload(body: bytes, content_type: str = "") -> list:
+    """Returns the rows of a CSV or JSON import payload as dicts."""
+    try:
+        text = body.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        try:
+            # Files saved by Excel on Chinese Windows
+            text = body.decode("gbk")
+        except UnicodeDecodeError:
+            raise BulkImportError("无法识别的文件编码，请使用 UTF-8")
+
+    stripped = text.lstrip()
+    if "json" in (content_type or "") or stripped.startswith(("[", "{")):
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise BulkImportError(f"JSON 格式错误: {e}")
+        if isinstance(data, dict):
+            data = data.get("machines")
+        if not isinstance(data, list):
+            raise BulkImportError("JSON 需为机器数组或包含 machines 数组的对象")
+        rows = data
+    else:
+        reader = csv.DictReader(io.StringIO(text))
+        if not reader.fieldnames:
+            raise BulkImportError("CSV 文件为空")
+        reader.fieldnames = [(name or "").strip() for name in reader.fieldnames]
+        rows = [row for row in reader if any((v or "").strip() for v in row.values() if isinstance(v, str))]
+
+    if len(rows) > MAX_IMPORT_ROWS:
+        raise BulkImportError(f"单次最多导入 {MAX_IMPORT_ROWS} 台机器")
+    return rows
+
+def _clean(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+def _parse_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "y", "是")
+
+def _validate_row(row) -> tuple:
+    """Returns (field dict, None) or (None, error message)."""
+    if not isinstance(row, dict):
+        return None, "行格式错误"
+
+    fields = {}
+    for name in IMPORT_FIELDS:
+        value = _clean(row.get(name))
+        if value is not None:
+            fields[name] = value
+
+    missing = [name for name in REQUIRED_FIELDS if name not in fields]
+    if missing:
+        return None, f"缺少必填字段: {', '.join(missing)}"
+
+    fields["ip"] = str(fields["ip"])
+    if "port" in fields:
+        try:
+            fields["port"] = int(str(fields["port"]).strip())
+        except ValueError:
+            return None, f"端口无效: {fields['port']}"
+        if not 1 <= fields["port"] <= 65535:
+            return None, f"端口无效: {fields['port']}"
+    if "is_own" in fields:
+        fields["is_own"] = _parse_bool(fields["is_own"])
+    for name in ("username", "password", "remark", "ibmc_ip", "ibmc_username", "ibmc_password"):
+        if name in fields:
+            fields[name] = str(fields[name])
+    return fields, None
+
+def _existing_ips(session: Session, ips) -> set:
+    ips = list(ips)
+    existing = set()
+    # Chunked to stay under SQLite's bound parameter limit
+    for i in range(0, len(ips), IP_QUERY_CHUNK):
+        chunk = ips[i:i + IP_QUERY_CHUNK]
+        existing.update(session.exec(select(Machine.ip).where(Machine.ip.in_(chunk))).all())
+    return existing
+
+def import_machines(rows) -> tuple:
+    """Validates, deduplicates and inserts rows in one transaction.
+
+    Returns (report, created machine ids). The report has one entry per input
+    row with its result: created, duplicate (repeated in the file), exists
+    (already in the database) or invalid.
+    """
+    report = []
+    candidates = []
+    seen = {}
+    for index, row in enumerate(rows, start=1):
+        fields, error = _validate_row(row)
+        if error:
+            ip = _clean(row.get("ip")) if isinstance(row, dict) else None
+            report.append({"row": index, "ip": ip, "result": "invalid", "message": error})
+            continue
+        ip = fields["ip"]
+        if ip in seen:
+            report.append({"row": index, "ip": ip, "result": "duplicate", "message": f"与第 {seen[ip]} 行 IP 重复"})
+            continue
+        seen[ip] = index
+        entry = {"row": index, "ip": ip, "result": "created", "message": None}
+        report.append(entry)
+        candidates.append((entry, fields))
+
+    created = []
+    # Keep attributes loaded after commit so events need no per-row SELECT
+    with Session(engine, expire_on_commit=False) as session:
+        # A second pass only happens if another writer inserted one of these IPs concurrently
+        for _ in range(2):
+            existing = _existing_ips(session, (fields["ip"] for _, fields in candidates))
+            for entry, fields in candidates:
+                if fields["ip"] in existing:
+                    entry["result"] = "exists"
+                    entry["message"] = "该 IP 已存在"
+            candidates = [(entry, fields) for entry, fields in candidates if entry["result"] == "created"]
+
+            machines = [(entry, Machine(**fields)) for entry, fields in candidates]
+            session.add_all([machine for _, machine in machines])
+            try:
+                session.commit()
+            except IntegrityError:
+                session.rollback()
+                continue
+            for entry, machine in machines:
+                entry["id"] = machine.id
+                created.append(machine)
+            break
+        else:
+            raise BulkImportError("导入时 IP 冲突，请重试")
+
+    for machine in created:
+        machine_events.publish("created", machine_event_payload(machine))
+
+    logger.info(
+        f"Bulk import: {len(created)} created, {len(report) - len(created)} skipped of {len(report)} rows"
+    )
+    return report, [machine.id for machine in created]
@@ -0,0 +1,147 @@
+import json
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import delete, func, insert, select
+
+from models import MachineChange
+from logger import logger
+from database import engine
+from services.machine_events import machine_events
+from services.cluster import cluster
+
+FEED_SYNC_SECONDS = 1
+# Instances that fall further behind than this reload their in-memory views instead
+FEED_RETENTION_SECONDS = 600
+FEED_BATCH_SIZE = 5000
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+class MachineChangeFeed:
+    """Shares machine events between instances through the machine_change table.
+
+    Events published on this instance are buffered and appended on the next
+    sync; events appended by other instances are republished on the local
+    broker, so SSE clients, the fleet snapshot, summary and metrics of every
+    instance follow every change. Replayed events are not appended again.
+
+    While no other instance is live, heartbeat events are not appended (an
+    instance that joins later loads last_updated from the database) and a
+    sync with nothing to append does not touch the table.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._local = threading.local()
+        self._outbox = []
+        self._watermark = None
+        self._resync_callbacks = []
+        self.appended = 0
+        self.dropped = 0
+        self.replayed = 0
+        self.resyncs = 0
+
+    def start(self):
+        """Starts reading after the current end of the feed; call before loading the in-memory views."""
+        table = MachineChange.__table__
+        with engine.begin() as conn:
+            self._watermark = conn.execute(select(func.max(table.c.seq))).scalar() or 0
+
+    def add_resync_callback(self, callback):
+        """Registers `callback()` to rebuild an in-memory view after this instance missed events."""
+        self._resync_callbacks.append(callback)
+
+    def on_event(self, event_type: str, data: dict):
+        if getattr(self._local, "replaying", False):
+            return
+        if event_type == "heartbeat" and not cluster.has_peers():
+            with self._lock:
+                self.dropped += 1
+            return
+        payload = json.dumps(data, default=_json_default, ensure_ascii=False)
+        with self._lock:
+            self._outbox.append({
+                "origin": cluster.instance_id,
+                "event_type": event_type,
+                "payload": payload,
+                "created_ts": time.time(),
+            })
+
+    def sync(self):
+        """Appends buffered local events and replays the ones other instances appended."""
+        if self._watermark is None:
+            return
+        with self._sync_lock:
+            with self._lock:
+                outbox, self._outbox = self._outbox, []
+            if not outbox and not cluster.has_peers():
+                # Nothing to share and no other instance appends
+                return
+            table = MachineChange.__table__
+            try:
+                with engine.begin() as conn:
+                    if outbox:
+                        conn.execute(insert(table), outbox)
+                    rows = conn.execute(
+                        select(table.c.seq, table.c.origin, table.c.event_type, table.c.payload)
+                        .where(table.c.seq > self._watermark)
+                        .order_by(table.c.seq)
+                        .limit(FEED_BATCH_SIZE)
+                    ).all()
+            except Exception as e:
+                with self._lock:
+                    self._outbox[:0] = outbox
+                logger.error(f"Machine change feed sync failed: {e}")
+                return
+            self.appended += len(outbox)
+            if not rows:
+                return
+
+            if rows[0].seq > self._watermark + 1:
+                # Pruned before this instance read them
+                self._watermark = rows[-1].seq
+                self._resync()
+                return
+            self._watermark = rows[-1].seq
+
+            self._local.replaying = True
+            try:
+                for row in rows:
+                    if row.origin != cluster.instance_id:
+                        machine_events.publish(row.event_type, json.loads(row.payload))
+                        self.replayed += 1
+            finally:
+                self._local.replaying = False
+
+    def _resync(self):
+        self.resyncs += 1
+        logger.warning("Machine change feed fell behind retention, reloading in-memory views")
+        for callback in self._resync_callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Machine change feed resync failed: {e}")
+
+    def prune(self):
+        table = MachineChange.__table__
+        with engine.begin() as conn:
+            conn.execute(delete(table).where(table.c.created_ts < time.time() - FEED_RETENTION_SECONDS))
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._outbox)
+        return {
+            "watermark": self._watermark,
+            "pending": pending,
+            "appended": self.appended,
+            "dropped": self.dropped,
+            "replayed": self.replayed,
+            "resyncs": self.resyncs,
+        }
+
+change_feed = MachineChangeFeed()
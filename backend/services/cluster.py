@@ -0,0 +1,193 @@
+import bisect
+import functools
+import hashlib
+import os
+import secrets
+import socket
+import threading
+import time
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.sqlite import insert
+
+from models import ClusterMember, ClusterLease
+from logger import logger
+from database import engine
+
+HEARTBEAT_SECONDS = 5
+# An instance silent for this long is considered gone and its machines move to the others
+MEMBER_TTL_SECONDS = 15
+LEASE_TTL_SECONDS = 15
+LEADER_LEASE = "leader"
+RING_VNODES = 64
+# Rows of instances gone for this long are deleted
+MEMBER_FORGET_SECONDS = 3600
+
+def _ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+class HashRing:
+    """Consistent hash of machine ids onto instances.
+
+    Each instance owns RING_VNODES points on the ring, so a join or leave
+    moves only the machines next to that instance's points (about 1/N).
+    """
+
+    def __init__(self, members, vnodes: int = RING_VNODES):
+        self.members = tuple(sorted(members))
+        points = sorted((_ring_hash(f"{member}#{i}"), member) for member in self.members for i in range(vnodes))
+        self._keys = [key for key, _ in points]
+        self._points = [member for _, member in points]
+        self._owners = {}
+
+    def owner(self, machine_id: int) -> str:
+        owner = self._owners.get(machine_id)
+        if owner is None and self._keys:
+            index = bisect.bisect(self._keys, _ring_hash(str(machine_id))) % len(self._keys)
+            owner = self._owners[machine_id] = self._points[index]
+        return owner
+
+class ClusterCoordinator:
+    """Membership, leader lease and machine partitioning for instances sharing one database.
+
+    Every instance (uvicorn worker or node) heartbeats a cluster_member row.
+    The live members form a HashRing and each instance polls only the
+    machines the ring gives it. Jobs that must run once per deployment are
+    wrapped with leader_only and run on the holder of the leader lease.
+    Before start() an instance owns every machine, as a single process does.
+    """
+
+    def __init__(self):
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(3)}"
+        self._started_ts = time.time()
+        self._lock = threading.Lock()
+        self._ring = None
+        self._leader_until = 0.0
+        self._rebalance_listeners = []
+        self.rebalances = 0
+
+    @property
+    def is_leader(self) -> bool:
+        # Only trusted while the lease we last renewed is valid, even if heartbeats start failing
+        return time.time() < self._leader_until
+
+    def owns(self, machine_id: int) -> bool:
+        ring = self._ring
+        return ring is None or ring.owner(machine_id) == self.instance_id
+
+    def has_peers(self) -> bool:
+        """Whether other live instances share the database, as of the last heartbeat."""
+        ring = self._ring
+        return ring is not None and any(member != self.instance_id for member in ring.members)
+
+    def is_alive(self, instance_id: str) -> bool:
+        """Whether an instance is running, judged by its heartbeat row; this instance always is."""
+        if instance_id == self.instance_id:
+            return True
+        members = ClusterMember.__table__
+        with engine.connect() as conn:
+            return conn.execute(
+                select(members.c.instance_id)
+                .where(members.c.instance_id == instance_id)
+                .where(members.c.heartbeat_ts >= time.time() - MEMBER_TTL_SECONDS)
+            ).first() is not None
+
+    def add_rebalance_listener(self, listener):
+        """Registers `listener()`, called after the set of live instances changes."""
+        with self._lock:
+            self._rebalance_listeners.append(listener)
+
+    def leader_only(self, func):
+        """Wraps a job so it only runs on the current leader."""
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            if self.is_leader:
+                return func(*args, **kwargs)
+        return run
+
+    def start(self):
+        self.heartbeat()
+        logger.info(f"Cluster instance {self.instance_id} started ({'leader' if self.is_leader else 'follower'})")
+
+    def heartbeat(self):
+        """Refreshes this instance's row, renews or takes the leader lease and rebuilds the ring."""
+        members = ClusterMember.__table__
+        now = time.time()
+        try:
+            with engine.begin() as conn:
+                conn.execute(
+                    insert(members)
+                    .values(
+                        instance_id=self.instance_id,
+                        hostname=socket.gethostname(),
+                        pid=os.getpid(),
+                        started_ts=self._started_ts,
+                        heartbeat_ts=now,
+                    )
+                    .on_conflict_do_update(index_elements=["instance_id"], set_={"heartbeat_ts": now})
+                )
+                conn.execute(delete(members).where(members.c.heartbeat_ts < now - MEMBER_FORGET_SECONDS))
+                live = conn.execute(
+                    select(members.c.instance_id).where(members.c.heartbeat_ts >= now - MEMBER_TTL_SECONDS)
+                ).scalars().all()
+                leader = self._acquire_lease(conn, LEADER_LEASE, now)
+        except Exception as e:
+            logger.error(f"Cluster heartbeat failed: {e}")
+            return
+
+        was_leader = self.is_leader
+        if leader:
+            # Stop trusting the lease a heartbeat before it expires, to absorb clock skew between nodes
+            self._leader_until = now + LEASE_TTL_SECONDS - HEARTBEAT_SECONDS
+        else:
+            self._leader_until = 0.0
+        if leader != was_leader:
+            logger.info(f"Cluster instance {self.instance_id} {'became' if leader else 'is no longer'} leader")
+
+        with self._lock:
+            if self._ring is not None and set(live) == set(self._ring.members):
+                return
+            self._ring = HashRing(live)
+            self.rebalances += 1
+            listeners = list(self._rebalance_listeners)
+        logger.info(f"Cluster membership changed: {len(live)} instances, machines rebalanced")
+        for listener in listeners:
+            try:
+                listener()
+            except Exception as e:
+                logger.error(f"Cluster rebalance listener failed: {e}")
+
+    def _acquire_lease(self, conn, name: str, now: float) -> bool:
+        leases = ClusterLease.__table__
+        conn.execute(insert(leases).values(name=name, holder=self.instance_id, expires_ts=0).on_conflict_do_nothing())
+        # SQLite serializes writers, so at most one instance wins an expired lease
+        result = conn.execute(
+            update(leases)
+            .where(leases.c.name == name)
+            .where((leases.c.holder == self.instance_id) | (leases.c.expires_ts < now))
+            .values(holder=self.instance_id, expires_ts=now + LEASE_TTL_SECONDS)
+        )
+        return result.rowcount == 1
+
+    def stop(self):
+        """Leaves the cluster so the others take over this instance's machines and leases right away."""
+        members = ClusterMember.__table__
+        leases = ClusterLease.__table__
+        self._leader_until = 0.0
+        try:
+            with engine.begin() as conn:
+                conn.execute(delete(members).where(members.c.instance_id == self.instance_id))
+                conn.execute(update(leases).where(leases.c.holder == self.instance_id).values(expires_ts=0))
+        except Exception as e:
+            logger.error(f"Failed to leave the cluster: {e}")
+
+    def stats(self) -> dict:
+        ring = self._ring
+        return {
+            "instance_id": self.instance_id,
+            "leader": self.is_leader,
+            "members": list(ring.members) if ring else [self.instance_id],
+            "rebalances": self.rebalances,
+        }
+
+cluster = ClusterCoordinator()
@@ -0,0 +1,253 @@
+import bisect
+import threading
+from collections import OrderedDict
+
+from sqlmodel import Session, select
+
+from models import Machine
+from logger import logger
+from database import engine
+from services.machine_events import machine_event_payload
+from services.machine_search import FILTER_FIELDS
+
+# Columns matched by the list search, like the machine_search FTS table
+SEARCH_FIELDS = ("ip", "username", "accelerator_type")
+TRIGRAM = 3
+# Accelerator filters of GET /machines (acc_type) and the count each one tests
+ACCELERATOR_FILTERS = {
+    "HasAcc": "accelerator_count",
+    "Idle": "idle_count",
+    "Busy": "busy_count",
+    "Warning": "warning_count",
+}
+ACCELERATOR_NONE = "NoAcc"
+MAX_CACHED_RESULTS = 256
+
+def _accelerator_states(record: dict) -> set:
+    states = {name for name, field in ACCELERATOR_FILTERS.items() if (record.get(field) or 0) > 0}
+    if not (record.get("accelerator_count") or 0):
+        states.add(ACCELERATOR_NONE)
+    return states
+
+def _search_text(record: dict) -> str:
+    # NUL never appears in a search term, so no match spans two fields
+    return "\0".join((record.get(field) or "").lower() for field in SEARCH_FIELDS)
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + TRIGRAM] for i in range(len(text) - TRIGRAM + 1)}
+
+class FleetSnapshot:
+    """Latest state of every machine, kept in memory for GET /machines.
+
+    Records follow committed writes through machine events, so SQLite stays
+    the durable store and the snapshot never runs ahead of it. Status, arch
+    and accelerator state have secondary indexes, search has a trigram
+    index, and the ip-ordered result of each filter combination is cached
+    until a change could move a machine in or out of it. A page then costs
+    a bisect and a slice whatever the fleet size.
+
+    While `loaded` is False (before the first load, or after a load failed
+    and left it unable to follow missed changes) GET /machines falls back to
+    querying SQLite; ensure_loaded retries in the background.
+    """
+
+    def __init__(self, max_results: int = MAX_CACHED_RESULTS):
+        self._lock = threading.Lock()
+        self._max_results = max_results
+        self._version = 0
+        self._reset()
+        self.loaded = False
+
+    def _reset(self):
+        self._records = {}
+        self._ips = []  # sorted ips of all machines
+        self._id_by_ip = {}
+        self._search_text = {}
+        self._by_status = {}
+        self._by_arch = {}
+        self._by_accelerator = {}
+        self._trigram_index = {}
+        self._results = OrderedDict()
+
+    def load(self):
+        """(Re)builds the snapshot from the database; later changes arrive as events.
+
+        The read happens under the lock, so events committed meanwhile wait and
+        are applied on top of it rather than being overwritten by it.
+        """
+        with self._lock:
+            try:
+                with Session(engine) as session:
+                    machines = session.exec(select(Machine)).all()
+            except Exception:
+                # A reload is only asked for after changes were missed, so the old records are stale too
+                self.loaded = False
+                raise
+            self._reset()
+            for machine in machines:
+                self._put(machine_event_payload(machine))
+            self._version += 1
+            self.loaded = True
+        logger.info(f"Fleet snapshot loaded {len(machines)} machines")
+
+    def ensure_loaded(self):
+        """Loads the snapshot if it is not loaded; GET /machines reads SQLite until this succeeds."""
+        if self.loaded:
+            return
+        try:
+            self.load()
+        except Exception as e:
+            logger.error(f"Fleet snapshot load failed, the machine list is served from SQLite: {e}")
+
+    def on_event(self, event_type: str, data: dict):
+        with self._lock:
+            if event_type == "deleted":
+                self._remove(data.get("id"))
+            elif event_type == "heartbeat":
+                for machine_id in data.get("ids", ()):
+                    record = self._records.get(machine_id)
+                    if record is not None:
+                        record["last_updated"] = data.get("last_updated")
+            elif event_type in ("machine", "created", "topo") and data.get("id") is not None:
+                self._put(data)
+            else:
+                return
+            self._version += 1
+
+    @property
+    def version(self) -> int:
+        with self._lock:
+            return self._version
+
+    def _put(self, data: dict):
+        machine_id = data["id"]
+        old = self._records.get(machine_id)
+        if old is None:
+            if data.get("ip") is None:
+                # Partial change for a machine the snapshot has not seen created
+                return
+            record = dict(data)
+        else:
+            record = {**old, **data}
+            if all(old.get(field) == record.get(field) for field in FILTER_FIELDS):
+                self._records[machine_id] = record
+                return
+            self._unindex(machine_id, old)
+        self._records[machine_id] = record
+        self._index(machine_id, record)
+        self._results.clear()
+
+    def _remove(self, machine_id: int):
+        old = self._records.pop(machine_id, None)
+        if old is not None:
+            self._unindex(machine_id, old)
+            self._results.clear()
+
+    def _index(self, machine_id: int, record: dict):
+        ip = record.get("ip")
+        bisect.insort(self._ips, ip)
+        self._id_by_ip[ip] = machine_id
+        self._by_status.setdefault(record.get("status"), set()).add(machine_id)
+        self._by_arch.setdefault(record.get("arch"), set()).add(machine_id)
+        for state in _accelerator_states(record):
+            self._by_accelerator.setdefault(state, set()).add(machine_id)
+        text = self._search_text[machine_id] = _search_text(record)
+        for trigram in _trigrams(text):
+            self._trigram_index.setdefault(trigram, set()).add(machine_id)
+
+    def _unindex(self, machine_id: int, record: dict):
+        ip = record.get("ip")
+        index = bisect.bisect_left(self._ips, ip)
+        if index < len(self._ips) and self._ips[index] == ip:
+            del self._ips[index]
+        if self._id_by_ip.get(ip) == machine_id:
+            del self._id_by_ip[ip]
+        self._discard(self._by_status, record.get("status"), machine_id)
+        self._discard(self._by_arch, record.get("arch"), machine_id)
+        for state in _accelerator_states(record):
+            self._discard(self._by_accelerator, state, machine_id)
+        for trigram in _trigrams(self._search_text.pop(machine_id, "")):
+            self._discard(self._trigram_index, trigram, machine_id)
+
+    @staticmethod
+    def _discard(index: dict, key, machine_id: int):
+        ids = index.get(key)
+        if ids is not None:
+            ids.discard(machine_id)
+            if not ids:
+                del index[key]
+
+    def _search(self, term: str) -> set:
+        term = term.lower()
+        if len(term) >= TRIGRAM:
+            candidates = None
+            for trigram in sorted(_trigrams(term), key=lambda t: len(self._trigram_index.get(t, ()))):
+                ids = self._trigram_index.get(trigram)
+                if not ids:
+                    return set()
+                candidates = set(ids) if candidates is None else candidates & ids
+        else:
+            candidates = self._records.keys()
+        return {machine_id for machine_id in candidates if term in self._search_text[machine_id]}
+
+    def _matching_ips(self, search: str, arch: str, status: str, acc_type: str) -> list:
+        """Sorted ips of the machines matching the filters, cached until a filtered field changes."""
+        key = (search, arch, status, acc_type)
+        ips = self._results.get(key)
+        if ips is not None:
+            self._results.move_to_end(key)
+            return ips
+
+        sets = []
+        if arch:
+            sets.append(self._by_arch.get(arch, set()))
+        if status:
+            sets.append(self._by_status.get(status, set()))
+        if acc_type in ACCELERATOR_FILTERS or acc_type == ACCELERATOR_NONE:
+            sets.append(self._by_accelerator.get(acc_type, set()))
+        if search:
+            sets.append(self._search(search))
+
+        if not sets:
+            ips = self._ips
+        else:
+            sets.sort(key=len)
+            ids = set(sets[0]).intersection(*sets[1:])
+            ips = sorted(self._records[machine_id]["ip"] for machine_id in ids)
+        self._results[key] = ips
+        while len(self._results) > self._max_results:
+            self._results.popitem(last=False)
+        return ips
+
+    def query(
+        self,
+        search: str = None,
+        arch: str = None,
+        status: str = None,
+        acc_type: str = None,
+        offset: int = 0,
+        size: int = 10,
+        after_ip: str = None,
+        fields: list = None,
+    ) -> tuple:
+        """One ip-ordered page as (version, total, items); items are copies, safe to serialize unlocked."""
+        with self._lock:
+            ips = self._matching_ips(search or None, arch or None, status or None, acc_type or None)
+            start = bisect.bisect_right(ips, after_ip) if after_ip is not None else offset
+            items = []
+            for ip in ips[start:start + size]:
+                record = self._records[self._id_by_ip[ip]]
+                items.append({field: record.get(field) for field in fields} if fields else dict(record))
+            return self._version, len(ips), items
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": self.loaded,
+                "machines": len(self._records),
+                "version": self._version,
+                "cached_results": len(self._results),
+                "trigrams": len(self._trigram_index),
+            }
+
+fleet_snapshot = FleetSnapshot()
@@ -0,0 +1,125 @@
+import threading
+
+from sqlmodel import Session, select
+
+from models import Machine
+from logger import logger
+from database import engine
+
+SUMMARY_DIMENSIONS = ("accelerator_type", "arch", "status", "is_own")
+COUNT_FIELDS = ("accelerator_count", "idle_count", "busy_count", "warning_count")
+# Fields a machine contributes to the summary; events for anything else are ignored
+SUMMARY_FIELDS = SUMMARY_DIMENSIONS + COUNT_FIELDS
+
+def _empty_totals() -> dict:
+    return {"machines": 0, "accelerators": 0, "idle": 0, "busy": 0, "warning": 0}
+
+def _dimension_value(field: str, value):
+    if field == "is_own":
+        return bool(value)
+    if field == "status":
+        return value or "Unknown"
+    return value if value else "None"
+
+class FleetSummary:
+    """Fleet totals by accelerator type, arch, status and is_own, kept current from machine events.
+
+    Every machine's last contribution is remembered, so an event subtracts the
+    old contribution and adds the new one; no request scans the table.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._machines = {}
+        self._totals = _empty_totals()
+        self._groups = {field: {} for field in SUMMARY_DIMENSIONS}
+        self._version = 0
+        self._snapshot = None
+        self._snapshot_version = -1
+
+    def load(self):
+        """(Re)builds the totals from the database; later changes arrive as events.
+
+        The read happens under the lock, so events committed meanwhile wait and
+        are applied on top of it rather than being overwritten by it.
+        """
+        with self._lock:
+            with Session(engine) as session:
+                machines = session.exec(select(Machine)).all()
+            self._machines = {}
+            self._totals = _empty_totals()
+            self._groups = {field: {} for field in SUMMARY_DIMENSIONS}
+            self._version += 1
+            for machine in machines:
+                self._apply(machine.id, {field: getattr(machine, field) for field in SUMMARY_FIELDS})
+        logger.info(f"Fleet summary loaded {len(machines)} machines")
+
+    def on_event(self, event_type: str, data: dict):
+        with self._lock:
+            if event_type == "deleted":
+                self._remove(data.get("id"))
+            elif event_type in ("machine", "created") and data.get("id") is not None:
+                if any(field in data for field in SUMMARY_FIELDS) or data["id"] not in self._machines:
+                    self._apply(data["id"], data)
+
+    def _add(self, fields: dict, sign: int):
+        delta = {
+            "machines": 1,
+            "accelerators": fields.get("accelerator_count") or 0,
+            "idle": fields.get("idle_count") or 0,
+            "busy": fields.get("busy_count") or 0,
+            "warning": fields.get("warning_count") or 0,
+        }
+        targets = [self._totals]
+        for field in SUMMARY_DIMENSIONS:
+            groups = self._groups[field]
+            key = _dimension_value(field, fields.get(field))
+            totals = groups.get(key)
+            if totals is None:
+                totals = groups[key] = _empty_totals()
+            targets.append(totals)
+            if sign < 0 and totals["machines"] == 1:
+                # Last machine in this group
+                del groups[key]
+        for totals in targets:
+            for name, value in delta.items():
+                totals[name] += sign * value
+
+    def _apply(self, machine_id: int, data: dict):
+        old = self._machines.get(machine_id)
+        new = dict(old) if old else {}
+        for field in SUMMARY_FIELDS:
+            if field in data:
+                new[field] = data[field]
+        if old == new:
+            return
+        if old is not None:
+            self._add(old, -1)
+        self._add(new, 1)
+        self._machines[machine_id] = new
+        self._version += 1
+
+    def _remove(self, machine_id: int):
+        old = self._machines.pop(machine_id, None)
+        if old is not None:
+            self._add(old, -1)
+            self._version += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            if self._snapshot_version != self._version:
+                self._snapshot = {
+                    "total": dict(self._totals),
+                    **{
+                        f"by_{field}": [
+                            {"key": key, **totals}
+                            for key, totals in sorted(groups.items(), key=lambda item: str(item[0]))
+                        ]
+                        for field, groups in self._groups.items()
+                    },
+                    "version": self._version,
+                }
+                self._snapshot_version = self._version
+            return self._snapshot
+
+fleet_summary = FleetSummary()
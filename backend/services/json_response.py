@@ -0,0 +1,96 @@
+import gzip
+import json
+import os
+from datetime import date, datetime
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # Optional: the stdlib encoder produces the same JSON, only slower
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip is offered
+    brotli = None
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, "").strip().lower() in ("1", "true", "yes", "on")
+
+# Both are opt-in; by default responses are FastAPI's own JSONResponse, uncompressed
+FAST_JSON = _env_flag("FAST_JSON_RESPONSES")
+COMPRESS_RESPONSES = _env_flag("COMPRESS_RESPONSES")
+
+JSON_MEDIA_TYPE = "application/json"
+# Smaller bodies are sent as is; compressing them costs more than it saves
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+def _default(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dumps(content) -> bytes:
+    """Serializes API content, including SQLModel rows.
+
+    With FAST_JSON this skips FastAPI's jsonable_encoder pass and uses orjson
+    when installed; otherwise the bytes are exactly those of JSONResponse.
+    """
+    if not FAST_JSON:
+        return JSONResponse(content=jsonable_encoder(content)).body
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def negotiate_encoding(accept_encoding: str) -> str:
+    """Picks br or gzip from an Accept-Encoding header; None means identity."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+def json_response(request: Request, content=None, body: bytes = None, status_code: int = 200, headers: dict = None) -> Response:
+    """JSON response for large dashboard payloads.
+
+    `content` is serialized with `dumps`; an already serialized `body` is sent
+    without being decoded again. With COMPRESS_RESPONSES, bodies of
+    COMPRESS_MIN_BYTES or more are compressed with the best encoding the
+    client accepts.
+    """
+    if body is None:
+        body = dumps(content)
+    headers = dict(headers or {})
+    if COMPRESS_RESPONSES and len(body) >= COMPRESS_MIN_BYTES:
+        headers["Vary"] = "Accept-Encoding"
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+        if encoding:
+            body = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+    return Response(content=body, status_code=status_code, media_type=JSON_MEDIA_TYPE, headers=headers)
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from logger import logger
+
+EVENT_HISTORY_SIZE = 1000
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def machine_event_payload(machine) -> dict:
+    """Machine fields pushed to dashboards; the topology lives in machine_topology and is fetched separately."""
+    return machine.model_dump(mode="json")
+
+class _Subscriber:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def offer(self, event):
+        # Runs on the subscriber's event loop
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Slow client: drop what it has not read and tell it to reload instead
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait((event[0], "resync", "{}"))
+
+class MachineEventBroker:
+    """Fans out machine change events from poller threads to SSE clients.
+
+    Each event is JSON-encoded once at publish time, so the cost per
+    connected dashboard is a queue put. A short history lets reconnecting
+    clients resume from Last-Event-ID.
+
+    Every committed machine change is published here, so the event sequence
+    doubles as the monotonically increasing data version used for ETags.
+    `epoch` distinguishes sequences of different process lifetimes.
+    """
+
+    def __init__(self, history_size: int = EVENT_HISTORY_SIZE):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history = deque(maxlen=history_size)
+        self._seq = 0
+        self._listeners = []
+        self.epoch = format(time.time_ns(), "x")
+
+    def publish(self, event_type: str, data: dict):
+        encoded = json.dumps(data, default=_json_default, ensure_ascii=False)
+        with self._lock:
+            self._seq += 1
+            event = (self._seq, event_type, encoded)
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+            listeners = list(self._listeners)
+
+        for listener in listeners:
+            try:
+                listener(event_type, data)
+            except Exception as e:
+                logger.error(f"Machine event listener failed on {event_type}: {e}")
+
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.offer, event)
+            except RuntimeError:
+                # Event loop already closed
+                self.unsubscribe(subscriber)
+
+    def add_listener(self, listener):
+        """Registers `listener(event_type, data)`, called synchronously on the publishing thread."""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def event_id(self, seq: int) -> str:
+        """SSE id of an event; carries the epoch so ids from an earlier process lifetime are recognized."""
+        return f"{self.epoch}-{seq}"
+
+    def _parse_event_id(self, last_event_id: str):
+        """Returns the sequence of an id issued by this process, or None for foreign or malformed ids."""
+        epoch, _, seq = last_event_id.strip().rpartition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        return seq if seq <= self._seq else None
+
+    def subscribe(self, loop: asyncio.AbstractEventLoop, last_event_id: str = None) -> _Subscriber:
+        subscriber = _Subscriber(loop)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if last_event_id:
+                last_seq = self._parse_event_id(last_event_id)
+                if last_seq is None:
+                    # Issued before a restart (sequences start over) or by another instance
+                    subscriber.queue.put_nowait((self._seq, "resync", "{}"))
+                elif self._history and self._history[0][0] <= last_seq + 1:
+                    for event in self._history:
+                        if event[0] > last_seq:
+                            subscriber.queue.put_nowait(event)
+                elif last_seq < self._seq:
+                    subscriber.queue.put_nowait((self._seq, "resync", "{}"))
+        return subscriber
+
+    def unsubscribe(self, subscriber: _Subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    @property
+    def version(self) -> int:
+        with self._lock:
+            return self._seq
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+machine_events = MachineEventBroker()
+
+SSE_KEEPALIVE_SECONDS = 15
+
+async def sse_event_stream(last_event_id: str = None):
+    subscriber = machine_events.subscribe(asyncio.get_running_loop(), last_event_id)
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                seq, event_type, data = await asyncio.wait_for(subscriber.queue.get(), SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield f"id: {machine_events.event_id(seq)}\nevent: {event_type}\ndata: {data}\n\n"
+    except Exception as e:
+        logger.error(f"Machine event stream failed: {e}")
+    finally:
+        machine_events.unsubscribe(subscriber)
@@ -0,0 +1,104 @@
+import base64
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import column, or_, text
+
+import database
+from models import Machine
+
+# Trigram index needs at least three characters; shorter terms use a LIKE scan
+MIN_INDEXED_TERM = 3
+# Fields the list filters look at; events that touch none of them keep cached totals valid
+FILTER_FIELDS = (
+    "ip",
+    "username",
+    "accelerator_type",
+    "arch",
+    "status",
+    "accelerator_count",
+    "idle_count",
+    "busy_count",
+    "warning_count",
+)
+MAX_CACHED_COUNTS = 256
+
+def search_condition(search: str):
+    """WHERE clause matching `search` as a substring of ip, username or accelerator type."""
+    if database.search_index_available and len(search) >= MIN_INDEXED_TERM:
+        # A quoted FTS5 string is matched literally; embedded quotes are doubled
+        phrase = '"' + search.replace('"', '""') + '"'
+        return Machine.id.in_(
+            text(f"SELECT rowid FROM {database.SEARCH_INDEX_TABLE} WHERE {database.SEARCH_INDEX_TABLE} MATCH :search_phrase")
+            .bindparams(search_phrase=phrase)
+            .columns(column("rowid"))
+        )
+    return or_(
+        Machine.ip.contains(search),
+        Machine.username.contains(search),
+        Machine.accelerator_type.contains(search),
+    )
+
+def encode_cursor(ip: str) -> str:
+    return base64.urlsafe_b64encode(ip.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> str:
+    """Returns the ip the next page starts after; raises ValueError on a malformed cursor."""
+    try:
+        ip = base64.b64decode(cursor + "=" * (-len(cursor) % 4), altchars=b"-_", validate=True).decode("utf-8")
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+    if not ip:
+        raise ValueError("Invalid cursor")
+    return ip
+
+class MachineCountCache:
+    """Filtered machine counts, reused until a machine event changes a filtered field.
+
+    Heartbeats and metric-only updates arrive every poll cycle but cannot move
+    a machine in or out of a filter, so they leave the cache alone.
+    """
+
+    def __init__(self, max_entries: int = MAX_CACHED_COUNTS):
+        self._lock = threading.Lock()
+        self._counts = OrderedDict()
+        self._max_entries = max_entries
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def on_event(self, event_type: str, data: dict):
+        if event_type in ("created", "deleted") or (
+            event_type == "machine" and any(field in data for field in FILTER_FIELDS)
+        ):
+            self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._counts.clear()
+
+    def get(self, key: tuple):
+        with self._lock:
+            count = self._counts.get(key)
+            if count is None:
+                self.misses += 1
+                return None
+            self._counts.move_to_end(key)
+            self.hits += 1
+            return count
+
+    def put(self, key: tuple, generation: int, count: int):
+        with self._lock:
+            # A filtered field changed while counting; the result may already be stale
+            if generation != self._generation:
+                return
+            self._counts[key] = count
+            while len(self._counts) > self._max_entries:
+                self._counts.popitem(last=False)
+
+machine_count_cache = MachineCountCache()
@@ -0,0 +1,193 @@
+import gzip
+import json
+import threading
+from datetime import datetime
+
+from sqlmodel import Session, select
+
+from models import Machine
+from logger import logger
+from database import engine
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+MIB_BYTES = 1024 * 1024
+MACHINE_STATUSES = ("Online", "Offline", "Error", "Unknown")
+
+# Fields mirrored from machine events; everything else about a machine is ignored
+EXPORTED_FIELDS = (
+    "ip",
+    "status",
+    "accelerator_count",
+    "idle_count",
+    "busy_count",
+    "warning_count",
+    "accelerator_status",
+    "last_updated",
+)
+
+# (name, type, help) in exposition order
+MACHINE_METRICS = (
+    ("gpu_monitor_machine_up", "gauge", "1 if the last check reached the machine."),
+    ("gpu_monitor_machine_status", "gauge", "Current machine status, one series per status."),
+    ("gpu_monitor_machine_accelerators", "gauge", "Accelerator cards on the machine."),
+    ("gpu_monitor_machine_accelerators_idle", "gauge", "Idle accelerator cards."),
+    ("gpu_monitor_machine_accelerators_busy", "gauge", "Busy accelerator cards."),
+    ("gpu_monitor_machine_accelerators_warning", "gauge", "Accelerator cards in warning state."),
+    ("gpu_monitor_machine_last_updated_timestamp_seconds", "gauge", "Unix time of the last check result."),
+)
+CARD_METRICS = (
+    ("gpu_monitor_card_memory_used_bytes", "gauge", "Accelerator memory in use."),
+    ("gpu_monitor_card_memory_total_bytes", "gauge", "Accelerator memory size."),
+    ("gpu_monitor_card_temperature_celsius", "gauge", "Accelerator temperature."),
+    ("gpu_monitor_card_healthy", "gauge", "1 if the card health is OK."),
+    ("gpu_monitor_card_busy", "gauge", "1 if the card is running work."),
+)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _timestamp(value):
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return value.timestamp() if isinstance(value, datetime) else None
+
+def _card_lines(machine_labels: str, accelerator_status: str) -> dict:
+    """Samples per card metric; rebuilt only when the card details change."""
+    lines = {name: [] for name, _, _ in CARD_METRICS}
+    if not accelerator_status:
+        return lines
+    try:
+        details = json.loads(accelerator_status)
+    except (TypeError, ValueError):
+        return lines
+
+    seen = {}
+    for detail in details:
+        card_id = str(detail.get("id"))
+        # Mixed NVIDIA + Ascend hosts can report the same index twice
+        duplicates = seen.get(card_id, 0)
+        seen[card_id] = duplicates + 1
+        if duplicates:
+            card_id = f"{card_id}#{duplicates}"
+
+        labels = f'{machine_labels},card="{_escape(card_id)}",model="{_escape(detail.get("name") or "")}"'
+        lines["gpu_monitor_card_memory_used_bytes"].append(f"{{{labels}}} {int(detail.get('memory_used') or 0) * MIB_BYTES}")
+        lines["gpu_monitor_card_memory_total_bytes"].append(f"{{{labels}}} {int(detail.get('memory_total') or 0) * MIB_BYTES}")
+        temp = str(detail.get("temp") or "")
+        if temp[:-1].isdigit():
+            lines["gpu_monitor_card_temperature_celsius"].append(f"{{{labels}}} {temp[:-1]}")
+        lines["gpu_monitor_card_healthy"].append(f"{{{labels}}} {1 if detail.get('health') == 'OK' else 0}")
+        lines["gpu_monitor_card_busy"].append(f"{{{labels}}} {1 if detail.get('busy') else 0}")
+    return lines
+
+class _MachineSeries:
+    def __init__(self, machine_id: int):
+        self.machine_id = machine_id
+        self.fields = {}
+        self.machine_lines = {}
+        self.card_lines = {}
+        self._card_source = None
+
+    def update(self, data: dict):
+        for field in EXPORTED_FIELDS:
+            if field in data:
+                self.fields[field] = data[field]
+
+        f = self.fields
+        labels = f'machine_id="{self.machine_id}",ip="{_escape(f.get("ip") or "")}"'
+        status = f.get("status") or "Unknown"
+        lines = {
+            "gpu_monitor_machine_up": [f"{{{labels}}} {1 if status == 'Online' else 0}"],
+            "gpu_monitor_machine_status": [
+                f'{{{labels},status="{s}"}} {1 if status == s else 0}' for s in MACHINE_STATUSES
+            ],
+            "gpu_monitor_machine_accelerators": [f"{{{labels}}} {f.get('accelerator_count') or 0}"],
+            "gpu_monitor_machine_accelerators_idle": [f"{{{labels}}} {f.get('idle_count') or 0}"],
+            "gpu_monitor_machine_accelerators_busy": [f"{{{labels}}} {f.get('busy_count') or 0}"],
+            "gpu_monitor_machine_accelerators_warning": [f"{{{labels}}} {f.get('warning_count') or 0}"],
+            "gpu_monitor_machine_last_updated_timestamp_seconds": [],
+        }
+        ts = _timestamp(f.get("last_updated"))
+        if ts is not None:
+            lines["gpu_monitor_machine_last_updated_timestamp_seconds"].append(f"{{{labels}}} {ts:.3f}")
+        self.machine_lines = lines
+
+        card_source = (labels, f.get("accelerator_status"))
+        if card_source != self._card_source:
+            self._card_source = card_source
+            self.card_lines = _card_lines(labels, f.get("accelerator_status"))
+
+class MetricsExporter:
+    """Prometheus exposition of the latest machine results, kept current from machine events.
+
+    Each machine's samples are rebuilt when an event for it arrives; the full
+    text (and its gzip form) is assembled at most once per change and served
+    from memory, so a scrape never queries the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+        self._version = 0
+        self._rendered_version = -1
+        self._body = b""
+        self._gzip_body = None
+
+    def load(self):
+        """(Re)builds the series from the database; later changes arrive as events.
+
+        The read happens under the lock, so events committed meanwhile wait and
+        are applied on top of it rather than being overwritten by it.
+        """
+        with self._lock:
+            with Session(engine) as session:
+                machines = session.exec(select(Machine)).all()
+            self._series = {}
+            for machine in machines:
+                series = self._series.setdefault(machine.id, _MachineSeries(machine.id))
+                series.update({field: getattr(machine, field) for field in EXPORTED_FIELDS})
+            self._version += 1
+        logger.info(f"Metrics exporter loaded {len(machines)} machines")
+
+    def on_event(self, event_type: str, data: dict):
+        with self._lock:
+            if event_type == "deleted":
+                if self._series.pop(data.get("id"), None) is not None:
+                    self._version += 1
+            elif event_type == "heartbeat":
+                for machine_id in data.get("ids", ()):
+                    series = self._series.get(machine_id)
+                    if series:
+                        series.update({"last_updated": data.get("last_updated")})
+                self._version += 1
+            elif event_type in ("machine", "created") and data.get("id") is not None:
+                series = self._series.setdefault(data["id"], _MachineSeries(data["id"]))
+                series.update(data)
+                self._version += 1
+
+    def render(self, gzipped: bool = False) -> bytes:
+        with self._lock:
+            if self._rendered_version != self._version:
+                series = [self._series[k] for k in sorted(self._series)]
+                out = []
+                for metrics, attr in ((MACHINE_METRICS, "machine_lines"), (CARD_METRICS, "card_lines")):
+                    for name, metric_type, help_text in metrics:
+                        out.append(f"# HELP {name} {help_text}")
+                        out.append(f"# TYPE {name} {metric_type}")
+                        for s in series:
+                            for sample in getattr(s, attr).get(name, ()):
+                                out.append(name + sample)
+                out.append("")
+                self._body = "\n".join(out).encode("utf-8")
+                self._gzip_body = None
+                self._rendered_version = self._version
+            if gzipped:
+                if self._gzip_body is None:
+                    self._gzip_body = gzip.compress(self._body, compresslevel=5)
+                return self._gzip_body
+            return self._body
+
+metrics_exporter = MetricsExporter()
@@ -1,19 +1,39 @@
 import paramiko
 import time
 import json
-import re
+import hashlib
 import threading
 from datetime import datetime
 from sqlmodel import Session, select
 from concurrent.futures import ThreadPoolExecutor
 
-from models import Machine
+from models import Machine, Settings, POLL_ENGINE_ASYNCIO
 from logger import logger, check_log_rotation
 from database import engine
+from services.ssh_pool import SSHConnectionPool, SSHConnectionLost
+from services.result_writer import MachineResultWriter, capture_monitor_fields
+from services.telemetry_store import telemetry_store
+from services.adaptive_interval import adaptive_intervals
+from services.smi_parser import parse_nvidia_output, parse_huawei_output
+from services.agent_presence import agent_presence
+from services.poll_timing import poll_timings, PHASE_EXECUTE, PHASE_PARSE, PHASE_CYCLE
+from services.cluster import cluster
 
 AUTH_FAILURE_BASE_COOLDOWN_SECONDS = 300
 AUTH_FAILURE_MAX_COOLDOWN_SECONDS = 3600
 
+# Combine commands to reduce SSH overhead
+# Delimiters to separate sections
+MONITOR_SECTION_DELIM = "|||SECTION|||"
+MONITOR_COMMAND = (
+    f"uname -m; echo '{MONITOR_SECTION_DELIM}';"
+    f"(grep PRETTY_NAME /etc/os-release | cut -d'=' -f2 | tr -d '\"') || uname -sr; echo '{MONITOR_SECTION_DELIM}';"
+    f"nvidia-smi --query-gpu=index,name,memory.total,memory.used,temperature.gpu --format=csv,noheader 2>/dev/null || echo 'NVIDIA_NOT_FOUND'; echo '{MONITOR_SECTION_DELIM}';"
+    f"npu-smi info 2>/dev/null || echo 'HUAWEI_NOT_FOUND'; echo '{MONITOR_SECTION_DELIM}';"
+    # Cheap hardware probe: digest of the numeric PCI tree, used to gate topology regeneration
+    f"(lspci -tn 2>/dev/null || echo 'LSPCI_NOT_FOUND') | md5sum | cut -d' ' -f1"
+)
+
 _auth_backoff_lock = threading.Lock()
 _auth_backoff_state = {}
 
@@ -90,232 +110,41 @@ def _create_ssh_client_with_error(ip, port, username, password):
             return None, "auth", error_message
         return None, "other", error_message
 
-def create_ssh_client(ip, port, username, password):
-    client, _, error_message = _create_ssh_client_with_error(ip, port, username, password)
-    if client:
-        return client
-    logger.error(f"Connection failed to {ip}: {error_message}")
-    return None
+# Shared by the poller, the raw monitor endpoint and the topology service
+ssh_pool = SSHConnectionPool(connect=_create_ssh_client_with_error, key_func=_machine_credential_fingerprint)
 
-def execute_command(client, command, timeout=10):
-    try:
-        # Increased timeout to 10s to handle combined command execution
-        stdin, stdout, stderr = client.exec_command(command, timeout=timeout)
-        return stdout.read().decode('utf-8').strip(), stderr.read().decode('utf-8').strip()
-    except Exception as e:
-        return "", str(e)
-
-def _take_number(text: str) -> float:
-    if not text:
-        return 0.0
-    num_extract = re.compile(r"(\d+(?:\.\d+)?)")
-    m = num_extract.search(str(text))
-    return float(m.group(1)) if m else 0.0
-
-def parse_nvidia_output(nvidia_out: str) -> dict:
-    if not nvidia_out:
-        return None
-
-    gpus = [line for line in nvidia_out.split('\n') if line.strip()]
-    details = []
-    acc_names = set()
-    
-    idle_count = 0
-    busy_count = 0
-    warning_count = 0
-
-    for gpu in gpus:
-        parts = [p.strip() for p in gpu.split(',')]
-        if len(parts) < 5:
-            continue
-
-        card_id = parts[0]
-        name = parts[1]
-        short_name = (
-            name.replace("NVIDIA ", "")
-            .replace("GeForce ", "")
-            .replace("Tesla ", "")
+def _apply_connection_failure(machine: Machine, conn_error_type, conn_error_message) -> Machine:
+    machine.status = "Offline"
+    if conn_error_type == "auth":
+        fail_count, cooldown_seconds = _record_auth_failure(machine)
+        machine.error_message = (
+            f"Authentication failed, retry after {cooldown_seconds}s "
+            f"(attempts: {fail_count})"
         )
-        acc_names.add(short_name)
-
-        # Use regex extraction to handle units like MiB and possible trailing 'C'
-        total_mem = _take_number(parts[2])
-        used_mem = _take_number(parts[3])
-        temp = _take_number(parts[4])
+        logger.warning(
+            f"Authentication failed to {machine.ip}, backoff {cooldown_seconds}s "
+            f"(attempts: {fail_count})"
+        )
+    else:
+        machine.error_message = f"Connection failed: {conn_error_message}"
+        logger.error(f"Connection failed to {machine.ip}: {conn_error_message}")
+    machine.last_updated = datetime.now()
+    return machine
 
-        mem_usage_percent = (used_mem / total_mem) * 100 if total_mem > 0 else 0
+def compute_hardware_fingerprint(pci_digest: str, details: list) -> str:
+    """Hashes the PCI tree digest with the accelerator inventory; changes only when hardware does."""
+    inventory = sorted(
+        f"{d.get('id')}|{d.get('name')}|{d.get('memory_total')}" for d in details
+    )
+    payload = pci_digest + "\n" + "\n".join(inventory)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
 
-        if temp > 85:
-            warning_count += 1
-            health_label = "Warning"
-        else:
-            health_label = "OK"
-            if mem_usage_percent > 10:
-                busy_count += 1
-            else:
-                idle_count += 1
-
-        details.append(
-            {
-                "id": card_id,
-                "name": name,
-                "memory_total": int(total_mem) if total_mem else 0,
-                "memory_used": int(used_mem) if used_mem else 0,
-                "temp": f"{int(temp)}C" if temp else "N/A",
-                "health": health_label,
-            }
-        )
+def check_machine(machine: Machine, connect_error: str = None) -> Machine:
+    """Checks a machine over SSH and updates its monitor fields in place.
 
-    return {
-        "accelerator_count": len(details),
-        "idle_count": idle_count,
-        "busy_count": busy_count,
-        "warning_count": warning_count,
-        "accelerator_type": ", ".join(sorted(acc_names)) if acc_names else None,
-        "accelerator_status": details
-    }
-
-def parse_huawei_output(npu_out: str) -> dict:
-    if not npu_out or "command not found" in npu_out or "HUAWEI_NOT_FOUND" in npu_out:
-        return None
-
-    idle_count = 0
-    busy_count = 0
-    warning_count = 0
-    accelerator_type = "Huawei Ascend"
-
-    # Parse model name for display
-    model_match = re.search(r"\|\s+\d+\s+((?:910|310)[A-Za-z0-9-]*)", npu_out)
-    if model_match:
-        accelerator_type = f"Ascend {model_match.group(1).strip()}"
-
-    # Parse Process Info first
-    # Map npu_id -> has_process (bool)
-    npu_has_process = {}
-    
-    # Check if Process table exists
-    process_table_start = npu_out.find("| NPU     Chip")
-    has_process_table = process_table_start != -1
-
-    if has_process_table:
-        process_lines = npu_out[process_table_start:].splitlines()
-        for line in process_lines:
-            # Match process line: | 0       0                 | 3801368       | ...
-            proc_match = re.match(r"\|\s*(\d+)\s+.*\|\s*(\d+)\s+\|", line)
-            if proc_match:
-                npu_id = int(proc_match.group(1))
-                npu_has_process[npu_id] = True
-            
-            # Match "No running processes found in NPU X"
-            no_proc_match = re.search(r"No running processes found in NPU (\d+)", line)
-            if no_proc_match:
-                npu_id = int(no_proc_match.group(1))
-                # Explicitly set to False (though default is False, this confirms we saw it)
-                if npu_id not in npu_has_process:
-                    npu_has_process[npu_id] = False
-
-    # 逐行解析每个 NPU 条目，第一行包含 id/model/health/power/temp，后续行可能包含 HBM 使用率
-    lines = npu_out.splitlines()
-    entries = []  # list of (npu_id, model, health, temp, hbm_used, hbm_total)
-
-    for idx, line in enumerate(lines):
-        # Stop if we reach the Process table
-        if "| NPU     Chip" in line:
-            break
-
-        # 匹配类似：| 0     910B2C              | OK            | 89.5        44                0    / 0             |
-        # 或：     | 1     310P3               | OK            | NA           53                0     / 0         |
-        m = re.match(r"\|\s*(\d+)\s+([A-Za-z0-9-]+)\s*\|\s*([A-Za-z]+)\s*\|\s*([A-Za-z0-9.]+)\s+(\d+)\b", line)
-        if m:
-            npu_id_str, model, health, power_str, temp_str = m.groups()
-            try:
-                npu_id = int(npu_id_str)
-                temp = int(temp_str)
-            except:
-                npu_id = int(npu_id_str) if npu_id_str.isdigit() else 0
-                temp = 0
-
-            # 在接下来的几行中查找 HBM 使用（形如 3632 / 65536 或 57356/ 65536）
-            hbm_used = 0
-            hbm_total = 0
-            candidates = []
-            # 扫描接下来的若干行，直到遇到分隔行或超过范围
-            for j in range(idx + 1, min(idx + 8, len(lines))):
-                nxt = lines[j]
-                if nxt.strip().startswith('+') or "| NPU     Chip" in nxt:
-                    break
-                matches = re.findall(r"(\d{1,6})\s*/\s*(\d{1,6})", nxt)
-                for used_s, total_s in matches:
-                    try:
-                        used_i = int(used_s)
-                        total_i = int(total_s)
-                    except:
-                        continue
-                    # 忽略完全无效的 0/0
-                    if total_i == 0:
-                        continue
-                    candidates.append((used_i, total_i))
-
-            # 优先选择 total >= 1000 的第一个匹配，否则选择 total 最大的匹配
-            chosen = None
-            for u, t in candidates:
-                if t >= 1000:
-                    chosen = (u, t)
-                    break
-            if not chosen and candidates:
-                # 选 total 最大的
-                chosen = max(candidates, key=lambda x: x[1])
-
-            if chosen:
-                hbm_used, hbm_total = chosen
-
-            entries.append((npu_id, model.strip(), health.strip(), temp, hbm_used, hbm_total))
-
-    # 统计数量
-    accelerator_count = len(entries)
-    details = []
-
-    for npu_id, model, health, temp, hbm_used, hbm_total in entries:
-        is_busy = False
-        if health.lower() in ['warning', 'critical', 'error']:
-            warning_count += 1
-            health_label = "Warning"
-        else:
-            health_label = "OK"
-            
-            if has_process_table:
-                 if npu_has_process.get(npu_id, False):
-                    busy_count += 1
-                    is_busy = True
-                 else:
-                    idle_count += 1
-            else:
-                usage_percent = (hbm_used / hbm_total * 100) if hbm_total > 0 else 0
-                if usage_percent > 5: # Threshold for busy
-                    busy_count += 1
-                    is_busy = True
-                else:
-                    idle_count += 1
-        
-        details.append({
-            "id": str(npu_id),
-            "name": model,
-            "memory_total": hbm_total,
-            "memory_used": hbm_used,
-            "temp": f"{temp}C",
-            "health": health_label
-        })
-
-    return {
-        "accelerator_count": accelerator_count,
-        "idle_count": idle_count,
-        "busy_count": busy_count,
-        "warning_count": warning_count,
-        "accelerator_type": accelerator_type,
-        "accelerator_status": details
-    }
-
-def check_machine(machine: Machine) -> Machine:
+    `connect_error` lets a caller that already found the host unreachable
+    (e.g. the asyncio engine's TCP probe) skip the SSH connect attempt.
+    """
     skip_retry, remaining_seconds, fail_count = _get_auth_backoff_info(machine)
     if skip_retry:
         machine.status = "Offline"
@@ -323,151 +152,235 @@ def check_machine(machine: Machine) -> Machine:
         machine.last_updated = datetime.now()
         return machine
 
-    client, conn_error_type, conn_error_message = _create_ssh_client_with_error(
-        machine.ip,
-        machine.port,
-        machine.username,
-        machine.password,
-    )
+    if connect_error:
+        return _apply_connection_failure(machine, "other", connect_error)
+
+    with ssh_pool.lease(machine) as conn:
+        return _check_machine_with_connection(machine, conn)
+
+def merge_accelerator_data(machine: Machine, nvidia_out: str, npu_out: str) -> list:
+    """Sets the accelerator fields from nvidia-smi and npu-smi output; returns the per-card details.
+
+    Shared by full monitor checks and streaming collection.
+    """
+    nvidia_data = parse_nvidia_output(nvidia_out)
+    huawei_data = parse_huawei_output(npu_out)
     
-    if not client:
-        machine.status = "Offline"
-        if conn_error_type == "auth":
-            fail_count, cooldown_seconds = _record_auth_failure(machine)
-            machine.error_message = (
-                f"Authentication failed, retry after {cooldown_seconds}s "
-                f"(attempts: {fail_count})"
-            )
-            logger.warning(
-                f"Authentication failed to {machine.ip}, backoff {cooldown_seconds}s "
-                f"(attempts: {fail_count})"
-            )
-        else:
-            machine.error_message = f"Connection failed: {conn_error_message}"
-            logger.error(f"Connection failed to {machine.ip}: {conn_error_message}")
-        machine.last_updated = datetime.now()
-        return machine
+    # Merge Logic
+    merged_count = 0
+    merged_idle = 0
+    merged_busy = 0
+    merged_warning = 0
+    types = []
+    details_list = []
+    
+    if nvidia_data:
+        merged_count += nvidia_data["accelerator_count"]
+        merged_idle += nvidia_data["idle_count"]
+        merged_busy += nvidia_data["busy_count"]
+        merged_warning += nvidia_data["warning_count"]
+        if nvidia_data["accelerator_type"]:
+            types.append(nvidia_data["accelerator_type"])
+        if nvidia_data["accelerator_status"]:
+            details_list.extend(nvidia_data["accelerator_status"])
+            
+    if huawei_data:
+        merged_count += huawei_data["accelerator_count"]
+        merged_idle += huawei_data["idle_count"]
+        merged_busy += huawei_data["busy_count"]
+        merged_warning += huawei_data["warning_count"]
+        if huawei_data["accelerator_type"]:
+            types.append(huawei_data["accelerator_type"])
+        if huawei_data["accelerator_status"]:
+            details_list.extend(huawei_data["accelerator_status"])
+    
+    if merged_count > 0:
+        machine.accelerator_count = merged_count
+        machine.idle_count = merged_idle
+        machine.busy_count = merged_busy
+        machine.warning_count = merged_warning
+        machine.accelerator_type = ", ".join(types)
+        machine.accelerator_status = json.dumps(details_list)
+    else:
+        # No accelerator found
+        machine.accelerator_count = 0
+        machine.idle_count = 0
+        machine.busy_count = 0
+        machine.warning_count = 0
+        machine.accelerator_type = None
+        machine.accelerator_status = None
+
+    return details_list
+
+def apply_monitor_sections(machine: Machine, parts) -> Machine:
+    """Merges the sections of MONITOR_COMMAND output into the machine and marks it Online.
+
+    Shared by the SSH check and agent reports pushed to /ingest.
+    """
+    # 1. Arch
+    arch = parts[0].strip() if len(parts) > 0 else "Unknown"
+    machine.arch = arch
+
+    # 2. OS
+    os_info = parts[1].strip() if len(parts) > 1 else "Unknown"
+    machine.os_info = os_info
+
+    # 3. Accelerators (Merge NVIDIA + Huawei)
+    nvidia_out = parts[2].strip() if len(parts) > 2 else None
+    npu_out = parts[3].strip() if len(parts) > 3 else None
+    details_list = merge_accelerator_data(machine, nvidia_out, npu_out)
+
+    # 4. Hardware fingerprint (PCI tree + accelerator inventory)
+    pci_digest = parts[4].strip() if len(parts) > 4 else None
+    if pci_digest:
+        machine.hw_fingerprint = compute_hardware_fingerprint(pci_digest, details_list)
+
+    machine.status = "Online"
+    machine.error_message = None
+    machine.last_updated = datetime.now()
+
+    return machine
+
+def _check_machine_with_connection(machine: Machine, conn) -> Machine:
+    if not conn.client:
+        return _apply_connection_failure(machine, conn.error_type, conn.error_message)
 
     _clear_auth_failure(machine)
 
     try:
-        # Combine commands to reduce SSH overhead
-        # Delimiters to separate sections
-        DELIM = "|||SECTION|||"
-        
-        cmd = (
-            f"uname -m; echo '{DELIM}';"
-            f"(grep PRETTY_NAME /etc/os-release | cut -d'=' -f2 | tr -d '\"') || uname -sr; echo '{DELIM}';"
-            f"nvidia-smi --query-gpu=index,name,memory.total,memory.used,temperature.gpu --format=csv,noheader 2>/dev/null || echo 'NVIDIA_NOT_FOUND'; echo '{DELIM}';"
-            f"npu-smi info 2>/dev/null || echo 'HUAWEI_NOT_FOUND'"
-        )
-        
-        stdout, stderr = execute_command(client, cmd)
-        
+        with poll_timings.phase(PHASE_EXECUTE):
+            stdout, stderr = conn.execute(MONITOR_COMMAND)
+    except SSHConnectionLost as e:
+        return _apply_connection_failure(machine, e.error_type, e.error_message)
+
+    try:
         # Split output by delimiter
-        parts = stdout.split(DELIM)
-        
-        # 1. Arch
-        arch = parts[0].strip() if len(parts) > 0 else "Unknown"
-        machine.arch = arch
-
-        # 2. OS
-        os_info = parts[1].strip() if len(parts) > 1 else "Unknown"
-        machine.os_info = os_info
-
-        # 3. Accelerators (Merge NVIDIA + Huawei)
-        nvidia_out = parts[2].strip() if len(parts) > 2 else None
-        npu_out = parts[3].strip() if len(parts) > 3 else None
-        
-        nvidia_data = parse_nvidia_output(nvidia_out)
-        huawei_data = parse_huawei_output(npu_out)
-        
-        # Merge Logic
-        merged_count = 0
-        merged_idle = 0
-        merged_busy = 0
-        merged_warning = 0
-        types = []
-        details_list = []
-        
-        if nvidia_data:
-            merged_count += nvidia_data["accelerator_count"]
-            merged_idle += nvidia_data["idle_count"]
-            merged_busy += nvidia_data["busy_count"]
-            merged_warning += nvidia_data["warning_count"]
-            if nvidia_data["accelerator_type"]:
-                types.append(nvidia_data["accelerator_type"])
-            if nvidia_data["accelerator_status"]:
-                details_list.extend(nvidia_data["accelerator_status"])
-                
-        if huawei_data:
-            merged_count += huawei_data["accelerator_count"]
-            merged_idle += huawei_data["idle_count"]
-            merged_busy += huawei_data["busy_count"]
-            merged_warning += huawei_data["warning_count"]
-            if huawei_data["accelerator_type"]:
-                types.append(huawei_data["accelerator_type"])
-            if huawei_data["accelerator_status"]:
-                details_list.extend(huawei_data["accelerator_status"])
-        
-        if merged_count > 0:
-            machine.accelerator_count = merged_count
-            machine.idle_count = merged_idle
-            machine.busy_count = merged_busy
-            machine.warning_count = merged_warning
-            machine.accelerator_type = ", ".join(types)
-            machine.accelerator_status = json.dumps(details_list)
-        else:
-            # No accelerator found
-            machine.accelerator_count = 0
-            machine.idle_count = 0
-            machine.busy_count = 0
-            machine.warning_count = 0
-            machine.accelerator_type = None
-            machine.accelerator_status = None
-
-        machine.status = "Online"
-        machine.error_message = None
-        machine.last_updated = datetime.now()
+        with poll_timings.phase(PHASE_PARSE):
+            parts = stdout.split(MONITOR_SECTION_DELIM)
+            apply_monitor_sections(machine, parts)
 
     except Exception as e:
         machine.status = "Error"
         machine.error_message = str(e)
         logger.error(f"Error checking machine {machine.ip}: {e}")
-    finally:
-        if client:
-            client.close()
             
     return machine
 
-def update_single_machine_sync(machine_id: int):
-    # Avoid circular import
-    from services.topo_service import trigger_topo_update_async
+_polling_lock = threading.Lock()
+_polling_keys = set()
+
+def is_polling(machine: Machine) -> bool:
+    with _polling_lock:
+        return _machine_key(machine) in _polling_keys
+
+def poll_machine(machine: Machine, writer: MachineResultWriter, connect_error: str = None, queued_ts: float = None) -> bool:
+    """Checks a detached machine and hands the result to the cycle's batched writer.
+
+    Returns False without polling if another poll of the same machine is still running.
+    Callers leave out machines a push agent reported recently (agent_presence.fresh_ids
+    once per cycle). `queued_ts` is when the engine accepted the poll, for queue wait timing.
+    """
+    key = _machine_key(machine)
+    with _polling_lock:
+        if key in _polling_keys:
+            logger.warning(f"Skipping poll of {machine.ip}: previous poll still running")
+            return False
+        _polling_keys.add(key)
+
+    timing = poll_timings.begin_host(machine, queued_ts)
+    try:
+        polled_ts = time.time()
+        before = capture_monitor_fields(machine)
+        check_machine(machine, connect_error=connect_error)
+        adaptive_intervals.observe(machine, polled_ts)
+        telemetry_store.record(machine)
+        writer.add(machine, before)
+    finally:
+        poll_timings.end_host(timing, machine.status)
+        with _polling_lock:
+            _polling_keys.discard(key)
+    return True
 
+def update_single_machine_sync(machine_id: int, connect_error: str = None):
     with Session(engine) as session:
         machine = session.get(Machine, machine_id)
-        if machine:
-            old_status = machine.status
-            check_machine(machine)
-            session.add(machine)
-            session.commit()
-            session.refresh(machine)
-            
-            # Trigger Topo Update if status changed to Online
-            # or if it's the first successful check (Unknown -> Online)
-            if machine.status == "Online" and old_status != "Online":
-                logger.info(f"Triggering topo update for {machine.ip} (Status: {old_status} -> {machine.status})")
-                trigger_topo_update_async(machine.id)
+    if machine:
+        with MachineResultWriter() as writer:
+            poll_machine(machine, writer, connect_error=connect_error)
+
+def get_poll_settings() -> Settings:
+    with Session(engine) as session:
+        settings = session.exec(select(Settings)).first()
+    return settings or Settings()
+
+def poll_machines(machines, settings: Settings = None) -> MachineResultWriter:
+    """Polls the given machines with the configured engine and writes results in batches."""
+    settings = settings or get_poll_settings()
+    with poll_timings.phase(PHASE_CYCLE, attribute=False), MachineResultWriter() as writer:
+        if settings.poll_engine == POLL_ENGINE_ASYNCIO:
+            # Avoid circular import
+            from services.async_poller import run_async_poll_cycle
+            run_async_poll_cycle(machines, writer, settings.poll_concurrency)
+        else:
+            # Use ThreadPoolExecutor for parallel execution
+            # Limit max_workers to avoid too many SSH connections at once
+            queued_ts = time.time()
+            with ThreadPoolExecutor(max_workers=10) as executor:
+                executor.map(lambda m: poll_machine(m, writer, queued_ts=queued_ts), machines)
+
+    telemetry_store.flush()
+    return writer
+
+def check_new_machines(machine_ids):
+    """Initial check for freshly imported machines through the bounded poller."""
+    machine_ids = list(machine_ids)
+    machines = []
+    with Session(engine) as session:
+        # Chunked to stay under SQLite's bound parameter limit
+        for i in range(0, len(machine_ids), 500):
+            chunk = machine_ids[i:i + 500]
+            machines.extend(session.exec(select(Machine).where(Machine.id.in_(chunk))).all())
+    if machines:
+        writer = poll_machines(machines)
+        logger.info(f"Initial check finished for {len(machines)} imported machines ({writer.changed_count} changed)")
 
 def update_all_machines():
+    """One burst poll cycle over the machines this instance owns."""
     # Check for log rotation first
     check_log_rotation()
 
+    settings = get_poll_settings()
+
+    # Load every machine once per cycle; results are written back in batches
     with Session(engine) as session:
         machines = session.exec(select(Machine)).all()
-        machine_ids = [m.id for m in machines]
-    
-    # Use ThreadPoolExecutor for parallel execution
-    # Limit max_workers to avoid too many SSH connections at once
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        executor.map(update_single_machine_sync, machine_ids)
+    # With several instances, each polls the machines the cluster ring assigns to it
+    total = len(machines)
+    machines = [m for m in machines if cluster.owns(m.id)]
+
+    # Skip machines whose adaptive interval has not elapsed (e.g. unreachable hosts in backoff).
+    # Half an interval of slack absorbs the drift between cycle start and each poll's start.
+    now_ts = time.time()
+    interval = max(1, settings.interval_seconds)
+    # Machines with a live push agent are not pulled over SSH.
+    pushed_ids = agent_presence.fresh_ids(now_ts) & {m.id for m in machines}
+    # Avoid circular import
+    from services.stream_collector import stream_collector, STREAM_FULL_POLL_INTERVALS
+    # A live stream already reports accelerators and liveness; the full poll only refreshes the rest
+    streaming_ids = {m.id for m in machines if stream_collector.is_streaming(m.id)}
+    due = [
+        m for m in machines
+        if m.id not in pushed_ids and adaptive_intervals.is_due(
+            m, interval * (STREAM_FULL_POLL_INTERVALS if m.id in streaming_ids else 1), now_ts, slack=interval / 2
+        )
+    ]
+
+    writer = poll_machines(due, settings)
+
+    logger.info(
+        f"Poll cycle written: {writer.changed_count} changed, "
+        f"{writer.heartbeat_count} heartbeat-only of {len(due)} polled "
+        f"({len(pushed_ids)} reported by agents, "
+        f"{len(machines) - len(due) - len(pushed_ids)} deferred by adaptive interval or live stream, "
+        f"{total - len(machines)} polled by other instances)"
+    )
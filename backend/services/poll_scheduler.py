@@ -0,0 +1,265 @@
+import math
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlmodel import Session, select
+
+from models import Machine, Settings, POLL_ENGINE_ASYNCIO, SCHEDULE_MODE_STAGGERED, MAX_POLL_CONCURRENCY
+from logger import logger
+from database import engine
+from scheduler import scheduler
+from services.monitor_service import poll_machine, get_poll_settings, update_all_machines
+from services.result_writer import MachineResultWriter
+from services.telemetry_store import telemetry_store
+from services.adaptive_interval import adaptive_intervals
+from services.agent_presence import agent_presence
+from services.cluster import cluster
+from services.stream_collector import stream_collector, STREAM_FULL_POLL_INTERVALS
+
+TICK_SECONDS = 1
+THREAD_ENGINE_WORKERS = 10
+TELEMETRY_FLUSH_SECONDS = 10
+MACHINE_QUERY_CHUNK = 500
+
+def slot_offset(machine_id: int, interval: float) -> float:
+    """Fixed position of a machine inside the interval, derived from a hash of its id."""
+    return (zlib.crc32(str(machine_id).encode()) % 1000000) / 1000000 * interval
+
+def next_slot(offset: float, interval: float, after_ts: float) -> float:
+    """First time strictly after `after_ts` that falls on the machine's slot."""
+    return offset + (math.floor((after_ts - offset) / interval) + 1) * interval
+
+class _LagWindow:
+    def __init__(self, start_ts: float):
+        self.start_ts = start_ts
+        self.polled = 0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+        self.overruns = 0
+
+    def record(self, lag: float):
+        self.polled += 1
+        self.lag_total += lag
+        self.lag_max = max(self.lag_max, lag)
+
+    def report(self, end_ts: float) -> dict:
+        return {
+            "start_ts": int(self.start_ts),
+            "duration_seconds": round(end_ts - self.start_ts, 1),
+            "polled": self.polled,
+            "lag_avg_seconds": round(self.lag_total / self.polled, 3) if self.polled else 0.0,
+            "lag_max_seconds": round(self.lag_max, 3),
+            "overruns": self.overruns,
+        }
+
+class StaggeredPollScheduler:
+    """Spreads machine polls evenly over the interval instead of one burst per cycle.
+
+    Each machine owns a time slot derived from a hash of its id. A one-second
+    tick dispatches the machines whose slot has passed to a bounded worker pool.
+    A machine whose previous poll is still running is skipped for that slot
+    (counted as an overrun) rather than queued, so polls never pile up.
+    Lag is the delay between a slot and its dispatch.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tick_lock = threading.Lock()
+        self._next_due = {}
+        self._in_flight = set()
+        self._interval = None
+        self._executor = None
+        self._workers = 0
+        self._writer = MachineResultWriter()
+        self._last_telemetry_flush = 0.0
+        self._last_tick_ts = 0.0
+        self._window = _LagWindow(time.time())
+        self._last_cycle = None
+
+    def tick(self):
+        # APScheduler already limits the job to one instance; this also covers manual calls
+        if not self._tick_lock.acquire(blocking=False):
+            return
+        try:
+            self._tick()
+        except Exception as e:
+            logger.error(f"Staggered poll tick failed: {e}")
+        finally:
+            self._tick_lock.release()
+
+    def _tick(self):
+        settings = get_poll_settings()
+        interval = max(1, settings.interval_seconds)
+        now = time.time()
+
+        # Results of polls finished since the previous tick
+        self._writer.flush()
+        if now - self._last_telemetry_flush >= TELEMETRY_FLUSH_SECONDS:
+            telemetry_store.flush()
+            self._last_telemetry_flush = now
+
+        with Session(engine) as session:
+            machine_ids = session.exec(select(Machine.id)).all()
+        # Machines another instance owns drop out of _next_due below, and get a fresh slot if they come back
+        machine_ids = [machine_id for machine_id in machine_ids if cluster.owns(machine_id)]
+        # Machines with a live push agent keep their slot but are not pulled over SSH
+        pushed_ids = agent_presence.fresh_ids(now)
+
+        due = []
+        with self._lock:
+            # Slots are reassigned after an interval change or a pause (e.g. time spent in burst mode),
+            # otherwise every stale slot would fire in the same tick
+            if interval != self._interval or now - self._last_tick_ts > interval:
+                self._next_due.clear()
+                self._interval = interval
+            self._last_tick_ts = now
+
+            known = set(machine_ids)
+            for machine_id in [m for m in self._next_due if m not in known]:
+                del self._next_due[machine_id]
+
+            for machine_id in machine_ids:
+                due_ts = self._next_due.get(machine_id)
+                if due_ts is not None and due_ts > now:
+                    continue
+                # Always advance to a future slot, so a late or skipped poll never builds a backlog
+                self._next_due[machine_id] = next_slot(slot_offset(machine_id, interval), interval, now)
+                if due_ts is None:
+                    # Newly seen machine: wait for its own slot
+                    continue
+                if machine_id in pushed_ids:
+                    continue
+                if machine_id in self._in_flight:
+                    self._window.overruns += 1
+                    continue
+                self._window.record(now - due_ts)
+                self._in_flight.add(machine_id)
+                due.append(machine_id)
+
+            if now - self._window.start_ts >= interval:
+                self._rotate_window(now)
+
+        if due:
+            self._dispatch(due, settings)
+
+    def _rotate_window(self, now: float):
+        report = self._window.report(now)
+        report["in_flight"] = len(self._in_flight)
+        self._last_cycle = report
+        self._window = _LagWindow(now)
+        logger.info(
+            f"Staggered poll cycle: {report['polled']} polled in {report['duration_seconds']}s, "
+            f"lag avg {report['lag_avg_seconds']}s max {report['lag_max_seconds']}s, "
+            f"{report['overruns']} overruns, {report['in_flight']} in flight"
+        )
+
+    def _dispatch(self, machine_ids, settings: Settings):
+        machines = []
+        try:
+            with Session(engine) as session:
+                # Chunked to stay under SQLite's bound parameter limit
+                for i in range(0, len(machine_ids), MACHINE_QUERY_CHUNK):
+                    chunk = machine_ids[i:i + MACHINE_QUERY_CHUNK]
+                    machines.extend(session.exec(select(Machine).where(Machine.id.in_(chunk))).all())
+        finally:
+            # Machines deleted since the id scan
+            loaded = {machine.id for machine in machines}
+            with self._lock:
+                self._in_flight.difference_update(set(machine_ids) - loaded)
+
+        executor = self._ensure_executor(settings)
+        for machine in machines:
+            executor.submit(self._poll, machine, time.time())
+
+    def _poll(self, machine: Machine, queued_ts: float):
+        started_ts = time.time()
+        try:
+            if poll_machine(machine, self._writer, queued_ts=queued_ts):
+                self._apply_adaptive_interval(machine, started_ts)
+        except Exception as e:
+            logger.error(f"Staggered poll failed for {machine.ip}: {e}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(machine.id)
+
+    def _apply_adaptive_interval(self, machine: Machine, started_ts: float):
+        # Machines at the normal cadence keep their hash slot; others are rescheduled from this poll
+        with self._lock:
+            interval = self._interval
+        if not interval:
+            return
+        if stream_collector.is_streaming(machine.id):
+            # A live stream reports accelerators in between
+            effective = adaptive_intervals.effective_interval(machine, interval * STREAM_FULL_POLL_INTERVALS)
+        else:
+            effective = adaptive_intervals.effective_interval(machine, interval)
+        if effective != interval:
+            with self._lock:
+                if machine.id in self._next_due:
+                    self._next_due[machine.id] = started_ts + effective
+
+    def _ensure_executor(self, settings: Settings) -> ThreadPoolExecutor:
+        if settings.poll_engine == POLL_ENGINE_ASYNCIO:
+            workers = max(1, min(int(settings.poll_concurrency or 1), MAX_POLL_CONCURRENCY))
+        else:
+            workers = THREAD_ENGINE_WORKERS
+        if self._executor is None or workers != self._workers:
+            old = self._executor
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="staggered-poll")
+            self._workers = workers
+            if old:
+                # Running polls finish on the old pool
+                old.shutdown(wait=False)
+        return self._executor
+
+    def stop(self):
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            self._workers = 0
+        with self._lock:
+            # Cancelled polls never reached their cleanup
+            self._in_flight.clear()
+        self._writer.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "interval_seconds": self._interval,
+                "machines": len(self._next_due),
+                "in_flight": len(self._in_flight),
+                "workers": self._workers,
+                "adaptive": adaptive_intervals.stats(),
+                "current_cycle": self._window.report(time.time()),
+                "last_cycle": self._last_cycle,
+            }
+
+staggered_poll_scheduler = StaggeredPollScheduler()
+
+# Schedule mode and interval `monitor_job` was last installed with
+_applied_schedule = {"key": None}
+
+def apply_poll_schedule(settings: Settings = None):
+    """Installs `monitor_job` for the configured schedule mode, replacing any existing one."""
+    settings = settings or get_poll_settings()
+    _applied_schedule["key"] = (settings.schedule_mode, settings.interval_seconds)
+    if settings.schedule_mode == SCHEDULE_MODE_STAGGERED:
+        func, seconds = staggered_poll_scheduler.tick, TICK_SECONDS
+    else:
+        func, seconds = update_all_machines, max(1, settings.interval_seconds)
+        if staggered_poll_scheduler.stats()["workers"]:
+            # Leaving staggered mode: let running polls finish and write their results
+            threading.Thread(target=staggered_poll_scheduler.stop, daemon=True).start()
+    scheduler.add_job(
+        func, 'interval', seconds=seconds, id='monitor_job',
+        replace_existing=True, max_instances=1, coalesce=True,
+    )
+    logger.info(f"Poll schedule: {settings.schedule_mode}, interval {settings.interval_seconds}s")
+
+def sync_poll_schedule():
+    """Reinstalls `monitor_job` when another instance changed the schedule settings."""
+    settings = get_poll_settings()
+    if _applied_schedule["key"] != (settings.schedule_mode, settings.interval_seconds):
+        apply_poll_schedule(settings)
@@ -0,0 +1,193 @@
+import bisect
+import heapq
+import threading
+import time
+
+# Histogram bucket upper bounds in seconds: 1ms doubling up to ~131s, plus an overflow bucket
+BUCKET_BOUNDS = tuple(0.001 * 2 ** i for i in range(18))
+PERCENTILES = (0.5, 0.95, 0.99)
+SLOWEST_HOSTS = 10
+
+# Phases of one poll, in pipeline order
+PHASE_QUEUE_WAIT = "queue_wait"  # submitted to the engine until the poll started
+PHASE_PROBE = "probe"  # asyncio engine TCP reachability probe
+PHASE_CONNECT = "connect"  # SSH handshake and authentication for a new pooled connection
+PHASE_EXECUTE = "execute"  # MONITOR_COMMAND round trip
+PHASE_PARSE = "parse"  # smi parsing and merge into the machine
+PHASE_POLL = "poll"  # whole poll of one host
+PHASE_WRITE = "write"  # one batched result transaction (not attributed to a host)
+PHASE_CYCLE = "cycle"  # one burst poll cycle over all due machines
+PHASES = (
+    PHASE_QUEUE_WAIT,
+    PHASE_PROBE,
+    PHASE_CONNECT,
+    PHASE_EXECUTE,
+    PHASE_PARSE,
+    PHASE_POLL,
+    PHASE_WRITE,
+    PHASE_CYCLE,
+)
+
+class LatencyHistogram:
+    """Fixed log-scale buckets; percentiles are interpolated within the bucket."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                lower = BUCKET_BOUNDS[index - 1] if index else 0.0
+                upper = BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else self.max
+                fraction = (rank - cumulative) / bucket_count
+                return min(lower + (upper - lower) * fraction, self.max)
+            cumulative += bucket_count
+        return self.max
+
+    def summary(self) -> dict:
+        result = {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 2) if self.count else None,
+            "max_ms": round(self.max * 1000, 2) if self.count else None,
+        }
+        for q in PERCENTILES:
+            value = self.percentile(q)
+            result[f"p{int(q * 100)}_ms"] = round(value * 1000, 2) if value is not None else None
+        return result
+
+class _Phase:
+    __slots__ = ("_timings", "_name", "_attribute", "_start")
+
+    def __init__(self, timings, name: str, attribute: bool):
+        self._timings = timings
+        self._name = name
+        self._attribute = attribute
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._timings.observe(self._name, time.perf_counter() - self._start, self._attribute)
+        return False
+
+class _NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_PHASE = _NullPhase()
+
+class _HostRecord:
+    __slots__ = ("machine_id", "ip", "phases", "start")
+
+    def __init__(self, machine_id, ip):
+        self.machine_id = machine_id
+        self.ip = ip
+        self.phases = {}
+        self.start = time.perf_counter()
+
+class PollTimings:
+    """Per-phase latency histograms and the latest per-host breakdown of the poll pipeline.
+
+    Phases inside a `host()` block on the same thread are attributed to that
+    host. Cost per phase is two perf_counter calls and a short lock; with
+    `enabled` off, phase() returns a shared no-op context.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._histograms = {phase: LatencyHistogram() for phase in PHASES}
+        self._hosts = {}
+        self._since_ts = time.time()
+
+    def phase(self, name: str, attribute: bool = True):
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self, name, attribute)
+
+    def observe(self, name: str, seconds: float, attribute: bool = True):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = LatencyHistogram()
+            histogram.observe(seconds)
+        if attribute:
+            record = getattr(self._local, "record", None)
+            if record is not None:
+                record.phases[name] = record.phases.get(name, 0.0) + seconds
+
+    def begin_host(self, machine, queued_ts: float = None):
+        """Starts attributing phases on this thread to `machine`; returns a token for end_host."""
+        if not self.enabled:
+            return None
+        record = _HostRecord(machine.id, machine.ip)
+        self._local.record = record
+        if queued_ts is not None:
+            self.observe(PHASE_QUEUE_WAIT, max(0.0, time.time() - queued_ts))
+        return record
+
+    def end_host(self, record, status: str = None):
+        if record is None:
+            return
+        self._local.record = None
+        total = time.perf_counter() - record.start
+        self.observe(PHASE_POLL, total, attribute=False)
+        entry = {
+            "machine_id": record.machine_id,
+            "ip": record.ip,
+            "status": status,
+            "ts": time.time(),
+            "total_ms": round(total * 1000, 2),
+            "phases_ms": {name: round(seconds * 1000, 2) for name, seconds in record.phases.items()},
+        }
+        with self._lock:
+            self._hosts[record.machine_id] = entry
+
+    def forget(self, machine_id: int):
+        with self._lock:
+            self._hosts.pop(machine_id, None)
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {phase: LatencyHistogram() for phase in PHASES}
+            self._hosts = {}
+            self._since_ts = time.time()
+
+    def report(self, slowest: int = SLOWEST_HOSTS) -> dict:
+        with self._lock:
+            phases = {name: histogram.summary() for name, histogram in self._histograms.items()}
+            hosts = list(self._hosts.values())
+            since_ts = self._since_ts
+        return {
+            "enabled": self.enabled,
+            "since": since_ts,
+            "phases": phases,
+            "slowest_hosts": heapq.nlargest(slowest, hosts, key=lambda h: h["total_ms"]),
+        }
+
+    def host_record(self, machine_id: int) -> dict:
+        with self._lock:
+            return self._hosts.get(machine_id)
+
+poll_timings = PollTimings()
@@ -0,0 +1,247 @@
+import json
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlmodel import Session
+
+from models import Machine, RefreshJob
+from logger import logger
+from database import engine
+from services.machine_events import machine_events, machine_event_payload
+from services.monitor_service import poll_machine, update_all_machines
+from services.result_writer import MachineResultWriter
+from services.topo_service import trigger_topo_update_async, update_all_machines_topo, TOPO_PRIORITY_USER
+from services.cluster import cluster
+from services.agent_presence import agent_presence
+
+REFRESH_WORKERS = 4
+# Finished jobs stay queryable for this long, and at most MAX_FINISHED_JOBS are kept
+JOB_RETENTION_SECONDS = 600
+MAX_FINISHED_JOBS = 1000
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+ACTIVE_STATES = (JOB_QUEUED, JOB_RUNNING)
+
+# Dedupe key of the fleet-wide refresh
+REFRESH_ALL_KEY = "all"
+# Event asking every instance to refresh the machines it owns, shared through the change feed
+REFRESH_ALL_EVENT = "refresh_all"
+
+def _job_dict(row) -> dict:
+    return {
+        "job_id": row.id,
+        "kind": "machine" if row.machine_id is not None else REFRESH_ALL_KEY,
+        "machine_id": row.machine_id,
+        "force_topo": bool(row.force_topo),
+        "state": row.state,
+        "requests": row.requests,
+        "created_ts": row.created_ts,
+        "started_ts": row.started_ts,
+        "finished_ts": row.finished_ts,
+        "result": json.loads(row.result) if row.result else None,
+        "error": row.error,
+    }
+
+class RefreshJobQueue:
+    """Runs manual refreshes in the background, one active job per machine (or fleet).
+
+    Jobs are rows of refresh_job, so any instance can report a job queued on
+    another one and a job id survives restarts. Submitting while a job for
+    the same target is queued or running returns that job instead of
+    starting another SSH session; a force_topo request that joins upgrades
+    it, as long as it has not finished polling. Active jobs whose instance
+    stopped are reported as failed.
+
+    A fleet-wide refresh polls this instance's partition and publishes
+    REFRESH_ALL_EVENT; the other instances receive it through the change
+    feed and refresh their own partitions, so no machine is polled twice.
+    """
+
+    def __init__(self, workers: int = REFRESH_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="refresh-job")
+        self._lock = threading.Lock()
+        self._partition_pending = False
+        self.submitted = 0
+        self.coalesced = 0
+
+    def submit_machine(self, machine_id: int, force_topo: bool = False) -> tuple:
+        return self._submit(str(machine_id), machine_id, force_topo, self._run_machine)
+
+    def submit_all(self, force_topo: bool = False) -> tuple:
+        return self._submit(REFRESH_ALL_KEY, None, force_topo, self._run_all)
+
+    def _submit(self, target, machine_id, force_topo, run) -> tuple:
+        """Returns (job dict, coalesced)."""
+        table = RefreshJob.__table__
+        now = time.time()
+        with engine.begin() as conn:
+            # Serializes submissions of all instances, so two cannot both start a job
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            self._prune(conn, now)
+            active = conn.execute(
+                select(table).where(table.c.target == target).where(table.c.state.in_(ACTIVE_STATES))
+            ).first()
+            if active is not None and not self._orphaned(conn, active, now):
+                conn.execute(
+                    update(table)
+                    .where(table.c.id == active.id)
+                    .values(requests=active.requests + 1, force_topo=bool(active.force_topo) or force_topo)
+                )
+                row = conn.execute(select(table).where(table.c.id == active.id)).first()
+                with self._lock:
+                    self.coalesced += 1
+                return _job_dict(row), True
+
+            job_id = secrets.token_hex(8)
+            conn.execute(insert(table).values(
+                id=job_id,
+                target=target,
+                machine_id=machine_id,
+                force_topo=force_topo,
+                state=JOB_QUEUED,
+                owner=cluster.instance_id,
+                requests=1,
+                created_ts=now,
+            ))
+            row = conn.execute(select(table).where(table.c.id == job_id)).first()
+        with self._lock:
+            self.submitted += 1
+        self._executor.submit(self._run, job_id, run)
+        return _job_dict(row), False
+
+    def get(self, job_id: str) -> dict:
+        table = RefreshJob.__table__
+        with engine.begin() as conn:
+            row = conn.execute(select(table).where(table.c.id == job_id)).first()
+            if row is not None and row.state in ACTIVE_STATES and self._orphaned(conn, row, time.time()):
+                row = conn.execute(select(table).where(table.c.id == job_id)).first()
+        return _job_dict(row) if row is not None else None
+
+    def _orphaned(self, conn, row, now: float) -> bool:
+        """Marks an active job failed if the instance running it is gone; returns whether it did."""
+        if cluster.is_alive(row.owner):
+            return False
+        table = RefreshJob.__table__
+        conn.execute(
+            update(table)
+            .where(table.c.id == row.id)
+            .where(table.c.state.in_(ACTIVE_STATES))
+            .values(state=JOB_FAILED, finished_ts=now, error="The instance running this job stopped")
+        )
+        return True
+
+    def _set(self, job_id: str, **values):
+        table = RefreshJob.__table__
+        with engine.begin() as conn:
+            conn.execute(update(table).where(table.c.id == job_id).values(**values))
+
+    def _run(self, job_id: str, run):
+        self._set(job_id, state=JOB_RUNNING, started_ts=time.time())
+        try:
+            result = run(job_id)
+        except Exception as e:
+            self._set(job_id, state=JOB_FAILED, finished_ts=time.time(), error=str(e))
+            logger.error(f"Refresh job {job_id} failed: {e}")
+            return
+        self._set(job_id, state=JOB_DONE, finished_ts=time.time(), result=json.dumps(result, default=str))
+
+    def _force_topo(self, job_id: str) -> bool:
+        # Read late: a request that joined while the poll ran may have asked for it
+        table = RefreshJob.__table__
+        with engine.connect() as conn:
+            return bool(conn.execute(select(table.c.force_topo).where(table.c.id == job_id)).scalar())
+
+    def _run_machine(self, job_id: str) -> dict:
+        table = RefreshJob.__table__
+        with engine.connect() as conn:
+            machine_id = conn.execute(select(table.c.machine_id).where(table.c.id == job_id)).scalar()
+        with Session(engine) as session:
+            machine = session.get(Machine, machine_id)
+        if not machine:
+            raise LookupError("Machine not found")
+
+        # Reported by its push agent; SSH is only the fallback
+        polled = False
+        if not agent_presence.is_fresh(machine.id):
+            with MachineResultWriter() as writer:
+                # False while a scheduled poll of this host is running
+                polled = poll_machine(machine, writer)
+        result = {"polled": polled, "machine": machine_event_payload(machine) if polled else None}
+
+        # The writer already triggers topo on Online transitions and hardware changes. A forced
+        # refresh is queued even without a poll, from the status the agent or the last poll stored
+        if self._force_topo(job_id):
+            result["topo_queued"] = machine.status == "Online" and trigger_topo_update_async(
+                machine.id, force=True, priority=TOPO_PRIORITY_USER
+            ) != "dropped"
+        return result
+
+    def _run_all(self, job_id: str) -> dict:
+        # The other instances refresh the machines they own when this event reaches them
+        machine_events.publish(REFRESH_ALL_EVENT, {"origin": cluster.instance_id, "force_topo": self._force_topo(job_id)})
+        update_all_machines()
+        # Global topo update only regenerates machines whose hardware changed, unless forced
+        return {"polled": True, "topo_queued": update_all_machines_topo(self._force_topo(job_id))}
+
+    def on_event(self, event_type: str, data: dict):
+        """Starts a refresh of this instance's partition when another instance runs a fleet-wide one."""
+        if event_type != REFRESH_ALL_EVENT or data.get("origin") == cluster.instance_id:
+            return
+        with self._lock:
+            # One pending partition refresh covers every request that arrives before it starts
+            if self._partition_pending:
+                return
+            self._partition_pending = True
+        self._executor.submit(self._refresh_partition, bool(data.get("force_topo")))
+
+    def _refresh_partition(self, force_topo: bool):
+        with self._lock:
+            self._partition_pending = False
+        try:
+            update_all_machines()
+            update_all_machines_topo(force_topo)
+        except Exception as e:
+            logger.error(f"Partition refresh failed: {e}")
+
+    def _prune(self, conn, now: float):
+        table = RefreshJob.__table__
+        conn.execute(delete(table).where(table.c.finished_ts < now - JOB_RETENTION_SECONDS))
+        finished = conn.execute(select(func.count()).select_from(table).where(table.c.finished_ts.is_not(None))).scalar()
+        if finished > MAX_FINISHED_JOBS:
+            oldest = (
+                select(table.c.id)
+                .where(table.c.finished_ts.is_not(None))
+                .order_by(table.c.finished_ts)
+                .limit(finished - MAX_FINISHED_JOBS)
+            )
+            conn.execute(delete(table).where(table.c.id.in_(oldest)))
+
+    def stats(self) -> dict:
+        table = RefreshJob.__table__
+        with engine.connect() as conn:
+            states = dict(conn.execute(select(table.c.state, func.count()).group_by(table.c.state)).all())
+        with self._lock:
+            return {"jobs": states, "submitted": self.submitted, "coalesced": self.coalesced}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        # Jobs this instance will not run any more; pollers see them fail instead of waiting forever
+        table = RefreshJob.__table__
+        try:
+            with engine.begin() as conn:
+                conn.execute(
+                    update(table)
+                    .where(table.c.owner == cluster.instance_id)
+                    .where(table.c.state.in_(ACTIVE_STATES))
+                    .values(state=JOB_FAILED, finished_ts=time.time(), error="Server stopped before the job finished")
+                )
+        except Exception as e:
+            logger.error(f"Failed to mark unfinished refresh jobs: {e}")
+
+refresh_jobs = RefreshJobQueue()
@@ -0,0 +1,179 @@
+import threading
+from datetime import datetime
+
+from sqlalchemy import bindparam, select, update
+
+from models import Machine
+from logger import logger
+from database import engine
+from services.machine_events import machine_events
+from services.agent_presence import agent_presence
+from services.poll_timing import poll_timings, PHASE_WRITE
+
+# Columns written by check_machine; last_updated is the heartbeat and handled separately
+MONITOR_FIELDS = (
+    "status",
+    "os_info",
+    "arch",
+    "accelerator_type",
+    "accelerator_count",
+    "idle_count",
+    "busy_count",
+    "warning_count",
+    "accelerator_status",
+    "error_message",
+    "hw_fingerprint",
+)
+
+# Written whenever a result carries them, so a poll's outcome always lands
+STATUS_FIELDS = ("status", "error_message")
+
+WRITE_BATCH_SIZE = 100
+
+def capture_monitor_fields(machine: Machine) -> dict:
+    return {field: getattr(machine, field) for field in MONITOR_FIELDS}
+
+class MachineResult:
+    def __init__(self, machine: Machine, before: dict, agent_report: dict = None):
+        self.machine_id = machine.id
+        self.agent_report = agent_report
+        self.ip = machine.ip
+        self.old_status = before.get("status")
+        self.new_status = machine.status
+        self.last_updated = machine.last_updated or datetime.now()
+        # Fields this result vouches for: all of them after a successful check,
+        # otherwise the status and whatever the check changed. The rest still
+        # hold the values loaded before the poll, which may be stale by now.
+        self.values = {
+            field: getattr(machine, field)
+            for field in MONITOR_FIELDS
+            if machine.status == "Online" or field in STATUS_FIELDS or getattr(machine, field) != before.get(field)
+        }
+        self.changes = {}
+
+    def diff(self, current: dict):
+        """Keeps the values that differ from the row as it is at write time."""
+        self.old_status = current.get("status")
+        self.changes = {field: value for field, value in self.values.items() if value != current.get(field)}
+
+class MachineResultWriter:
+    """Collects poll results and writes them in batched transactions.
+
+    Results are compared with the rows read inside the write transaction,
+    not with the state loaded before the poll, so a value another writer
+    committed meanwhile is overwritten when this result disagrees. Only
+    columns whose value differs are updated; machines where nothing but
+    the heartbeat changed share a single `last_updated` UPDATE per batch.
+    Deleted machines are skipped.
+    """
+
+    def __init__(self, batch_size: int = WRITE_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._pending = []
+        self.changed_count = 0
+        self.heartbeat_count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+    def add(self, machine: Machine, before: dict, agent_report: dict = None):
+        """Queues a poll result.
+
+        `agent_report` is an agent_presence entry, stored in the same transaction.
+        """
+        if machine.id is None:
+            return
+        result = MachineResult(machine, before, agent_report)
+        with self._lock:
+            self._pending.append(result)
+            if len(self._pending) < self.batch_size:
+                return
+            batch, self._pending = self._pending, []
+        self._write(batch)
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if batch:
+            self._write(batch)
+
+    def _write(self, batch):
+        table = Machine.__table__
+        columns = [table.c.id] + [table.c[field] for field in MONITOR_FIELDS]
+
+        with self._write_lock:
+            try:
+                with poll_timings.phase(PHASE_WRITE, attribute=False), engine.begin() as conn:
+                    # Take the write lock before reading, so the rows cannot change until commit
+                    conn.exec_driver_sql("BEGIN IMMEDIATE")
+                    current = {
+                        row.id: row._mapping
+                        for row in conn.execute(select(*columns).where(table.c.id.in_([r.machine_id for r in batch])))
+                    }
+                    batch = [r for r in batch if r.machine_id in current]
+                    for result in batch:
+                        result.diff(current[result.machine_id])
+                    changed = [r for r in batch if r.changes]
+                    heartbeat_ids = [r.machine_id for r in batch if not r.changes]
+
+                    # Group changed rows by column set so each group is one executemany
+                    groups = {}
+                    for result in changed:
+                        groups.setdefault(tuple(sorted(result.changes)), []).append(result)
+
+                    for group_columns, results in groups.items():
+                        values = {column: bindparam(f"v_{column}") for column in group_columns}
+                        values["last_updated"] = bindparam("v_last_updated")
+                        stmt = update(table).where(table.c.id == bindparam("v_id")).values(values)
+                        conn.execute(stmt, [
+                            {
+                                "v_id": r.machine_id,
+                                "v_last_updated": r.last_updated,
+                                **{f"v_{column}": r.changes[column] for column in group_columns},
+                            }
+                            for r in results
+                        ])
+
+                    if heartbeat_ids:
+                        heartbeat_ts = max(r.last_updated for r in batch if not r.changes)
+                        conn.execute(
+                            update(table).where(table.c.id.in_(heartbeat_ids)).values(last_updated=heartbeat_ts)
+                        )
+
+                    agent_presence.write(conn, [r.agent_report for r in batch if r.agent_report])
+            except Exception as e:
+                logger.error(f"Failed to write poll results for {len(batch)} machines: {e}")
+                return
+
+            self.changed_count += len(changed)
+            self.heartbeat_count += len(heartbeat_ids)
+
+        self._after_commit(changed, heartbeat_ids, batch)
+
+    def _after_commit(self, changed, heartbeat_ids, batch):
+        # Avoid circular import
+        from services.topo_service import trigger_topo_update_async
+
+        # Push compact deltas to dashboards (SSE)
+        for result in changed:
+            machine_events.publish("machine", {"id": result.machine_id, **result.changes, "last_updated": result.last_updated})
+        if heartbeat_ids:
+            machine_events.publish("heartbeat", {
+                "ids": heartbeat_ids,
+                "last_updated": max(r.last_updated for r in batch if not r.changes),
+            })
+
+        for result in changed:
+            # Trigger Topo Update if status changed to Online
+            # or if it's the first successful check (Unknown -> Online)
+            if result.new_status == "Online" and result.old_status != "Online":
+                logger.info(f"Triggering topo update for {result.ip} (Status: {result.old_status} -> {result.new_status})")
+                trigger_topo_update_async(result.machine_id)
+            elif result.new_status == "Online" and "hw_fingerprint" in result.changes:
+                logger.info(f"Hardware fingerprint changed on {result.ip}, triggering topo update")
+                trigger_topo_update_async(result.machine_id)
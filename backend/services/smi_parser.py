@@ -0,0 +1,196 @@
+"""Single-pass parsers for `nvidia-smi` CSV and `npu-smi info` output.
+
+Patterns are compiled once at import. The Huawei parser finds NPU rows and
+process rows with line-anchored patterns over the whole output, so the line
+loop runs in the regex engine; only the few lines after each NPU row are
+inspected individually for memory usage. Results are identical to the
+original line-by-line parsers; benchmarks/bench_smi_parser.py checks this
+against the recorded corpus in benchmarks/corpus.
+"""
+import re
+
+_NUMBER_RE = re.compile(r"(\d+(?:\.\d+)?)")
+
+# Row patterns start at a "\n|" literal (the output is scanned with a leading newline),
+# which lets the regex engine jump between candidate lines. [^\S\n] is whitespace
+# except newline, so a match never spans lines.
+# | 0     910B2C              | OK            | 89.5        44                0    / 0             |
+# | 1     310P3               | OK            | NA           53                0     / 0         |
+_NPU_ROW_RE = re.compile(
+    r"\n\|[^\S\n]*(\d+)[^\S\n]+([A-Za-z0-9-]+)[^\S\n]*\|[^\S\n]*([A-Za-z]+)[^\S\n]*\|[^\S\n]*([A-Za-z0-9.]+)[^\S\n]+(\d+)\b"
+)
+# | 0       0                 | 3801368       | ...
+_PROCESS_ROW_RE = re.compile(r"\n\|[^\S\n]*(\d+)[^\S\n]+[^\n]*\|[^\S\n]*(\d+)[^\S\n]+\|")
+_NPU_MODEL_RE = re.compile(r"\|\s+\d+\s+((?:910|310)[A-Za-z0-9-]*)")
+# Memory pairs such as "3632 / 65536" or "57356/ 65536"
+_MEMORY_PAIR_RE = re.compile(r"(\d{1,6})\s*/\s*(\d{1,6})")
+# Line breaks other than \n that str.splitlines() honours
+OTHER_LINE_BREAKS = ("\r", "\x0b", "\x0c", "\x1c", "\x1d", "\x1e", "\x85", "\u2028", "\u2029")
+
+PROCESS_TABLE_HEADER = "| NPU     Chip"
+# Lines after an NPU row that may carry its memory usage
+NPU_MEMORY_LOOKAHEAD = 7
+NPU_WARNING_HEALTH = ("warning", "critical", "error")
+
+def take_number(text: str) -> float:
+    if not text:
+        return 0.0
+    m = _NUMBER_RE.search(str(text))
+    return float(m.group(1)) if m else 0.0
+
+def parse_nvidia_output(nvidia_out: str) -> dict:
+    if not nvidia_out:
+        return None
+
+    details = []
+    acc_names = set()
+    idle_count = 0
+    busy_count = 0
+    warning_count = 0
+
+    for line in nvidia_out.split('\n'):
+        if not line.strip():
+            continue
+        parts = [p.strip() for p in line.split(',')]
+        if len(parts) < 5:
+            continue
+
+        name = parts[1]
+        acc_names.add(name.replace("NVIDIA ", "").replace("GeForce ", "").replace("Tesla ", ""))
+
+        # Units like MiB and a possible trailing 'C' are ignored
+        total_mem = take_number(parts[2])
+        used_mem = take_number(parts[3])
+        temp = take_number(parts[4])
+        mem_usage_percent = (used_mem / total_mem) * 100 if total_mem > 0 else 0
+
+        is_busy = False
+        if temp > 85:
+            warning_count += 1
+            health_label = "Warning"
+        else:
+            health_label = "OK"
+            if mem_usage_percent > 10:
+                busy_count += 1
+                is_busy = True
+            else:
+                idle_count += 1
+
+        details.append({
+            "id": parts[0],
+            "name": name,
+            "memory_total": int(total_mem) if total_mem else 0,
+            "memory_used": int(used_mem) if used_mem else 0,
+            "temp": f"{int(temp)}C" if temp else "N/A",
+            "health": health_label,
+            "busy": is_busy,
+        })
+
+    return {
+        "accelerator_count": len(details),
+        "idle_count": idle_count,
+        "busy_count": busy_count,
+        "warning_count": warning_count,
+        "accelerator_type": ", ".join(sorted(acc_names)) if acc_names else None,
+        "accelerator_status": details,
+    }
+
+def _npu_memory(text: str, pos: int, end: int):
+    """Memory usage from the lines following an NPU row, up to the next separator."""
+    candidates = []
+    for _ in range(NPU_MEMORY_LOOKAHEAD):
+        if pos >= end:
+            break
+        line_end = text.find("\n", pos, end)
+        if line_end == -1:
+            line_end = end
+        line = text[pos:line_end]
+        if line.strip().startswith("+"):
+            break
+        if "/" in line:
+            for used, total in _MEMORY_PAIR_RE.findall(line):
+                # Skip the always-empty 0 / 0 pairs (hugepages etc.)
+                if int(total) != 0:
+                    candidates.append((int(used), int(total)))
+        pos = line_end + 1
+
+    # Prefer the first pair with total >= 1000 (HBM / device memory), else the largest total
+    for used, total in candidates:
+        if total >= 1000:
+            return used, total
+    if candidates:
+        return max(candidates, key=lambda c: c[1])
+    return 0, 0
+
+def parse_huawei_output(npu_out: str) -> dict:
+    if not npu_out or "command not found" in npu_out or "HUAWEI_NOT_FOUND" in npu_out:
+        return None
+
+    accelerator_type = "Huawei Ascend"
+    model_match = _NPU_MODEL_RE.search(npu_out)
+    if model_match:
+        accelerator_type = f"Ascend {model_match.group(1).strip()}"
+
+    text = npu_out
+    if any(ch in text for ch in OTHER_LINE_BREAKS):
+        text = "\n".join(text.splitlines())
+    # Leading newline so the first line is also preceded by "\n"
+    text = "\n" + text
+
+    # NPU rows come before the process table; the table's header line ends that section
+    header_pos = text.find(PROCESS_TABLE_HEADER)
+    has_process_table = header_pos != -1
+    rows_end = text.rfind("\n", 0, header_pos) if has_process_table else len(text)
+
+    busy_npus = set()
+    if has_process_table:
+        # The header line is scanned from the header itself, as if it started there.
+        # "No running processes found in NPU X" rows need no handling: absent means idle.
+        busy_npus = {int(m.group(1)) for m in _PROCESS_ROW_RE.finditer("\n" + text[header_pos:])}
+
+    idle_count = 0
+    busy_count = 0
+    warning_count = 0
+    details = []
+
+    # rows_end is the newline before the table header, so endpos stops the scan before it
+    for m in _NPU_ROW_RE.finditer(text, 0, rows_end):
+        npu_id = int(m.group(1))
+        health = m.group(3)
+        row_end = text.find("\n", m.end(), rows_end)
+        hbm_used, hbm_total = _npu_memory(text, row_end + 1, rows_end) if row_end != -1 else (0, 0)
+
+        is_busy = False
+        if health.lower() in NPU_WARNING_HEALTH:
+            warning_count += 1
+            health_label = "Warning"
+        else:
+            health_label = "OK"
+            if has_process_table:
+                is_busy = npu_id in busy_npus
+            else:
+                # Without a process table fall back to HBM usage
+                is_busy = (hbm_used / hbm_total * 100 if hbm_total > 0 else 0) > 5
+            if is_busy:
+                busy_count += 1
+            else:
+                idle_count += 1
+
+        details.append({
+            "id": str(npu_id),
+            "name": m.group(2),
+            "memory_total": hbm_total,
+            "memory_used": hbm_used,
+            "temp": f"{int(m.group(5))}C",
+            "health": health_label,
+            "busy": is_busy,
+        })
+
+    return {
+        "accelerator_count": len(details),
+        "idle_count": idle_count,
+        "busy_count": busy_count,
+        "warning_count": warning_count,
+        "accelerator_type": accelerator_type,
+        "accelerator_status": details,
+    }
@@ -0,0 +1,275 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import paramiko
+
+from logger import logger
+from services.poll_timing import poll_timings, PHASE_CONNECT
+
+SSH_KEEPALIVE_INTERVAL_SECONDS = 30
+SSH_IDLE_TIMEOUT_SECONDS = 300
+# A connection unused for longer than this is probed before it is handed out
+SSH_HEALTH_CHECK_AFTER_SECONDS = 15
+SSH_HEALTH_CHECK_TIMEOUT_SECONDS = 5
+
+
+class SSHConnectionLost(Exception):
+    """The pooled transport died and could not be re-established for a command."""
+
+    def __init__(self, error_type, error_message):
+        super().__init__(error_message)
+        self.error_type = error_type
+        self.error_message = error_message
+
+
+class _PoolEntry:
+    def __init__(self, key, client):
+        self.key = key
+        self.client = client
+        self.created_ts = time.time()
+        self.last_used_ts = self.created_ts
+        self.leases = 0
+        self.retired = False
+
+
+class SSHLease:
+    """A pooled SSH connection checked out for one machine."""
+
+    def __init__(self, pool, machine, entry, error_type=None, error_message=None):
+        self._pool = pool
+        self._machine = machine
+        self._entry = entry
+        self.error_type = error_type
+        self.error_message = error_message
+
+    @property
+    def client(self):
+        return self._entry.client if self._entry else None
+
+    def execute(self, command, timeout=10):
+        """Runs a command and returns `(stdout, stderr)`, reconnecting once if the pooled transport died.
+
+        Raises SSHConnectionLost when no connection can be (re)established, so
+        callers never mistake a dead host for empty command output.
+        """
+        if not self._entry:
+            raise SSHConnectionLost(self.error_type or "other", self.error_message or "Not connected")
+
+        try:
+            stdin, stdout, stderr = self.client.exec_command(command, timeout=timeout)
+        except (paramiko.SSHException, EOFError, OSError) as e:
+            # The channel could not be opened, so the transport is gone: reconnect and retry once.
+            logger.info(f"Pooled SSH connection to {self._machine.ip} is stale, reconnecting: {e}")
+            if not self._pool._reconnect(self):
+                raise SSHConnectionLost(self.error_type or "other", self.error_message or str(e))
+            try:
+                stdin, stdout, stderr = self.client.exec_command(command, timeout=timeout)
+            except Exception as retry_error:
+                self._pool._retire(self._entry)
+                raise SSHConnectionLost("other", str(retry_error))
+        except Exception as e:
+            return "", str(e)
+
+        try:
+            return stdout.read().decode('utf-8').strip(), stderr.read().decode('utf-8').strip()
+        except Exception as e:
+            return "", str(e)
+
+    def open_sftp(self):
+        return self.client.open_sftp()
+
+
+class SSHConnectionPool:
+    """Thread-safe pool of live SSH transports keyed by machine credential fingerprint.
+
+    `connect(ip, port, username, password)` must return `(client, error_type, error_message)`.
+    A transport is shared by concurrent leases of the same key, since paramiko
+    multiplexes channels over one connection.
+    """
+
+    def __init__(
+        self,
+        connect,
+        key_func,
+        keepalive_interval=SSH_KEEPALIVE_INTERVAL_SECONDS,
+        idle_timeout=SSH_IDLE_TIMEOUT_SECONDS,
+        health_check_after=SSH_HEALTH_CHECK_AFTER_SECONDS,
+        health_check_timeout=SSH_HEALTH_CHECK_TIMEOUT_SECONDS,
+    ):
+        self._connect = connect
+        self._key_func = key_func
+        self.keepalive_interval = keepalive_interval
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.health_check_timeout = health_check_timeout
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._key_locks = {}
+
+    @contextmanager
+    def lease(self, machine):
+        lease = self._checkout(machine)
+        try:
+            yield lease
+        finally:
+            self._checkin(lease)
+
+    def has_live_connection(self, machine) -> bool:
+        key = self._key_func(machine)
+        with self._lock:
+            entry = self._entries.get(key)
+        if not entry:
+            return False
+        transport = entry.client.get_transport()
+        return bool(transport and transport.is_active())
+
+    def discard(self, machine):
+        """Drops the pooled connection for a machine, e.g. after its credentials changed or it was deleted."""
+        key = self._key_func(machine)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry:
+            self._retire(entry)
+
+    def evict_idle(self) -> int:
+        now_ts = time.time()
+        evicted = []
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.leases == 0 and now_ts - entry.last_used_ts > self.idle_timeout:
+                    self._entries.pop(key, None)
+                    evicted.append(entry)
+        for entry in evicted:
+            self._close(entry)
+        if evicted:
+            logger.info(f"Evicted {len(evicted)} idle SSH connections")
+        return len(evicted)
+
+    def close_all(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            self._close(entry)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = list(self._entries.values())
+        return {
+            "connections": len(entries),
+            "in_use": sum(1 for e in entries if e.leases > 0),
+        }
+
+    @contextmanager
+    def _key_lock(self, key):
+        # [lock, callers holding or waiting]; dropped with the last caller, so keys do not pile up
+        with self._lock:
+            slot = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            slot[1] += 1
+        try:
+            with slot[0]:
+                yield
+        finally:
+            with self._lock:
+                slot[1] -= 1
+                if slot[1] == 0:
+                    del self._key_locks[key]
+
+    def _is_healthy(self, entry) -> bool:
+        transport = entry.client.get_transport()
+        if not transport or not transport.is_active():
+            return False
+        if time.time() - entry.last_used_ts > self.health_check_after:
+            # Opening a channel needs the peer's confirmation, so a silently dead host fails here
+            try:
+                transport.open_session(timeout=self.health_check_timeout).close()
+            except Exception:
+                return False
+        return True
+
+    def _open(self, key, machine):
+        with poll_timings.phase(PHASE_CONNECT):
+            client, error_type, error_message = self._connect(
+                machine.ip, machine.port, machine.username, machine.password
+            )
+        if not client:
+            return None, error_type, error_message
+        transport = client.get_transport()
+        if transport:
+            transport.set_keepalive(self.keepalive_interval)
+        return _PoolEntry(key, client), None, None
+
+    def _checkout(self, machine) -> SSHLease:
+        key = self._key_func(machine)
+        # Serialize connects per key so concurrent callers share one handshake.
+        with self._key_lock(key):
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry and self._is_healthy(entry):
+                with self._lock:
+                    entry.leases += 1
+                return SSHLease(self, machine, entry)
+
+            if entry:
+                self._retire(entry)
+
+            entry, error_type, error_message = self._open(key, machine)
+            if not entry:
+                return SSHLease(self, machine, None, error_type, error_message)
+            with self._lock:
+                entry.leases = 1
+                self._entries[key] = entry
+            return SSHLease(self, machine, entry)
+
+    def _checkin(self, lease: SSHLease):
+        entry = lease._entry
+        if not entry:
+            return
+        lease._entry = None
+        with self._lock:
+            entry.leases -= 1
+            entry.last_used_ts = time.time()
+            close_now = entry.retired and entry.leases == 0
+        if close_now:
+            self._close(entry)
+
+    def _reconnect(self, lease: SSHLease) -> bool:
+        old_entry = lease._entry
+        key = old_entry.key
+        with self._key_lock(key):
+            with self._lock:
+                current = self._entries.get(key)
+            if current is not None and current is not old_entry and self._is_healthy(current):
+                new_entry = current
+            else:
+                self._retire(old_entry)
+                new_entry, error_type, error_message = self._open(key, lease._machine)
+                if not new_entry:
+                    lease.error_type = error_type
+                    lease.error_message = error_message
+                    self._checkin(lease)
+                    return False
+                with self._lock:
+                    self._entries[key] = new_entry
+
+            with self._lock:
+                new_entry.leases += 1
+        self._checkin(lease)
+        lease._entry = new_entry
+        return True
+
+    def _retire(self, entry):
+        with self._lock:
+            if self._entries.get(entry.key) is entry:
+                self._entries.pop(entry.key, None)
+            entry.retired = True
+            close_now = entry.leases == 0
+        if close_now:
+            self._close(entry)
+
+    def _close(self, entry):
+        try:
+            entry.client.close()
+        except Exception:
+            pass
@@ -0,0 +1,320 @@
+import socket
+import threading
+import time
+from datetime import datetime
+
+from sqlmodel import Session, select
+
+from models import Machine
+from logger import logger
+from database import engine
+from services.monitor_service import ssh_pool, merge_accelerator_data, MONITOR_SECTION_DELIM
+from services.result_writer import MachineResultWriter, capture_monitor_fields
+from services.telemetry_store import telemetry_store
+from services.cluster import cluster
+
+STREAM_DEFAULT_INTERVAL_SECONDS = 5
+STREAM_MIN_INTERVAL_SECONDS = 1
+STREAM_RECORD_DELIM = "|||RECORD|||"
+# Latest records of all streams are written together at this cadence
+STREAM_FLUSH_SECONDS = 1
+# A stream with no output for this many sample intervals (at least STREAM_STALL_MIN_SECONDS) is reconnected
+STREAM_STALL_INTERVALS = 3
+STREAM_STALL_MIN_SECONDS = 30
+STREAM_RECONNECT_MIN_SECONDS = 2
+STREAM_RECONNECT_MAX_SECONDS = 60
+# Full SSH polls of a host with a live stream (OS, arch, fingerprint) run this many poll intervals apart
+STREAM_FULL_POLL_INTERVALS = 10
+# An unterminated record larger than this means the producer output is not what we expect
+MAX_RECORD_BYTES = 1024 * 1024
+READ_CHUNK_BYTES = 32 * 1024
+
+def build_stream_command(interval: int) -> str:
+    """Remote producer: one framed nvidia-smi + npu-smi record per interval on a single channel.
+
+    The tools are looked up once; the loop ends on its own (SIGPIPE) when the channel closes.
+    """
+    return (
+        "nv=$(command -v nvidia-smi); npu=$(command -v npu-smi); "
+        "while :; do "
+        "[ -n \"$nv\" ] && nvidia-smi --query-gpu=index,name,memory.total,memory.used,temperature.gpu "
+        "--format=csv,noheader 2>/dev/null; "
+        f"echo '{MONITOR_SECTION_DELIM}'; "
+        "[ -n \"$npu\" ] && npu-smi info 2>/dev/null; "
+        f"echo '{STREAM_RECORD_DELIM}' || exit 0; "
+        f"sleep {interval}; "
+        "done"
+    )
+
+def _stream_interval(machine: Machine) -> int:
+    return max(STREAM_MIN_INTERVAL_SECONDS, machine.stream_interval or STREAM_DEFAULT_INTERVAL_SECONDS)
+
+def _session_signature(machine: Machine) -> tuple:
+    """A running session is restarted when any of these change."""
+    return (machine.ip, machine.port, machine.username, machine.password, _stream_interval(machine))
+
+class RecordBuffer:
+    """Splits a byte stream into complete records as chunks arrive."""
+
+    def __init__(self, delimiter: str = STREAM_RECORD_DELIM, max_bytes: int = MAX_RECORD_BYTES):
+        self._delimiter = delimiter.encode("utf-8")
+        self._max_bytes = max_bytes
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> list:
+        """Returns the records completed by `data`; raises ValueError if a record grows too large."""
+        self._buffer += data
+        records = []
+        start = 0
+        while True:
+            end = self._buffer.find(self._delimiter, start)
+            if end == -1:
+                break
+            records.append(self._buffer[start:end].decode("utf-8", "replace"))
+            start = end + len(self._delimiter)
+        if start:
+            del self._buffer[:start]
+        if len(self._buffer) > self._max_bytes:
+            self._buffer.clear()
+            raise ValueError(f"record exceeds {self._max_bytes} bytes")
+        return records
+
+class StreamSession:
+    """Keeps one streaming channel open to a machine, reconnecting with backoff."""
+
+    def __init__(self, collector, machine: Machine):
+        self._collector = collector
+        self.machine = machine
+        self.machine_id = machine.id
+        self.interval = _stream_interval(machine)
+        self.signature = _session_signature(machine)
+        self.state = "starting"
+        self.error_message = None
+        self.records = 0
+        self.reconnects = 0
+        self.last_record_ts = None
+        self._stop = threading.Event()
+        self._channel = None
+        self._thread = threading.Thread(target=self._run, name=f"stream-{machine.ip}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        channel = self._channel
+        if channel is not None:
+            try:
+                channel.close()
+            except Exception:
+                pass
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    def _run(self):
+        delay = STREAM_RECONNECT_MIN_SECONDS
+        while not self._stop.is_set():
+            # A stream that produced records reconnects quickly; repeated failures back off
+            if self._stream_once():
+                delay = STREAM_RECONNECT_MIN_SECONDS
+            if self._stop.is_set():
+                break
+            self.reconnects += 1
+            self.state = "backoff"
+            logger.warning(f"Stream from {self.machine.ip} ended ({self.error_message}), reconnecting in {delay}s")
+            self._stop.wait(delay)
+            delay = min(delay * 2, STREAM_RECONNECT_MAX_SECONDS)
+        self.state = "stopped"
+
+    def _stream_once(self) -> bool:
+        """Streams until the channel fails or the session is stopped; returns whether any record arrived."""
+        received = False
+        self.state = "connecting"
+        with ssh_pool.lease(self.machine) as conn:
+            if not conn.client:
+                self.error_message = f"Connection failed: {conn.error_message}"
+                return False
+            try:
+                channel = conn.client.get_transport().open_session()
+                channel.settimeout(1.0)
+                channel.exec_command(build_stream_command(self.interval))
+            except Exception as e:
+                # The pooled transport is likely dead; let the next lease reconnect
+                ssh_pool.discard(self.machine)
+                self.error_message = str(e)
+                return False
+
+            self._channel = channel
+            self.state = "streaming"
+            buffer = RecordBuffer()
+            stall_seconds = max(STREAM_STALL_MIN_SECONDS, STREAM_STALL_INTERVALS * self.interval)
+            last_data_ts = time.time()
+            try:
+                while not self._stop.is_set():
+                    try:
+                        data = channel.recv(READ_CHUNK_BYTES)
+                    except socket.timeout:
+                        if time.time() - last_data_ts > stall_seconds:
+                            self.error_message = f"no output for {stall_seconds}s"
+                            return received
+                        continue
+                    if not data:
+                        self.error_message = f"channel closed (exit status {channel.exit_status if channel.exit_status_ready() else 'unknown'})"
+                        return received
+                    last_data_ts = time.time()
+                    for record in buffer.feed(data):
+                        received = True
+                        self.records += 1
+                        self.last_record_ts = time.time()
+                        self._collector.submit(self.machine_id, record, self.last_record_ts)
+            except Exception as e:
+                self.error_message = str(e)
+                return received
+            finally:
+                self._channel = None
+                try:
+                    channel.close()
+                except Exception:
+                    pass
+        return received
+
+    def stats(self) -> dict:
+        return {
+            "machine_id": self.machine_id,
+            "ip": self.machine.ip,
+            "interval": self.interval,
+            "state": self.state,
+            "records": self.records,
+            "reconnects": self.reconnects,
+            "last_record_age_seconds": round(time.time() - self.last_record_ts, 1) if self.last_record_ts else None,
+            "error_message": self.error_message,
+        }
+
+class StreamCollector:
+    """Runs a StreamSession for every machine with stream_enabled and applies their records.
+
+    Reader threads only hand over the newest record per machine; a single flush
+    thread writes them in one batch per STREAM_FLUSH_SECONDS. If writing falls
+    behind, older unwritten records are replaced rather than queued, so a slow
+    database never blocks or grows the readers.
+    """
+
+    def __init__(self, flush_seconds: float = STREAM_FLUSH_SECONDS):
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._latest = {}
+        self._stop = threading.Event()
+        self._flush_thread = None
+        self.flushed = 0
+        self.conflated = 0
+
+    def start(self):
+        with self._lock:
+            if self._flush_thread is None:
+                self._stop.clear()
+                self._flush_thread = threading.Thread(target=self._flush_loop, name="stream-flush", daemon=True)
+                self._flush_thread.start()
+        self.sync()
+
+    def sync(self):
+        """Starts, restarts or stops sessions to match the machines that opted in and this instance owns."""
+        with Session(engine) as session:
+            machines = session.exec(select(Machine).where(Machine.stream_enabled == True)).all()  # noqa: E712
+
+        wanted = {m.id: m for m in machines if cluster.owns(m.id)}
+        started, stopped = [], []
+        with self._lock:
+            if self._flush_thread is None:
+                return
+            for machine_id, current in list(self._sessions.items()):
+                machine = wanted.get(machine_id)
+                if machine is None or _session_signature(machine) != current.signature:
+                    stopped.append(self._sessions.pop(machine_id))
+            for machine_id, machine in wanted.items():
+                if machine_id not in self._sessions:
+                    self._sessions[machine_id] = StreamSession(self, machine)
+                    started.append(self._sessions[machine_id])
+
+        for stream in stopped:
+            stream.stop()
+        for stream in started:
+            stream.start()
+        if started or stopped:
+            logger.info(f"Streaming collection: {len(started)} started, {len(stopped)} stopped, {len(wanted)} active")
+
+    def is_streaming(self, machine_id: int) -> bool:
+        """Whether a live stream reports the machine's accelerators, so its full polls can be spaced out."""
+        with self._lock:
+            stream = self._sessions.get(machine_id)
+        return bool(stream and stream.state == "streaming")
+
+    def submit(self, machine_id: int, record: str, ts: float):
+        with self._lock:
+            if machine_id in self._latest:
+                self.conflated += 1
+            self._latest[machine_id] = (record, ts)
+
+    def flush(self):
+        with self._lock:
+            pending, self._latest = self._latest, {}
+        if not pending:
+            return
+
+        with Session(engine) as session:
+            machines = session.exec(select(Machine).where(Machine.id.in_(list(pending)))).all()
+
+        written = 0
+        with MachineResultWriter() as writer:
+            for machine in machines:
+                record, ts = pending[machine.id]
+                nvidia_out, _, npu_out = record.partition(MONITOR_SECTION_DELIM)
+                before = capture_monitor_fields(machine)
+                try:
+                    merge_accelerator_data(machine, nvidia_out.strip() or None, npu_out.strip() or None)
+                except Exception as e:
+                    logger.error(f"Bad stream record from {machine.ip}: {e}")
+                    continue
+                # Output on the channel proves the host is reachable
+                machine.status = "Online"
+                machine.error_message = None
+                machine.last_updated = datetime.fromtimestamp(ts)
+                telemetry_store.record(machine)
+                writer.add(machine, before)
+                written += 1
+        self.flushed += written
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_seconds):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush stream records: {e}")
+
+    def stop(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+            flush_thread, self._flush_thread = self._flush_thread, None
+        self._stop.set()
+        for stream in sessions:
+            stream.stop()
+        for stream in sessions:
+            stream.join(timeout=2)
+        if flush_thread is not None:
+            flush_thread.join(timeout=5)
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            sessions = list(self._sessions.values())
+            pending = len(self._latest)
+        return {
+            "sessions": [s.stats() for s in sessions],
+            "pending": pending,
+            "flushed": self.flushed,
+            "conflated": self.conflated,
+        }
+
+stream_collector = StreamCollector()
@@ -0,0 +1,450 @@
+import json
+import sys
+import threading
+import time
+import zlib
+from array import array
+from datetime import datetime
+
+from sqlalchemy import delete
+from sqlmodel import Session, select
+
+from models import Machine, TelemetryChunk
+from logger import logger
+from database import engine
+
+# Storage tiers: raw samples are kept ~1 day, then folded into 15 minute buckets
+# (kept 14 days), then into 1 hour buckets (kept 90 days). For 10k cards this
+# bounds the store to roughly 0.55 GB before compression; only the currently
+# open raw chunk of each card is held in memory (a few hundred bytes per card).
+TIER_RAW = 0
+TIER_15MIN = 1
+TIER_HOURLY = 2
+
+RAW_CHUNK_SECONDS = 3600
+MAX_RAW_CHUNK_SAMPLES = 120
+RAW_RETENTION_SECONDS = 86400
+
+TIER_RESOLUTION_SECONDS = {TIER_15MIN: 900, TIER_HOURLY: 3600}
+# Each downsampled chunk covers one aligned span of buckets
+TIER_SPAN_SECONDS = {TIER_15MIN: 86400, TIER_HOURLY: 7 * 86400}
+TIER_RETENTION_SECONDS = {TIER_15MIN: 14 * 86400, TIER_HOURLY: 90 * 86400}
+RESOLUTION_TIERS = {"raw": TIER_RAW, "15m": TIER_15MIN, "1h": TIER_HOURLY}
+
+# Chunks waiting for the DB are capped so a failing disk cannot exhaust memory
+MAX_PENDING_CHUNKS = 50000
+
+TEMP_UNKNOWN = 255
+STATE_IDLE = 0
+STATE_BUSY = 1
+STATE_WARNING = 2
+STATE_NAMES = {STATE_IDLE: "idle", STATE_BUSY: "busy", STATE_WARNING: "warning"}
+
+RAW_COLUMNS = (
+    ("offset", "H"),
+    ("memory_used", "I"),
+    ("memory_total", "I"),
+    ("temp", "B"),
+    ("state", "B"),
+)
+BUCKET_COLUMNS = (
+    ("index", "H"),
+    ("count", "H"),
+    ("memory_used_avg", "I"),
+    ("memory_used_max", "I"),
+    ("memory_total", "I"),
+    ("temp_avg", "B"),
+    ("temp_max", "B"),
+    ("busy", "H"),
+    ("warning", "H"),
+)
+
+def _encode(columns, arrays) -> bytes:
+    parts = []
+    for name, _ in columns:
+        values = arrays[name]
+        if sys.byteorder == "big":
+            values = array(values.typecode, values)
+            values.byteswap()
+        parts.append(values.tobytes())
+    return zlib.compress(b"".join(parts))
+
+def _decode(columns, payload: bytes, count: int) -> dict:
+    data = zlib.decompress(payload)
+    arrays = {}
+    offset = 0
+    for name, code in columns:
+        values = array(code)
+        size = values.itemsize * count
+        values.frombytes(data[offset:offset + size])
+        if sys.byteorder == "big":
+            values.byteswap()
+        arrays[name] = values
+        offset += size
+    return arrays
+
+def _clamp(value, upper) -> int:
+    return max(0, min(int(value), upper))
+
+def _card_sample(detail: dict):
+    temp_text = str(detail.get("temp") or "")
+    temp = TEMP_UNKNOWN
+    if temp_text[:-1].isdigit():
+        temp = _clamp(temp_text[:-1], TEMP_UNKNOWN - 1)
+    if detail.get("health") == "Warning":
+        state = STATE_WARNING
+    elif detail.get("busy"):
+        state = STATE_BUSY
+    else:
+        state = STATE_IDLE
+    return (
+        _clamp(detail.get("memory_used") or 0, 0xFFFFFFFF),
+        _clamp(detail.get("memory_total") or 0, 0xFFFFFFFF),
+        temp,
+        state,
+    )
+
+class _OpenChunk:
+    __slots__ = ("start_ts", "last_ts", "arrays")
+
+    def __init__(self, start_ts: int):
+        self.start_ts = start_ts
+        self.last_ts = start_ts
+        self.arrays = {name: array(code) for name, code in RAW_COLUMNS}
+
+    def __len__(self):
+        return len(self.arrays["offset"])
+
+    def accepts(self, ts: int) -> bool:
+        return (
+            ts >= self.last_ts
+            and ts // RAW_CHUNK_SECONDS == self.start_ts // RAW_CHUNK_SECONDS
+            and len(self) < MAX_RAW_CHUNK_SAMPLES
+        )
+
+    def append(self, ts: int, sample):
+        memory_used, memory_total, temp, state = sample
+        self.arrays["offset"].append(ts - self.start_ts)
+        self.arrays["memory_used"].append(memory_used)
+        self.arrays["memory_total"].append(memory_total)
+        self.arrays["temp"].append(temp)
+        self.arrays["state"].append(state)
+        self.last_ts = ts
+
+    def points(self):
+        a = self.arrays
+        for i in range(len(self)):
+            yield (self.start_ts + a["offset"][i], a["memory_used"][i], a["memory_total"][i], a["temp"][i], a["state"][i])
+
+def _raw_points(chunk: TelemetryChunk):
+    a = _decode(RAW_COLUMNS, chunk.payload, chunk.count)
+    for i in range(chunk.count):
+        yield (chunk.start_ts + a["offset"][i], a["memory_used"][i], a["memory_total"][i], a["temp"][i], a["state"][i])
+
+def _bucket_points(chunk: TelemetryChunk):
+    a = _decode(BUCKET_COLUMNS, chunk.payload, chunk.count)
+    resolution = TIER_RESOLUTION_SECONDS[chunk.tier]
+    for i in range(chunk.count):
+        yield (
+            chunk.start_ts + a["index"][i] * resolution,
+            a["count"][i],
+            a["memory_used_avg"][i],
+            a["memory_used_max"][i],
+            a["memory_total"][i],
+            a["temp_avg"][i],
+            a["temp_max"][i],
+            a["busy"][i],
+            a["warning"][i],
+        )
+
+# Bucket accumulator: [count, mem_sum, mem_max, mem_total, temp_sum, temp_count, temp_max, busy, warning]
+def _accumulate_raw(acc, point):
+    _, memory_used, memory_total, temp, state = point
+    acc[0] += 1
+    acc[1] += memory_used
+    acc[2] = max(acc[2], memory_used)
+    acc[3] = memory_total
+    if temp != TEMP_UNKNOWN:
+        acc[4] += temp
+        acc[5] += 1
+        acc[6] = max(acc[6], temp)
+    acc[7] += state == STATE_BUSY
+    acc[8] += state == STATE_WARNING
+
+def _accumulate_bucket(acc, point):
+    _, count, memory_avg, memory_max, memory_total, temp_avg, temp_max, busy, warning = point
+    acc[0] += count
+    acc[1] += memory_avg * count
+    acc[2] = max(acc[2], memory_max)
+    acc[3] = memory_total
+    if temp_avg != TEMP_UNKNOWN:
+        acc[4] += temp_avg * count
+        acc[5] += count
+        acc[6] = max(acc[6], temp_max)
+    acc[7] += busy
+    acc[8] += warning
+
+def _encode_buckets(buckets: dict) -> bytes:
+    arrays = {name: array(code) for name, code in BUCKET_COLUMNS}
+    for index in sorted(buckets):
+        count, mem_sum, mem_max, mem_total, temp_sum, temp_count, temp_max, busy, warning = buckets[index]
+        arrays["index"].append(index)
+        arrays["count"].append(min(count, 0xFFFF))
+        arrays["memory_used_avg"].append(int(round(mem_sum / count)) if count else 0)
+        arrays["memory_used_max"].append(mem_max)
+        arrays["memory_total"].append(mem_total)
+        arrays["temp_avg"].append(int(round(temp_sum / temp_count)) if temp_count else TEMP_UNKNOWN)
+        arrays["temp_max"].append(temp_max if temp_count else TEMP_UNKNOWN)
+        arrays["busy"].append(min(busy, 0xFFFF))
+        arrays["warning"].append(min(warning, 0xFFFF))
+    return _encode(BUCKET_COLUMNS, arrays)
+
+def _raw_point_dict(point) -> dict:
+    ts, memory_used, memory_total, temp, state = point
+    return {
+        "ts": ts,
+        "memory_used": memory_used,
+        "memory_total": memory_total,
+        "temp": None if temp == TEMP_UNKNOWN else temp,
+        "state": STATE_NAMES.get(state, "idle"),
+    }
+
+def _bucket_point_dict(point) -> dict:
+    ts, count, memory_avg, memory_max, memory_total, temp_avg, temp_max, busy, warning = point
+    return {
+        "ts": ts,
+        "samples": count,
+        "memory_used_avg": memory_avg,
+        "memory_used_max": memory_max,
+        "memory_total": memory_total,
+        "temp_avg": None if temp_avg == TEMP_UNKNOWN else temp_avg,
+        "temp_max": None if temp_max == TEMP_UNKNOWN else temp_max,
+        "busy_ratio": round(busy / count, 3) if count else 0,
+        "warning_ratio": round(warning / count, 3) if count else 0,
+    }
+
+class TelemetryStore:
+    """Append-only per-card accelerator history kept as compressed columnar chunks."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open = {}
+        self._pending = []
+
+    def record(self, machine: Machine):
+        """Appends one sample per card from a check_machine result."""
+        if machine.id is None or machine.status != "Online" or not machine.accelerator_status:
+            return
+        try:
+            details = json.loads(machine.accelerator_status)
+        except (TypeError, ValueError):
+            return
+
+        ts = int((machine.last_updated or datetime.now()).timestamp())
+        seen = {}
+        with self._lock:
+            for detail in details:
+                card_id = str(detail.get("id"))
+                # Mixed NVIDIA + Ascend hosts can report the same index twice
+                duplicates = seen.get(card_id, 0)
+                seen[card_id] = duplicates + 1
+                if duplicates:
+                    card_id = f"{card_id}#{duplicates}"
+
+                key = (machine.id, card_id)
+                chunk = self._open.get(key)
+                if chunk is not None and not chunk.accepts(ts):
+                    self._close(key, chunk)
+                    chunk = None
+                if chunk is None:
+                    chunk = self._open[key] = _OpenChunk(ts)
+                chunk.append(ts, _card_sample(detail))
+
+    def _close(self, key, chunk: _OpenChunk):
+        self._open.pop(key, None)
+        if not len(chunk):
+            return
+        machine_id, card_id = key
+        self._pending.append(TelemetryChunk(
+            machine_id=machine_id,
+            card_id=card_id,
+            tier=TIER_RAW,
+            start_ts=chunk.start_ts,
+            end_ts=chunk.last_ts,
+            count=len(chunk),
+            payload=_encode(RAW_COLUMNS, chunk.arrays),
+        ))
+        if len(self._pending) > MAX_PENDING_CHUNKS:
+            dropped = len(self._pending) - MAX_PENDING_CHUNKS
+            del self._pending[:dropped]
+            logger.warning(f"Telemetry write backlog full, dropped {dropped} chunks")
+
+    def flush(self, force: bool = False):
+        """Writes closed chunks; also closes chunks of cards that stopped reporting."""
+        now_ts = int(time.time())
+        with self._lock:
+            for key, chunk in list(self._open.items()):
+                if force or now_ts // RAW_CHUNK_SECONDS != chunk.start_ts // RAW_CHUNK_SECONDS:
+                    self._close(key, chunk)
+            pending, self._pending = self._pending, []
+
+        if not pending:
+            return
+        try:
+            with Session(engine) as session:
+                session.add_all(pending)
+                session.commit()
+        except Exception as e:
+            logger.error(f"Failed to write {len(pending)} telemetry chunks: {e}")
+
+    def drop_machine(self, machine_id: int):
+        with self._lock:
+            for key in [k for k in self._open if k[0] == machine_id]:
+                self._open.pop(key, None)
+            self._pending = [c for c in self._pending if c.machine_id != machine_id]
+        with Session(engine) as session:
+            session.exec(delete(TelemetryChunk).where(TelemetryChunk.machine_id == machine_id))
+            session.commit()
+
+    def compact(self, now_ts: int = None):
+        """Downsamples aged tiers into coarser buckets and applies retention."""
+        now_ts = int(now_ts or time.time())
+        start = time.time()
+
+        day_span = TIER_SPAN_SECONDS[TIER_15MIN]
+        raw_cutoff = (now_ts - RAW_RETENTION_SECONDS) // day_span * day_span
+        folded_raw = self._downsample(TIER_RAW, TIER_15MIN, raw_cutoff)
+
+        week_span = TIER_SPAN_SECONDS[TIER_HOURLY]
+        medium_cutoff = (now_ts - TIER_RETENTION_SECONDS[TIER_15MIN]) // week_span * week_span
+        folded_medium = self._downsample(TIER_15MIN, TIER_HOURLY, medium_cutoff)
+
+        with Session(engine) as session:
+            result = session.exec(delete(TelemetryChunk).where(
+                TelemetryChunk.tier == TIER_HOURLY,
+                TelemetryChunk.end_ts < now_ts - TIER_RETENTION_SECONDS[TIER_HOURLY],
+            ))
+            session.commit()
+            expired = result.rowcount
+
+        logger.info(
+            f"Telemetry compaction: {folded_raw} raw and {folded_medium} 15m chunks downsampled, "
+            f"{expired} expired in {time.time() - start:.1f}s"
+        )
+
+    def _downsample(self, src_tier: int, dst_tier: int, cutoff: int) -> int:
+        span = TIER_SPAN_SECONDS[dst_tier]
+        resolution = TIER_RESOLUTION_SECONDS[dst_tier]
+        accumulate = _accumulate_raw if src_tier == TIER_RAW else _accumulate_bucket
+        points_of = _raw_points if src_tier == TIER_RAW else _bucket_points
+        folded = 0
+
+        with Session(engine) as session:
+            series = session.exec(
+                select(TelemetryChunk.machine_id, TelemetryChunk.card_id)
+                .where(TelemetryChunk.tier == src_tier, TelemetryChunk.start_ts < cutoff)
+                .distinct()
+            ).all()
+
+            for machine_id, card_id in series:
+                in_series = (TelemetryChunk.machine_id == machine_id, TelemetryChunk.card_id == card_id)
+                chunks = session.exec(
+                    select(TelemetryChunk)
+                    .where(*in_series, TelemetryChunk.tier == src_tier, TelemetryChunk.start_ts < cutoff)
+                    .order_by(TelemetryChunk.start_ts)
+                ).all()
+
+                spans = {}
+                for chunk in chunks:
+                    for point in points_of(chunk):
+                        span_start = point[0] - point[0] % span
+                        buckets = spans.setdefault(span_start, {})
+                        index = (point[0] - span_start) // resolution
+                        acc = buckets.setdefault(index, [0, 0, 0, 0, 0, 0, 0, 0, 0])
+                        accumulate(acc, point)
+
+                for span_start, buckets in spans.items():
+                    # Merge into a bucket chunk already written for this span, if any
+                    existing = session.exec(
+                        select(TelemetryChunk)
+                        .where(*in_series, TelemetryChunk.tier == dst_tier, TelemetryChunk.start_ts == span_start)
+                    ).first()
+                    if existing:
+                        for point in _bucket_points(existing):
+                            index = (point[0] - span_start) // resolution
+                            acc = buckets.setdefault(index, [0, 0, 0, 0, 0, 0, 0, 0, 0])
+                            _accumulate_bucket(acc, point)
+                        session.delete(existing)
+
+                    session.add(TelemetryChunk(
+                        machine_id=machine_id,
+                        card_id=card_id,
+                        tier=dst_tier,
+                        start_ts=span_start,
+                        end_ts=span_start + span - 1,
+                        count=len(buckets),
+                        payload=_encode_buckets(buckets),
+                    ))
+
+                session.exec(delete(TelemetryChunk).where(TelemetryChunk.id.in_([c.id for c in chunks])))
+                session.commit()
+                folded += len(chunks)
+
+        return folded
+
+    def query(self, machine_id: int, card_id: str = None, start_ts: int = None, end_ts: int = None, resolution: str = None) -> dict:
+        now_ts = int(time.time())
+        end_ts = int(end_ts or now_ts)
+        start_ts = int(start_ts if start_ts is not None else end_ts - 3600)
+
+        if resolution in RESOLUTION_TIERS:
+            tier = RESOLUTION_TIERS[resolution]
+        elif start_ts >= now_ts - RAW_RETENTION_SECONDS:
+            tier = TIER_RAW
+        elif start_ts >= now_ts - TIER_RETENTION_SECONDS[TIER_15MIN]:
+            tier = TIER_15MIN
+        else:
+            tier = TIER_HOURLY
+
+        conditions = [
+            TelemetryChunk.machine_id == machine_id,
+            TelemetryChunk.tier == tier,
+            TelemetryChunk.end_ts >= start_ts,
+            TelemetryChunk.start_ts <= end_ts,
+        ]
+        if card_id is not None:
+            conditions.append(TelemetryChunk.card_id == card_id)
+
+        with Session(engine) as session:
+            chunks = session.exec(select(TelemetryChunk).where(*conditions).order_by(TelemetryChunk.start_ts)).all()
+
+        series = {}
+        to_dict = _raw_point_dict if tier == TIER_RAW else _bucket_point_dict
+        points_of = _raw_points if tier == TIER_RAW else _bucket_points
+        for chunk in chunks:
+            points = series.setdefault(chunk.card_id, [])
+            points.extend(to_dict(p) for p in points_of(chunk) if start_ts <= p[0] <= end_ts)
+
+        if tier == TIER_RAW:
+            with self._lock:
+                open_chunks = [
+                    (key[1], list(chunk.points()))
+                    for key, chunk in self._open.items()
+                    if key[0] == machine_id and (card_id is None or key[1] == card_id)
+                ]
+            for open_card_id, raw_points in open_chunks:
+                points = series.setdefault(open_card_id, [])
+                points.extend(_raw_point_dict(p) for p in raw_points if start_ts <= p[0] <= end_ts)
+
+        return {
+            "resolution": next(name for name, t in RESOLUTION_TIERS.items() if t == tier),
+            "start_ts": start_ts,
+            "end_ts": end_ts,
+            "cards": {card: sorted(points, key=lambda p: p["ts"]) for card, points in sorted(series.items())},
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"open_series": len(self._open), "pending_chunks": len(self._pending)}
+
+telemetry_store = TelemetryStore()
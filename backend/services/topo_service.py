@@ -2,42 +2,105 @@ import os
 import zipfile
 import io
 import json
+import hashlib
+import heapq
 import threading
-from concurrent.futures import ThreadPoolExecutor
+import time
+from datetime import datetime
 from pathlib import Path
 from sqlmodel import Session, select
 from database import engine
-from models import Machine
-from services.monitor_service import create_ssh_client, execute_command
+from models import Machine, MachineTopology
+from services.monitor_service import ssh_pool
+from services.machine_events import machine_events
+from services.cluster import cluster
 from logger import logger
 
 # Path to the library
 # Assuming the script runs from c:\ms_temp\backend
 LIB_PATH = (Path(__file__).parent.parent.parent / "libs" / "PCIETopoPainter").resolve()
 
-def create_tool_zip() -> bytes:
-    """Creates a zip file of the PCIETopoPainter library in memory."""
+# Under the login user's home (mode 700), like the push agent's directory: a cached bundle in a
+# shared directory such as /tmp could be replaced by another local user between runs
+REMOTE_TOOL_DIR = ".pcietopo_tool"
+REMOTE_VERSION_FILE = ".bundle_version"
+# How long a built bundle is trusted before the library tree is stat-checked again
+BUNDLE_RECHECK_SECONDS = 30
+
+_bundle_lock = threading.Lock()
+_bundle_cache = {"signature": None, "version": None, "zip": None, "checked_ts": 0}
+
+def _iter_tool_files():
+    # Walk relative to LIB_PATH
+    for root, dirs, files in os.walk(LIB_PATH):
+        # Exclude directories
+        dirs[:] = sorted(d for d in dirs if d not in [".git", "__pycache__", "DEV", "web_demo", "tests", "results", "venv", ".idea"])
+        
+        for file in sorted(files):
+            if file.endswith(".pyc") or file.endswith(".git") or file.endswith(".DS_Store"):
+                continue
+            
+            yield Path(root) / file
+
+def _tree_signature():
+    """Cheap change detector: relative path, size and mtime of every bundled file."""
+    signature = []
+    for file_path in _iter_tool_files():
+        stat = file_path.stat()
+        signature.append((str(file_path.relative_to(LIB_PATH)), stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+def create_tool_zip():
+    """Creates a zip file of the PCIETopoPainter library in memory.
+
+    Returns the zip bytes and a content hash of the bundled files.
+    """
+    digest = hashlib.sha256()
     buffer = io.BytesIO()
     with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        # Walk relative to LIB_PATH
-        for root, dirs, files in os.walk(LIB_PATH):
-            # Exclude directories
-            dirs[:] = [d for d in dirs if d not in [".git", "__pycache__", "DEV", "web_demo", "tests", "results", "venv", ".idea"]]
-            
-            for file in files:
-                if file.endswith(".pyc") or file.endswith(".git") or file.endswith(".DS_Store"):
-                    continue
-                
-                file_path = Path(root) / file
-                # Calculate relative path for archive
-                archive_name = file_path.relative_to(LIB_PATH)
-                zip_file.write(file_path, str(archive_name))
+        for file_path in _iter_tool_files():
+            # Calculate relative path for archive
+            archive_name = str(file_path.relative_to(LIB_PATH))
+            content = file_path.read_bytes()
+            digest.update(archive_name.encode("utf-8") + b"\0" + content + b"\0")
+            zip_file.writestr(archive_name, content)
     
     buffer.seek(0)
-    return buffer.getvalue()
+    return buffer.getvalue(), digest.hexdigest()[:16]
+
+def get_tool_bundle():
+    """Returns (version, zip bytes), rebuilding only when the library tree changed."""
+    now_ts = time.time()
+    with _bundle_lock:
+        if _bundle_cache["zip"] is not None and now_ts - _bundle_cache["checked_ts"] < BUNDLE_RECHECK_SECONDS:
+            return _bundle_cache["version"], _bundle_cache["zip"]
+
+        signature = _tree_signature()
+        if _bundle_cache["zip"] is None or signature != _bundle_cache["signature"]:
+            zip_content, version = create_tool_zip()
+            _bundle_cache.update(signature=signature, version=version, zip=zip_content)
+            logger.info(f"Built PCIe topo tool bundle {version} ({len(zip_content)} bytes)")
+        _bundle_cache["checked_ts"] = now_ts
+        return _bundle_cache["version"], _bundle_cache["zip"]
+
+def topo_is_current(machine: Machine) -> bool:
+    """True if a topology is stored and the hardware has not changed since it was generated.
+
+    topo_fingerprint is only recorded together with a saved topology, so the
+    topology row itself does not need to be loaded.
+    """
+    return bool(
+        machine.topo_fingerprint
+        and machine.hw_fingerprint
+        and machine.hw_fingerprint == machine.topo_fingerprint
+    )
+
+def update_machine_topo(machine_id: int, force: bool = False):
+    """Updates the PCIe topology for a specific machine.
 
-def update_machine_topo(machine_id: int):
-    """Updates the PCIe topology for a specific machine."""
+    Unless `force` is set, the job is skipped when the hardware fingerprint
+    matches the one recorded with the stored topology.
+    """
     with Session(engine) as session:
         machine = session.get(Machine, machine_id)
         if not machine:
@@ -48,99 +111,254 @@ def update_machine_topo(machine_id: int):
             logger.warning(f"Machine {machine.ip} is not Online, skipping topo update")
             return
 
+        if not force and topo_is_current(machine):
+            logger.info(f"Hardware of {machine.ip} unchanged, skipping topo update")
+            return
+
         logger.info(f"Starting topo update for {machine.ip}")
         
         try:
-            client = create_ssh_client(machine.ip, machine.port, machine.username, machine.password)
-            if not client:
-                logger.error(f"Failed to connect to {machine.ip}")
-                return
+            with ssh_pool.lease(machine) as conn:
+                if not conn.client:
+                    logger.error(f"Failed to connect to {machine.ip}: {conn.error_message}")
+                    return
+                _run_topo_job(session, machine, conn)
 
-            # 1. Prepare remote directory
-            remote_dir = "/tmp/pcietopo_tool"
-            execute_command(client, f"mkdir -p {remote_dir}")
-
-            # 2. Upload zip
-            zip_content = create_tool_zip()
-            sftp = client.open_sftp()
-            with sftp.file(f"{remote_dir}/tool.zip", "wb") as f:
-                f.write(zip_content)
-            sftp.close()
-
-            # 3. Unzip and Run
-            # Using python3 -m zipfile to avoid dependency on unzip
-            # Using --all to avoid aggressive pruning which might lead to empty results
-            # Using --formats svg to avoid overwriting pci_topology.json with Graphviz xdot output (if dot is present)
-            # Capture stderr to help debugging
-            cmd = (
-                f"cd {remote_dir} && "
-                f"python3 -m zipfile -e tool.zip . > /dev/null 2>&1 && "
-                f"python3 -m pcietopo topo --output . --formats svg && "
-                f"if [ -f pci_topology.json ]; then cat pci_topology.json; else echo 'ERROR: pci_topology.json not found'; fi"
-            )
-            
-            # Increase timeout to 60s for topo generation
-            output, error = execute_command(client, cmd, timeout=60)
-            
-            if "ERROR:" in output:
-                 logger.error(f"Error generating topo on {machine.ip}. Output: {output}")
-                 execute_command(client, f"rm -rf {remote_dir}")
-                 return
+        except Exception as e:
+            logger.error(f"Exception during topo update for {machine.ip}: {e}")
 
-            if not output.strip():
-                 logger.error(f"Empty output from topo command on {machine.ip}. Stderr: {error}")
-                 execute_command(client, f"rm -rf {remote_dir}")
-                 return
+def _install_tool_bundle(conn, version: str, zip_content: bytes):
+    # 1. Prepare remote directory, dropping files of an older bundle
+    conn.execute(f"rm -rf ~/{REMOTE_TOOL_DIR} && mkdir -p ~/{REMOTE_TOOL_DIR} && chmod 700 ~/{REMOTE_TOOL_DIR}")
 
-            # If output is not json, something went wrong
+    # 2. Upload zip (SFTP paths are relative to the home directory)
+    sftp = conn.open_sftp()
+    with sftp.file(f"{REMOTE_TOOL_DIR}/tool.zip", "wb") as f:
+        f.write(zip_content)
+    sftp.close()
+
+    # 3. Unzip and stamp the version so later runs can skip the upload
+    # Using python3 -m zipfile to avoid dependency on unzip
+    conn.execute(
+        f"cd ~/{REMOTE_TOOL_DIR} && "
+        f"python3 -m zipfile -e tool.zip . > /dev/null 2>&1 && "
+        f"rm -f tool.zip && echo {version} > {REMOTE_VERSION_FILE}"
+    )
+
+def _run_topo_job(session: Session, machine: Machine, conn):
+    version, zip_content = get_tool_bundle()
+
+    # Run against the installed bundle in a single command; hosts without the
+    # current bundle answer BUNDLE_MISSING and get it uploaded first.
+    # Using --all to avoid aggressive pruning which might lead to empty results
+    # Using --formats svg to avoid overwriting pci_topology.json with Graphviz xdot output (if dot is present)
+    # Capture stderr to help debugging
+    cmd = (
+        f"cd ~/{REMOTE_TOOL_DIR} 2>/dev/null && "
+        f"[ \"$(cat {REMOTE_VERSION_FILE} 2>/dev/null)\" = \"{version}\" ] || {{ echo 'BUNDLE_MISSING'; exit 0; }}; "
+        f"rm -rf out && mkdir out && "
+        f"python3 -m pcietopo topo --output out --formats svg && "
+        f"if [ -f out/pci_topology.json ]; then cat out/pci_topology.json; else echo 'ERROR: pci_topology.json not found'; fi"
+    )
+    
+    # Increase timeout to 60s for topo generation
+    output, error = conn.execute(cmd, timeout=60)
+
+    if output.strip() == "BUNDLE_MISSING":
+        logger.info(f"Installing topo tool bundle {version} on {machine.ip}")
+        _install_tool_bundle(conn, version, zip_content)
+        output, error = conn.execute(cmd, timeout=60)
+    
+    if "ERROR:" in output or output.strip() == "BUNDLE_MISSING":
+         logger.error(f"Error generating topo on {machine.ip}. Output: {output}. Stderr: {error}")
+         return
+
+    if not output.strip():
+         logger.error(f"Empty output from topo command on {machine.ip}. Stderr: {error}")
+         return
+
+    # If output is not json, something went wrong
+    try:
+        # Validate JSON
+        topo_data = json.loads(output)
+        
+        # Check if it's empty even with --all
+        if not topo_data.get('nodes'):
+            logger.warning(f"Topo data for {machine.ip} contains 0 nodes even with --all")
+
+        # Save as string
+        session.merge(MachineTopology(
+            machine_id=machine.id,
+            pci_topo_json=json.dumps(topo_data),
+            updated_at=datetime.now(),
+        ))
+        machine.topo_fingerprint = machine.hw_fingerprint
+        session.add(machine)
+        session.commit()
+        logger.info(f"Successfully updated topo for {machine.ip}")
+        machine_events.publish("topo", {"id": machine.id, "topo_fingerprint": machine.topo_fingerprint})
+    except json.JSONDecodeError:
+        # Log more info about what was actually received
+        preview = output[:500] if output else "EMPTY OUTPUT"
+        logger.error(f"Failed to parse topo JSON from {machine.ip}. Received: {preview}. Stderr: {error}")
+
+TOPO_WORKERS = 5
+# Background requests beyond this many queued machines are dropped; user requests are always queued
+TOPO_QUEUE_LIMIT = 5000
+
+# Lower runs first
+TOPO_PRIORITY_USER = 0  # explicit refresh from the UI or API
+TOPO_PRIORITY_EVENT = 1  # machine came Online or its hardware changed
+TOPO_PRIORITY_SWEEP = 2  # startup and refresh-all sweeps
+TOPO_PRIORITY_NAMES = {TOPO_PRIORITY_USER: "user", TOPO_PRIORITY_EVENT: "event", TOPO_PRIORITY_SWEEP: "sweep"}
+
+class TopoScheduler:
+    """Runs topology jobs on a fixed set of workers from one prioritized queue.
+
+    A machine is queued at most once: a new request for a queued machine only
+    raises its priority or adds `force`, and one for a running machine is
+    absorbed by the job already in progress.
+    """
+
+    def __init__(self, workers: int = TOPO_WORKERS, queue_limit: int = TOPO_QUEUE_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._cond = threading.Condition()
+        self._heap = []
+        self._pending = {}
+        self._running = {}
+        self._seq = 0
+        self._threads = []
+        self._stopped = False
+        self.completed = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def submit(self, machine_id: int, force: bool = False, priority: int = TOPO_PRIORITY_EVENT) -> str:
+        """Returns queued, updated, running or dropped."""
+        with self._cond:
+            if self._stopped:
+                return "dropped"
+            if machine_id in self._running:
+                self.coalesced += 1
+                return "running"
+
+            entry = self._pending.get(machine_id)
+            if entry is not None:
+                self.coalesced += 1
+                if priority < entry[0] or (force and not entry[3]):
+                    # Invalidate the old heap entry and queue an upgraded one
+                    entry[4] = False
+                    self._push(machine_id, min(priority, entry[0]), force or entry[3])
+                return "updated"
+
+            if priority == TOPO_PRIORITY_SWEEP and len(self._pending) >= self.queue_limit:
+                self.dropped += 1
+                return "dropped"
+
+            self._push(machine_id, priority, force)
+            self._ensure_workers()
+            self._cond.notify()
+            return "queued"
+
+    def _push(self, machine_id: int, priority: int, force: bool):
+        self._seq += 1
+        # [priority, seq, machine_id, force, valid]
+        entry = [priority, self._seq, machine_id, force, True]
+        self._pending[machine_id] = entry
+        heapq.heappush(self._heap, entry)
+
+    def _ensure_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._worker, name=f"topo-worker-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _next(self):
+        with self._cond:
+            while True:
+                if self._stopped:
+                    return None
+                while self._heap and not self._heap[0][4]:
+                    heapq.heappop(self._heap)
+                if self._heap:
+                    priority, _, machine_id, force, _ = heapq.heappop(self._heap)
+                    del self._pending[machine_id]
+                    self._running[machine_id] = (priority, time.time())
+                    return machine_id, force
+                self._cond.wait()
+
+    def _worker(self):
+        while True:
+            job = self._next()
+            if job is None:
+                return
+            machine_id, force = job
             try:
-                # Validate JSON
-                topo_data = json.loads(output)
-                
-                # Check if it's empty even with --all
-                if not topo_data.get('nodes'):
-                    logger.warning(f"Topo data for {machine.ip} contains 0 nodes even with --all")
-
-                # Save as string
-                machine.pci_topo_json = json.dumps(topo_data)
-                session.add(machine)
-                session.commit()
-                logger.info(f"Successfully updated topo for {machine.ip}")
-            except json.JSONDecodeError:
-                # Log more info about what was actually received
-                preview = output[:500] if output else "EMPTY OUTPUT"
-                logger.error(f"Failed to parse topo JSON from {machine.ip}. Received: {preview}. Stderr: {error}")
-
-            # Cleanup
-            execute_command(client, f"rm -rf {remote_dir}")
-            client.close()
+                update_machine_topo(machine_id, force)
+            except Exception as e:
+                logger.error(f"Topo job for machine {machine_id} failed: {e}")
+            finally:
+                with self._cond:
+                    self._running.pop(machine_id, None)
+                    self.completed += 1
 
-        except Exception as e:
-            logger.error(f"Exception during topo update for {machine.ip}: {e}")
+    def stop(self):
+        """Drops queued jobs; running jobs finish on their daemon threads."""
+        with self._cond:
+            self._stopped = True
+            self._heap.clear()
+            self._pending.clear()
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self._cond:
+            depth = {name: 0 for name in TOPO_PRIORITY_NAMES.values()}
+            for entry in self._pending.values():
+                depth[TOPO_PRIORITY_NAMES[entry[0]]] += 1
+            running = [
+                {
+                    "machine_id": machine_id,
+                    "priority": TOPO_PRIORITY_NAMES[priority],
+                    "running_seconds": round(now - started_ts, 1),
+                }
+                for machine_id, (priority, started_ts) in self._running.items()
+            ]
+            return {
+                "workers": self.workers,
+                "queued": len(self._pending),
+                "queued_by_priority": depth,
+                "running": running,
+                "completed": self.completed,
+                "coalesced": self.coalesced,
+                "dropped": self.dropped,
+            }
+
+topo_scheduler = TopoScheduler()
 
-def trigger_topo_update_async(machine_id: int):
-    """Triggers topology update in a background thread."""
-    threading.Thread(target=update_machine_topo, args=(machine_id,)).start()
+def trigger_topo_update_async(machine_id: int, force: bool = False, priority: int = TOPO_PRIORITY_EVENT) -> str:
+    """Queues a topology update on the shared topo scheduler."""
+    return topo_scheduler.submit(machine_id, force, priority)
 
-def update_all_machines_topo():
-    """Updates the PCIe topology for all online machines."""
-    logger.info("Starting global topo update for all online machines...")
+def update_all_machines_topo(force: bool = False) -> int:
+    """Queues a topology update for this instance's online machines whose hardware changed."""
     with Session(engine) as session:
         # Select all online machines
         statement = select(Machine).where(Machine.status == "Online")
         machines = session.exec(statement).all()
-        machine_ids = [m.id for m in machines]
+        machine_ids = [
+            m.id for m in machines
+            if (force or not topo_is_current(m)) and cluster.owns(m.id)
+        ]
     
     if not machine_ids:
-        logger.info("No online machines found for topo update.")
-        return
-
-    logger.info(f"Found {len(machine_ids)} online machines to update topo.")
-    
-    # Use ThreadPoolExecutor to run updates in parallel
-    # Limit max_workers to avoid resource exhaustion
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        executor.map(update_machine_topo, machine_ids)
-    
-    logger.info("Global topo update completed.")
+        logger.info("No online machines need a topo update.")
+        return 0
 
+    queued = sum(
+        1 for machine_id in machine_ids
+        if topo_scheduler.submit(machine_id, force, TOPO_PRIORITY_SWEEP) != "dropped"
+    )
+    logger.info(f"Queued topo update for {queued} of {len(machine_ids)} online machines.")
+    return queued
@@ -0,0 +1,64 @@
+import os
+import sys
+import tempfile
+import threading
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# database.py opens a relative "database.db"; keep the test database out of the tree
+os.chdir(tempfile.mkdtemp(prefix="monitor-tests-"))
+
+import database  # noqa: E402
+import models  # noqa: E402,F401  registers the tables with SQLModel.metadata
+from sqlmodel import Session, SQLModel  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _schema():
+    database.create_db_and_tables()
+
+
+@pytest.fixture
+def clean_db():
+    """Empties every table so a test starts from a blank database."""
+    with database.engine.begin() as conn:
+        for table in reversed(SQLModel.metadata.sorted_tables):
+            conn.execute(table.delete())
+    return database.engine
+
+
+@pytest.fixture
+def insert_machine(clean_db):
+    """Returns `insert(ip, **fields)`, which stores a Machine with placeholder credentials and returns it."""
+    def insert(ip: str = "10.1.0.1", **fields) -> models.Machine:
+        machine = models.Machine(ip=ip, username="root", password="pw", **fields)
+        with Session(database.engine) as session:
+            session.add(machine)
+            session.commit()
+            session.refresh(machine)
+        return machine
+    return insert
+
+
+@pytest.fixture
+def racing_session():
+    """Returns `make(session_class, on_read)`, a Session subclass whose first exec() runs `on_read`
+    on another thread before returning, like an event committed after a view read the table but
+    before it swapped the result in. The thread is the class attribute `racer`.
+    """
+    def make(session_class, on_read):
+        class RacingSession(session_class):
+            racer = None
+
+            def exec(self, statement):
+                result = session_class.exec(self, statement)
+                if RacingSession.racer is None:
+                    RacingSession.racer = threading.Thread(target=on_read)
+                    RacingSession.racer.start()
+                    RacingSession.racer.join(0.1)
+                return result
+        return RacingSession
+    return make
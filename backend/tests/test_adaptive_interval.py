@@ -0,0 +1,66 @@
+from models import Machine
+from services.adaptive_interval import (
+    ACTIVITY_WINDOW_SECONDS,
+    DEFAULT_MAX_INTERVAL_SECONDS,
+    DEFAULT_MIN_INTERVAL_SECONDS,
+    AdaptiveIntervals,
+)
+
+BASE = 60
+NOW = 100000.0
+
+
+def machine(status="Online", busy=0, idle=8, **fields) -> Machine:
+    return Machine(id=1, ip="10.11.0.1", username="root", password="pw", status=status, busy_count=busy, idle_count=idle, **fields)
+
+
+def test_unknown_and_steady_machines_keep_the_base_interval():
+    intervals = AdaptiveIntervals()
+    assert intervals.effective_interval(machine(), BASE, NOW) == BASE
+    assert intervals.is_due(machine(), BASE, NOW)
+
+    intervals.observe(machine(), NOW)
+    intervals.observe(machine(), NOW + BASE)
+
+    assert intervals.effective_interval(machine(), BASE, NOW + BASE) == BASE
+    assert intervals.next_poll_ts(machine(), BASE, NOW + BASE) == NOW + 2 * BASE
+
+
+def test_offline_hosts_back_off_after_the_second_failure_up_to_the_maximum():
+    intervals = AdaptiveIntervals()
+    expected = [BASE, BASE * 2, BASE * 4, BASE * 8]
+    for attempt, interval in enumerate(expected):
+        intervals.observe(machine(status="Offline"), NOW + attempt)
+        assert intervals.effective_interval(machine(), BASE, NOW) == interval
+
+    for attempt in range(20):
+        intervals.observe(machine(status="Offline"), NOW)
+    assert intervals.effective_interval(machine(), BASE, NOW) == DEFAULT_MAX_INTERVAL_SECONDS
+    assert intervals.stats(NOW)["backed_off"] == 1
+
+    intervals.observe(machine(), NOW)
+    assert intervals.effective_interval(machine(), BASE, NOW) == BASE
+
+
+def test_busy_count_changes_use_the_minimum_interval_for_a_while():
+    intervals = AdaptiveIntervals()
+    intervals.observe(machine(busy=0, idle=8), NOW)
+    intervals.observe(machine(busy=2, idle=6), NOW + BASE)
+
+    assert intervals.effective_interval(machine(), BASE, NOW + BASE) == DEFAULT_MIN_INTERVAL_SECONDS
+    assert intervals.effective_interval(machine(), BASE, NOW + BASE + ACTIVITY_WINDOW_SECONDS) == BASE
+
+
+def test_machine_bounds_clamp_the_interval():
+    intervals = AdaptiveIntervals()
+    bounded = machine(poll_min_interval=30, poll_max_interval=120)
+    for _ in range(6):
+        intervals.observe(machine(status="Offline"), NOW)
+    assert intervals.effective_interval(bounded, BASE, NOW) == 120
+
+    intervals.observe(machine(busy=0), NOW)
+    intervals.observe(machine(busy=3, idle=5), NOW)
+    assert intervals.effective_interval(bounded, BASE, NOW) == 30
+
+    # A minimum above the maximum is capped by it
+    assert intervals.effective_interval(machine(poll_min_interval=500, poll_max_interval=100), BASE, NOW) == 100
@@ -0,0 +1,50 @@
+import time
+
+import pytest
+
+from services.agent_presence import AgentPresence, AGENT_MIN_STALE_SECONDS
+
+
+@pytest.fixture
+def presence(clean_db):
+    return AgentPresence()
+
+
+def test_mark_makes_a_machine_fresh_until_it_goes_stale(presence):
+    presence.mark(1, report_ts=100.0, interval=30, agent_version="1.0")
+    now = time.time()
+
+    assert presence.is_fresh(1, now)
+    assert presence.fresh_ids(now) == {1}
+    assert presence.last_report_ts(1) == 100.0
+    # Three intervals without a report
+    assert not presence.is_fresh(1, now + 91)
+    assert presence.fresh_ids(now + 91) == set()
+
+
+def test_short_intervals_use_the_minimum_stale_time(presence):
+    presence.mark(2, report_ts=100.0, interval=5)
+    now = time.time()
+
+    assert presence.is_fresh(2, now + AGENT_MIN_STALE_SECONDS - 1)
+    assert not presence.is_fresh(2, now + AGENT_MIN_STALE_SECONDS + 1)
+
+
+def test_older_reports_do_not_replace_newer_ones(presence):
+    presence.mark(3, report_ts=200.0, interval=30, agent_version="1.1")
+    presence.mark(3, report_ts=150.0, interval=60, agent_version="1.0")
+
+    assert presence.last_report_ts(3) == 200.0
+    assert presence.snapshot()[0]["agent_version"] == "1.1"
+
+
+def test_state_is_shared_between_instances_and_forgettable(presence):
+    presence.mark(4, report_ts=100.0, interval=30)
+    other = AgentPresence()
+
+    assert other.is_fresh(4)
+    assert [row["machine_id"] for row in other.snapshot()] == [4]
+
+    other.forget(4)
+    assert not presence.is_fresh(4)
+    assert presence.last_report_ts(4) is None
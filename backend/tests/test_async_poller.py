@@ -0,0 +1,39 @@
+import pytest
+from fastapi import HTTPException
+from sqlmodel import Session
+
+import database
+
+from models import Machine, Settings, MAX_POLL_CONCURRENCY
+from routers.settings import update_settings
+from services import async_poller
+from services.result_writer import MachineResultWriter
+
+
+def test_concurrency_is_capped_at_worker_thread_limit(monkeypatch):
+    pool_sizes = []
+    polled = []
+
+    class RecordingExecutor(async_poller.ThreadPoolExecutor):
+        def __init__(self, max_workers=None, **kwargs):
+            pool_sizes.append(max_workers)
+            super().__init__(max_workers=max_workers, **kwargs)
+
+    monkeypatch.setattr(async_poller, "ThreadPoolExecutor", RecordingExecutor)
+    monkeypatch.setattr(async_poller, "poll_machine", lambda machine, writer, connect_error, queued_ts: polled.append((machine.ip, connect_error)))
+    # Port 1 on localhost refuses at once, so every host is settled by the probe
+    machines = [Machine(id=i, ip="127.0.0.1", port=1, username="u", password="p") for i in range(3)]
+
+    async_poller.run_async_poll_cycle(machines, MachineResultWriter(), concurrency=5000)
+
+    assert pool_sizes == [MAX_POLL_CONCURRENCY]
+    assert len(polled) == 3
+    assert all(connect_error for _, connect_error in polled)
+
+
+@pytest.mark.parametrize("value", [0, MAX_POLL_CONCURRENCY + 1])
+def test_settings_reject_concurrency_outside_thread_cap(clean_db, value):
+    with Session(database.engine) as session:
+        with pytest.raises(HTTPException) as excinfo:
+            update_settings(Settings.model_validate({"interval_seconds": 60, "poll_concurrency": value}), session)
+    assert excinfo.value.status_code == 400
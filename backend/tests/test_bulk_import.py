@@ -0,0 +1,50 @@
+import json
+
+import pytest
+from sqlmodel import Session, select
+
+import database
+from models import Machine
+from services.bulk_import import BulkImportError, MAX_IMPORT_ROWS, import_machines, parse_import_payload
+
+
+def test_parse_csv_with_bom_blank_lines_and_padded_headers():
+    body = "\ufeffip , username,password\n10.9.0.1,root,pw\n,,\n10.9.0.2,root,pw\n".encode("utf-8")
+
+    rows = parse_import_payload(body, "text/csv")
+
+    assert [row["ip"] for row in rows] == ["10.9.0.1", "10.9.0.2"]
+
+
+def test_parse_gbk_csv_and_json_forms():
+    assert parse_import_payload("ip,username,password,remark\n10.9.0.1,root,pw,机房\n".encode("gbk"))[0]["remark"] == "机房"
+    assert parse_import_payload(b'[{"ip": "10.9.0.1"}]') == [{"ip": "10.9.0.1"}]
+    assert parse_import_payload(b'{"machines": [{"ip": "10.9.0.1"}]}', "application/json") == [{"ip": "10.9.0.1"}]
+
+
+@pytest.mark.parametrize("body", [b"", b"{", b'{"rows": []}', json.dumps([{}] * (MAX_IMPORT_ROWS + 1)).encode()])
+def test_parse_rejects_unreadable_payloads(body):
+    with pytest.raises(BulkImportError):
+        parse_import_payload(body)
+
+
+def test_import_reports_every_row(clean_db):
+    with Session(database.engine) as session:
+        session.add(Machine(ip="10.9.0.9", username="root", password="pw"))
+        session.commit()
+
+    report, created_ids = import_machines([
+        {"ip": " 10.9.0.1 ", "username": "root", "password": "pw", "port": "2222", "is_own": "是"},
+        {"ip": "10.9.0.1", "username": "root", "password": "pw"},
+        {"ip": "10.9.0.9", "username": "root", "password": "pw"},
+        {"ip": "10.9.0.2", "username": "root"},
+        {"ip": "10.9.0.3", "username": "root", "password": "pw", "port": "70000"},
+        "not a row",
+    ])
+
+    assert [entry["result"] for entry in report] == ["created", "duplicate", "exists", "invalid", "invalid", "invalid"]
+    assert [entry["row"] for entry in report] == [1, 2, 3, 4, 5, 6]
+    with Session(database.engine) as session:
+        created = session.exec(select(Machine).where(Machine.id.in_(created_ids))).all()
+    assert [(m.ip, m.port, m.is_own) for m in created] == [("10.9.0.1", 2222, True)]
+    assert report[0]["id"] == created[0].id
@@ -0,0 +1,43 @@
+from sqlalchemy import event, select
+
+import database
+from models import MachineChange
+from services import change_feed as change_feed_module
+from services.change_feed import MachineChangeFeed
+
+
+def feed_rows():
+    with database.engine.connect() as conn:
+        return conn.execute(select(MachineChange.event_type).order_by(MachineChange.seq)).scalars().all()
+
+
+def test_single_instance_keeps_heartbeats_out_of_the_feed(clean_db, monkeypatch):
+    monkeypatch.setattr(change_feed_module.cluster, "has_peers", lambda: False)
+    feed = MachineChangeFeed()
+    feed.start()
+    statements = []
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(database.engine, "before_cursor_execute", record)
+    try:
+        feed.on_event("heartbeat", {"ids": [1, 2], "last_updated": "now"})
+        feed.sync()
+        idle_statements = list(statements)
+        feed.on_event("machine", {"id": 1, "status": "Offline"})
+        feed.sync()
+    finally:
+        event.remove(database.engine, "before_cursor_execute", record)
+
+    assert idle_statements == []
+    assert feed_rows() == ["machine"]
+    assert (feed.stats()["appended"], feed.stats()["dropped"]) == (1, 1)
+
+
+def test_heartbeats_are_shared_while_peers_are_live(clean_db, monkeypatch):
+    monkeypatch.setattr(change_feed_module.cluster, "has_peers", lambda: True)
+    feed = MachineChangeFeed()
+    feed.start()
+
+    feed.on_event("heartbeat", {"ids": [1], "last_updated": "now"})
+    feed.sync()
+
+    assert feed_rows() == ["heartbeat"]
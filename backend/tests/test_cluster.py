@@ -0,0 +1,49 @@
+from services.cluster import ClusterCoordinator, HashRing
+
+
+def test_hash_ring_partitions_every_machine_once():
+    members = ["a", "b", "c"]
+    ring = HashRing(members)
+    owners = {machine_id: ring.owner(machine_id) for machine_id in range(3000)}
+
+    assert set(owners.values()) == set(members)
+    assert all(list(owners.values()).count(member) > 600 for member in members)
+    assert HashRing(reversed(members)).owner(42) == owners[42]
+
+
+def test_hash_ring_moves_only_the_leaving_members_machines():
+    before = HashRing(["a", "b", "c"])
+    after = HashRing(["a", "c"])
+
+    for machine_id in range(3000):
+        if before.owner(machine_id) != "b":
+            assert after.owner(machine_id) == before.owner(machine_id)
+        else:
+            assert after.owner(machine_id) in ("a", "c")
+
+
+def test_empty_ring_has_no_owner():
+    assert HashRing([]).owner(1) is None
+
+
+def test_instances_split_machines_and_share_one_leader(clean_db):
+    first, second = ClusterCoordinator(), ClusterCoordinator()
+    assert first.owns(7) and second.owns(7)
+
+    first.heartbeat()
+    assert not first.has_peers()
+    second.heartbeat()
+    first.heartbeat()
+
+    assert first.is_leader and not second.is_leader
+    assert first.has_peers() and second.has_peers()
+    for machine_id in range(200):
+        assert first.owns(machine_id) != second.owns(machine_id)
+    assert first.is_alive(second.instance_id) and second.is_alive(first.instance_id)
+
+    first.stop()
+    second.heartbeat()
+
+    assert second.is_leader and not first.is_leader
+    assert not second.is_alive(first.instance_id) and not second.has_peers()
+    assert all(second.owns(machine_id) for machine_id in range(200))
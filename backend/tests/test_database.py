@@ -0,0 +1,25 @@
+import pytest
+from sqlalchemy import text
+from sqlmodel import Session
+
+import database
+from models import Machine
+
+
+def test_duplicate_ips_fail_startup_with_the_offending_rows(clean_db):
+    with clean_db.begin() as conn:
+        conn.execute(text("DROP INDEX ix_machine_ip"))
+    with Session(clean_db) as session:
+        for _ in range(2):
+            session.add(Machine(ip="10.2.0.1", username="root", password="pw"))
+        session.commit()
+    try:
+        with pytest.raises(RuntimeError, match=r"ix_machine_ip.*10\.2\.0\.1 \(x2\)"):
+            database._create_missing_indexes()
+    finally:
+        with clean_db.begin() as conn:
+            conn.execute(text("DELETE FROM machine"))
+        database._create_missing_indexes()
+
+    with clean_db.connect() as conn:
+        assert conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'ix_machine_ip'")).first()
@@ -0,0 +1,158 @@
+import json
+import random
+
+import pytest
+from sqlmodel import Session, select
+from starlette.requests import Request
+
+import database
+from models import Machine
+from routers import machines as machines_router
+from routers.machines import _query_machines_db
+from services import fleet_snapshot as fleet_snapshot_module
+from services.fleet_snapshot import FleetSnapshot
+from services.machine_events import machine_event_payload
+from services.machine_search import machine_count_cache
+
+STATUSES = ("Online", "Offline", "Error")
+ARCHES = ("x86_64", "aarch64", None)
+ACCELERATORS = ("NVIDIA", "Huawei Ascend", None)
+FILTERS = [
+    {},
+    {"status": "Online"},
+    {"arch": "aarch64", "acc_type": "Idle"},
+    {"acc_type": "NoAcc"},
+    {"acc_type": "Warning", "status": "Error"},
+    {"search": "10.14.0.1"},
+    {"search": "ADMIN"},
+    {"search": "asc", "arch": "x86_64"},
+    {"search": "nv"},
+]
+
+
+def random_fields(rng: random.Random) -> dict:
+    count = rng.choice((0, 4, 8))
+    idle = rng.randint(0, count)
+    busy = rng.randint(0, count - idle)
+    return {
+        "status": rng.choice(STATUSES),
+        "arch": rng.choice(ARCHES),
+        "accelerator_type": rng.choice(ACCELERATORS) if count else None,
+        "accelerator_count": count,
+        "idle_count": idle,
+        "busy_count": busy,
+        "warning_count": count - idle - busy,
+    }
+
+
+def page_ips(snapshot: FleetSnapshot, after_ip=None, **filters) -> tuple:
+    _, total, items = snapshot.query(size=7, after_ip=after_ip, fields=["id", "ip"], **filters)
+    return total, [item["ip"] for item in items]
+
+
+def db_page_ips(after_ip=None, **filters) -> tuple:
+    machine_count_cache.clear()
+    total, items = _query_machines_db(
+        ["id", "ip"], filters.get("search"), filters.get("arch"), filters.get("status"), filters.get("acc_type"),
+        0, 7, after_ip,
+    )
+    return total, [item["ip"] for item in items]
+
+
+@pytest.fixture
+def fleet(clean_db):
+    rng = random.Random(7)
+    with Session(database.engine) as session:
+        for i in range(1, 61):
+            session.add(Machine(
+                ip=f"10.14.0.{i}", username=rng.choice(("root", "admin")), password="pw", **random_fields(rng)
+            ))
+        session.commit()
+    snapshot = FleetSnapshot()
+    snapshot.load()
+    return rng, snapshot
+
+
+def test_snapshot_pages_match_the_database_after_random_changes(fleet):
+    rng, snapshot = fleet
+    next_ip = 100
+    with Session(database.engine, expire_on_commit=False) as session:
+        for _ in range(150):
+            machines = session.exec(select(Machine)).all()
+            action = rng.random()
+            if action < 0.1 and machines:
+                machine = rng.choice(machines)
+                session.delete(machine)
+                session.commit()
+                snapshot.on_event("deleted", {"id": machine.id})
+            elif action < 0.2:
+                machine = Machine(ip=f"10.14.1.{next_ip}", username="admin", password="pw", **random_fields(rng))
+                next_ip += 1
+                session.add(machine)
+                session.commit()
+                snapshot.on_event("created", machine_event_payload(machine))
+            else:
+                machine = rng.choice(machines)
+                changes = {k: v for k, v in random_fields(rng).items() if rng.random() < 0.5}
+                for name, value in changes.items():
+                    setattr(machine, name, value)
+                session.add(machine)
+                session.commit()
+                snapshot.on_event("machine", {"id": machine.id, **changes})
+
+    for filters in FILTERS:
+        total, ips = page_ips(snapshot, **filters)
+        assert (total, ips) == db_page_ips(**filters), filters
+        if len(ips) > 4:
+            assert page_ips(snapshot, after_ip=ips[4], **filters) == db_page_ips(after_ip=ips[4], **filters), filters
+
+
+def test_partial_event_for_an_unknown_machine_is_ignored(fleet):
+    _, snapshot = fleet
+    version, total, _ = snapshot.query()
+
+    snapshot.on_event("machine", {"id": 99999, "status": "Online"})
+
+    assert snapshot.query()[1] == total
+    assert snapshot.version == version + 1
+
+
+def test_cached_results_are_dropped_when_a_filtered_field_changes(fleet):
+    _, snapshot = fleet
+    _, total, items = snapshot.query(status="Online", fields=["id", "ip"])
+    assert snapshot.stats()["cached_results"] == 1
+
+    snapshot.on_event("machine", {"id": items[0]["id"], "remark": "moved racks"})
+    assert snapshot.stats()["cached_results"] == 1
+
+    snapshot.on_event("machine", {"id": items[0]["id"], "status": "Offline"})
+    assert snapshot.stats()["cached_results"] == 0
+    assert snapshot.query(status="Online")[1] == total - 1
+
+
+def test_list_falls_back_to_the_database_when_the_snapshot_cannot_load(fleet, monkeypatch):
+    _, snapshot = fleet
+
+    class BrokenSession(Session):
+        def exec(self, statement):
+            raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(fleet_snapshot_module, "Session", BrokenSession)
+    with pytest.raises(RuntimeError):
+        snapshot.load()
+    assert not snapshot.loaded
+    monkeypatch.setattr(machines_router, "fleet_snapshot", snapshot)
+
+    request = Request({"type": "http", "method": "GET", "path": "/machines", "headers": []})
+    response = machines_router.read_machines(
+        request, page=1, size=7, cursor=None, fields="id,ip", search=None, arch=None, status="Online",
+        acc_type=None, if_none_match=None,
+    )
+
+    body = json.loads(response.body)
+    assert "-d" in response.headers["etag"]
+    assert (body["total"], [item["ip"] for item in body["items"]]) == db_page_ips(status="Online")
+
+    monkeypatch.setattr(fleet_snapshot_module, "Session", Session)
+    snapshot.ensure_loaded()
+    assert snapshot.loaded
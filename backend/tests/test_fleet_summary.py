@@ -0,0 +1,36 @@
+from services import fleet_summary as fleet_summary_module
+from services.fleet_summary import FleetSummary
+
+
+def test_load_and_events_keep_totals(insert_machine):
+    a = insert_machine("10.2.0.1", status="Online", arch="x86_64", accelerator_type="NVIDIA", accelerator_count=8, idle_count=8)
+    insert_machine("10.2.0.2", status="Offline", arch="aarch64")
+    summary = FleetSummary()
+    summary.load()
+
+    summary.on_event("machine", {"id": a.id, "idle_count": 6, "busy_count": 2})
+    snapshot = summary.snapshot()
+
+    assert snapshot["total"] == {"machines": 2, "accelerators": 8, "idle": 6, "busy": 2, "warning": 0}
+    by_status = {group["key"]: group["machines"] for group in snapshot["by_status"]}
+    assert by_status == {"Offline": 1, "Online": 1}
+
+    summary.on_event("deleted", {"id": a.id})
+    assert summary.snapshot()["total"]["machines"] == 1
+    assert [group["key"] for group in summary.snapshot()["by_accelerator_type"]] == ["None"]
+
+
+def test_event_during_load_is_not_overwritten(insert_machine, racing_session, monkeypatch):
+    machine = insert_machine("10.2.0.3", status="Online", accelerator_count=4, idle_count=4)
+    summary = FleetSummary()
+    RacingSession = racing_session(
+        fleet_summary_module.Session,
+        lambda: summary.on_event("machine", {"id": machine.id, "status": "Offline"}),
+    )
+
+    monkeypatch.setattr(fleet_summary_module, "Session", RacingSession)
+    summary.load()
+    RacingSession.racer.join(5)
+
+    by_status = {group["key"]: group["machines"] for group in summary.snapshot()["by_status"]}
+    assert by_status == {"Offline": 1}
@@ -0,0 +1,181 @@
+import asyncio
+import gzip
+import json
+import time
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event
+from sqlmodel import Session
+from starlette.requests import Request
+
+import database
+from models import Machine, Settings, SettingsRead
+from routers import ingest as ingest_router
+from routers.settings import router as settings_router
+from services import topo_service
+from services.agent_presence import agent_presence
+from services.agent_service import IngestError, MAX_INGEST_REPORTS, _validate_report, ingest_reports
+from services.monitor_service import MONITOR_SECTION_DELIM
+
+TOKEN = "test-token"
+
+
+def report(ip="10.4.0.1", ts=None, **fields):
+    return {"ip": ip, "ts": ts if ts is not None else time.time(), "interval": 60, **fields}
+
+
+@pytest.mark.parametrize("value, error", [
+    ("nope", "report must be an object"),
+    ({"ts": 1, "interval": 60, "error": "x"}, "missing ip"),
+    (report(ts="soon", error="x"), "missing ts"),
+    (report(interval=0, error="x"), "invalid interval"),
+    (report(), "report needs sections or error"),
+    (report(sections="aarch64"), "sections must be a list of strings"),
+    (report(sections=["x" * (256 * 1024 + 1)]), "section too large"),
+])
+def test_validate_report_rejects(value, error):
+    assert _validate_report(value) == error
+
+
+def test_validate_report_accepts_sections_or_error():
+    assert _validate_report(report(sections=["aarch64", "Ubuntu"])) is None
+    assert _validate_report(report(error="probe timed out")) is None
+
+
+@pytest.fixture
+def machine(clean_db, monkeypatch):
+    monkeypatch.setattr(topo_service, "trigger_topo_update_async", lambda *args, **kwargs: None)
+    with Session(database.engine) as session:
+        machine = Machine(ip="10.4.0.1", username="root", password="pw")
+        session.add(machine)
+        session.add(Settings(ingest_token=TOKEN))
+        session.commit()
+        session.refresh(machine)
+    agent_presence.forget(machine.id)
+    yield machine
+    agent_presence.forget(machine.id)
+
+
+def load(machine_id):
+    with Session(database.engine) as session:
+        return session.get(Machine, machine_id)
+
+
+def test_ingest_reports_applies_newest_report_per_machine(machine):
+    now = time.time()
+    results = ingest_reports([
+        report(ts=now - 10, sections=["x86_64"]),
+        report(ts=now, sections=["aarch64", "Ubuntu 22.04", "NVIDIA_NOT_FOUND", "HUAWEI_NOT_FOUND"]),
+        report(ip="10.4.0.99", sections=["aarch64"]),
+        {"ip": "10.4.0.1"},
+    ])
+
+    assert [r["result"] for r in results] == ["superseded", "applied", "unknown", "invalid"]
+    row = load(machine.id)
+    assert (row.status, row.arch, row.os_info) == ("Online", "aarch64", "Ubuntu 22.04")
+    assert agent_presence.is_fresh(machine.id)
+
+
+def test_ingest_reports_ignores_reports_older_than_the_last_applied(machine):
+    now = time.time()
+    ingest_reports([report(ts=now, sections=["aarch64"])])
+    assert ingest_reports([report(ts=now - 1, sections=["x86_64"])]) == [{"result": "stale"}]
+    assert load(machine.id).arch == "aarch64"
+
+
+def test_ingest_reports_records_probe_errors(machine):
+    ingest_reports([report(error="npu-smi hung")])
+    row = load(machine.id)
+    assert row.status == "Error"
+    assert "npu-smi hung" in row.error_message
+
+
+def test_ingest_batch_touches_agent_presence_once_per_direction(machine):
+    with Session(database.engine) as session:
+        session.add_all([Machine(ip=f"10.4.1.{i}", username="root", password="pw") for i in range(50)])
+        session.commit()
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "agent_presence" in statement:
+            statements.append((statement.split()[0], executemany))
+
+    event.listen(database.engine, "before_cursor_execute", record)
+    try:
+        results = ingest_reports([report(ip=f"10.4.1.{i}", error="probe failed") for i in range(50)])
+    finally:
+        event.remove(database.engine, "before_cursor_execute", record)
+
+    assert {r["result"] for r in results} == {"applied"}
+    assert statements == [("SELECT", False), ("INSERT", True)]
+    assert len(agent_presence.fresh_ids()) == 50
+
+
+def test_ingest_reports_rejects_bad_batches():
+    with pytest.raises(IngestError):
+        ingest_reports({"ip": "10.4.0.1"})
+    with pytest.raises(IngestError):
+        ingest_reports([report(error="x")] * (MAX_INGEST_REPORTS + 1))
+
+
+def make_request(body: bytes, headers: dict, chunk_size: int = 1 << 16) -> Request:
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] or [b""]
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+        for i, chunk in enumerate(chunks)
+    ]
+
+    async def receive():
+        return messages.pop(0)
+
+    raw_headers = [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": "POST", "path": "/ingest", "headers": raw_headers}, receive)
+
+
+def post(body: bytes, headers: dict = None, token: str = TOKEN, chunk_size: int = 1 << 16):
+    return asyncio.run(ingest_router.ingest(make_request(body, headers or {}, chunk_size), token))
+
+
+def test_endpoint_accepts_gzip_batches(machine):
+    body = gzip.compress(json.dumps({"reports": [report(sections=["aarch64"])]}).encode())
+    result = post(body, {"content-encoding": "gzip"})
+    assert (result["received"], result["applied"]) == (1, 1)
+
+
+def test_endpoint_rejects_wrong_token(machine):
+    with pytest.raises(HTTPException) as excinfo:
+        post(b"[]", token="guess")
+    assert excinfo.value.status_code == 401
+
+
+def test_endpoint_rejects_declared_oversized_body(machine, monkeypatch):
+    monkeypatch.setattr(ingest_router, "MAX_INGEST_BODY_BYTES", 1024)
+    with pytest.raises(HTTPException) as excinfo:
+        post(b"[]", {"content-length": "4096"})
+    assert excinfo.value.status_code == 413
+
+
+def test_endpoint_stops_reading_oversized_stream(machine, monkeypatch):
+    monkeypatch.setattr(ingest_router, "MAX_INGEST_BODY_BYTES", 1024)
+    with pytest.raises(HTTPException) as excinfo:
+        post(b"[" + b" " * 4096 + b"]", chunk_size=256)
+    assert excinfo.value.status_code == 413
+
+
+@pytest.mark.parametrize("body", [
+    gzip.compress(b'{"reports": []}')[:-6],  # truncated
+    b"\x1f\x8b\x08\x00" + b"\x00" * 6 + b"garbage-deflate-stream",  # corrupt
+    b"not gzip at all",
+])
+def test_endpoint_rejects_broken_gzip_with_400(machine, body):
+    with pytest.raises(HTTPException) as excinfo:
+        post(body, {"content-encoding": "gzip"})
+    assert excinfo.value.status_code == 400
+
+
+def test_settings_responses_do_not_expose_the_ingest_token():
+    routes = [r for r in settings_router.routes if r.path == "/settings"]
+    assert routes and all(r.response_model is SettingsRead for r in routes)
+    dumped = SettingsRead.model_validate(Settings(ingest_token=TOKEN), from_attributes=True).model_dump()
+    assert "ingest_token" not in dumped
@@ -0,0 +1,66 @@
+import gzip
+import json
+from datetime import datetime
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from starlette.requests import Request
+
+from models import Machine
+from services import json_response as json_response_module
+from services.json_response import json_response, negotiate_encoding
+
+
+def make_request(accept_encoding: str = "gzip") -> Request:
+    headers = [(b"accept-encoding", accept_encoding.encode())] if accept_encoding else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def payload() -> dict:
+    machines = [
+        Machine(id=i, ip=f"10.3.0.{i}", username="root", password="pw", remark="机房 A", last_updated=datetime(2026, 10, 18, 12, 0, i))
+        for i in range(20)
+    ]
+    return {"items": machines, "total": 20, "next_cursor": None}
+
+
+def test_default_is_plain_json_response(monkeypatch):
+    monkeypatch.setattr(json_response_module, "FAST_JSON", False)
+    monkeypatch.setattr(json_response_module, "COMPRESS_RESPONSES", False)
+    content = payload()
+
+    response = json_response(make_request(), content)
+
+    assert response.body == JSONResponse(content=jsonable_encoder(content)).body
+    assert "content-encoding" not in response.headers
+    assert "vary" not in response.headers
+
+
+def test_fast_json_matches_default(monkeypatch):
+    content = payload()
+    monkeypatch.setattr(json_response_module, "FAST_JSON", False)
+    default = json.loads(json_response_module.dumps(content))
+    monkeypatch.setattr(json_response_module, "FAST_JSON", True)
+
+    assert json.loads(json_response_module.dumps(content)) == default
+
+
+def test_compression_is_opt_in(monkeypatch):
+    monkeypatch.setattr(json_response_module, "COMPRESS_RESPONSES", True)
+    content = payload()
+
+    response = json_response(make_request("gzip, deflate"), content)
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert json.loads(gzip.decompress(response.body)) == json.loads(json_response_module.dumps(content))
+
+    small = json_response(make_request(), {"ok": True})
+    assert "content-encoding" not in small.headers
+    assert "content-encoding" not in json_response(make_request(""), content).headers
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding("gzip;q=0, identity") is None
+    assert negotiate_encoding("deflate, gzip;q=0.5") == "gzip"
+    assert negotiate_encoding(None) is None
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from services.machine_events import MachineEventBroker
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+def drain(subscriber):
+    events = []
+    while not subscriber.queue.empty():
+        seq, event_type, _ = subscriber.queue.get_nowait()
+        events.append((seq, event_type))
+    return events
+
+
+def make_broker(events: int = 3, history_size: int = 10) -> MachineEventBroker:
+    broker = MachineEventBroker(history_size=history_size)
+    for i in range(events):
+        broker.publish("machine", {"id": i})
+    return broker
+
+
+def test_event_ids_round_trip_and_resume(loop):
+    broker = make_broker()
+    subscriber = broker.subscribe(loop, broker.event_id(1))
+    assert drain(subscriber) == [(2, "machine"), (3, "machine")]
+
+
+def test_current_id_replays_nothing(loop):
+    broker = make_broker()
+    assert drain(broker.subscribe(loop, broker.event_id(3))) == []
+    assert drain(broker.subscribe(loop, None)) == []
+
+
+@pytest.mark.parametrize("last_event_id", [
+    "0123abc-500",  # previous process lifetime, sequence higher than ours
+    "0123abc-1",  # previous process lifetime, sequence lower than ours
+    "42",  # id format of older servers
+    "garbage",
+])
+def test_foreign_ids_get_resync(loop, last_event_id):
+    broker = make_broker()
+    assert drain(broker.subscribe(loop, last_event_id)) == [(3, "resync")]
+
+
+def test_id_ahead_of_sequence_gets_resync(loop):
+    broker = make_broker()
+    assert drain(broker.subscribe(loop, broker.event_id(99))) == [(3, "resync")]
+
+
+def test_id_older_than_history_gets_resync(loop):
+    broker = make_broker(events=5, history_size=2)
+    assert drain(broker.subscribe(loop, broker.event_id(1))) == [(5, "resync")]
+
+
+def test_removed_listener_is_not_called():
+    broker, received = MachineEventBroker(), []
+    listener = lambda event_type, data: received.append(data["id"])
+    broker.add_listener(listener)
+    broker.publish("machine", {"id": 1})
+    broker.remove_listener(listener)
+    broker.publish("machine", {"id": 2})
+
+    assert received == [1]
@@ -0,0 +1,55 @@
+import json
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import inspect, text
+from sqlmodel import Session
+
+import database
+from models import Machine, MachineTopology
+from routers.machines import _projection_names, _query_machines_db
+from services.machine_search import machine_count_cache
+
+
+def test_projection_always_includes_id_and_ip():
+    assert _projection_names("status, ip,,status") == ["id", "ip", "status"]
+
+
+def test_projection_rejects_unknown_columns():
+    with pytest.raises(HTTPException) as raised:
+        _projection_names("status,pci_topo_json,bogus")
+    assert raised.value.status_code == 400
+    assert "pci_topo_json, bogus" in raised.value.detail
+
+
+def test_projected_rows_carry_only_the_requested_columns(clean_db):
+    machine_count_cache.clear()
+    with Session(database.engine) as session:
+        session.add(Machine(ip="10.13.0.1", username="root", password="secret", status="Online"))
+        session.commit()
+
+    total, items = _query_machines_db(_projection_names("status"), None, None, None, None, 0, 10, None)
+
+    assert total == 1
+    assert items == [{"id": items[0]["id"], "ip": "10.13.0.1", "status": "Online"}]
+
+
+def test_topologies_of_older_databases_move_to_the_side_table(clean_db):
+    topology = json.dumps({"nodes": [{"id": "0000:00:00.0"}]})
+    with clean_db.begin() as conn:
+        conn.execute(text("ALTER TABLE machine ADD COLUMN pci_topo_json VARCHAR"))
+        conn.execute(text(
+            "INSERT INTO machine (id, ip, port, username, password, status, accelerator_count, idle_count, "
+            "busy_count, warning_count, is_own, stream_enabled, pci_topo_json) "
+            "VALUES (7, '10.13.0.7', 22, 'root', 'pw', 'Online', 0, 0, 0, 0, 0, 0, :topo)"
+        ), {"topo": topology})
+
+    database._move_topology_out_of_machine_rows()
+
+    with Session(clean_db) as session:
+        assert session.get(MachineTopology, 7).pci_topo_json == topology
+    columns = {c["name"] for c in inspect(clean_db).get_columns("machine")}
+    if "pci_topo_json" in columns:
+        # SQLite before 3.35 keeps the column but clears it
+        with clean_db.connect() as conn:
+            assert conn.execute(text("SELECT pci_topo_json FROM machine")).scalar() is None
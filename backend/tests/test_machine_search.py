@@ -0,0 +1,76 @@
+import pytest
+from sqlmodel import Session
+
+import database
+from models import Machine
+from routers.machines import _query_machines_db
+from services.machine_search import (
+    MachineCountCache,
+    decode_cursor,
+    encode_cursor,
+    machine_count_cache,
+)
+
+
+@pytest.mark.parametrize("ip", ["10.6.0.1", "host-a.example", "fe80::1", "机房-01"])
+def test_cursor_round_trips(ip):
+    cursor = encode_cursor(ip)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == ip
+
+
+@pytest.mark.parametrize("cursor", ["!!!", "a", "", "MTAu/w", "_w"])
+def test_malformed_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+@pytest.fixture
+def machines(clean_db):
+    machine_count_cache.clear()
+    rows = [
+        Machine(ip=f"10.6.0.{i}", username="root" if i % 2 else "admin", password="pw", accelerator_type="NVIDIA" if i < 4 else None)
+        for i in range(1, 11)
+    ]
+    ips = sorted(row.ip for row in rows)
+    with Session(database.engine) as session:
+        session.add_all(rows)
+        session.commit()
+    yield ips
+    machine_count_cache.clear()
+
+
+def test_keyset_pages_walk_every_machine_once(machines):
+    seen, after_ip = [], None
+    while True:
+        total, items = _query_machines_db(["id", "ip"], None, None, None, None, 0, 3, after_ip)
+        assert total == len(machines)
+        seen += [item["ip"] for item in items]
+        if len(items) < 3:
+            break
+        after_ip = decode_cursor(encode_cursor(items[-1]["ip"]))
+
+    assert seen == machines
+
+
+def test_search_filters_pages_and_totals(machines):
+    total, items = _query_machines_db(["id", "ip"], "NVIDIA", None, None, None, 0, 2, None)
+    assert total == 3
+    assert [item["ip"] for item in items] == ["10.6.0.1", "10.6.0.2"]
+
+    total, items = _query_machines_db(["id", "ip"], "NVIDIA", None, None, None, 0, 2, decode_cursor(encode_cursor("10.6.0.2")))
+    assert total == 3
+    assert [item["ip"] for item in items] == ["10.6.0.3"]
+
+
+def test_count_cache_ignores_results_from_an_older_generation():
+    cache = MachineCountCache()
+    generation = cache.generation
+    cache.on_event("machine", {"id": 1, "status": "Offline"})
+    cache.put(("x",), generation, 5)
+
+    assert cache.get(("x",)) is None
+    cache.on_event("machine", {"id": 1, "remark": "noted"})
+    cache.put(("x",), cache.generation, 5)
+    assert cache.get(("x",)) == 5
@@ -0,0 +1,69 @@
+import gzip
+import json
+from datetime import datetime
+
+from services import metrics_exporter as metrics_exporter_module
+from services.metrics_exporter import MIB_BYTES, MetricsExporter
+
+
+def samples(exporter: MetricsExporter) -> dict:
+    """Metric line -> value, without HELP/TYPE comments."""
+    result = {}
+    for line in exporter.render().decode().splitlines():
+        if line and not line.startswith("#"):
+            series, _, value = line.rpartition(" ")
+            result[series] = value
+    return result
+
+
+def test_machine_and_card_samples():
+    exporter = MetricsExporter()
+    cards = [
+        {"id": 0, "name": "910B3", "memory_used": 2, "memory_total": 64, "temp": "40C", "health": "OK", "busy": True},
+        {"id": 0, "name": "A100", "memory_used": 0, "memory_total": 80, "temp": "N/A", "health": "Warning", "busy": False},
+    ]
+    exporter.on_event("created", {
+        "id": 3,
+        "ip": '10.12.0."3"',
+        "status": "Online",
+        "accelerator_count": 2,
+        "accelerator_status": json.dumps(cards),
+        "last_updated": datetime(2026, 10, 18, 12, 0, 0),
+    })
+
+    result = samples(exporter)
+    labels = 'machine_id="3",ip="10.12.0.\\"3\\""'
+    assert result[f"gpu_monitor_machine_up{{{labels}}}"] == "1"
+    assert result[f'gpu_monitor_machine_status{{{labels},status="Offline"}}'] == "0"
+    assert result[f'gpu_monitor_card_memory_used_bytes{{{labels},card="0",model="910B3"}}'] == str(2 * MIB_BYTES)
+    assert result[f'gpu_monitor_card_healthy{{{labels},card="0#1",model="A100"}}'] == "0"
+    assert f'gpu_monitor_card_temperature_celsius{{{labels},card="0#1",model="A100"}}' not in result
+
+
+def test_render_is_cached_until_an_event_changes_it():
+    exporter = MetricsExporter()
+    exporter.on_event("created", {"id": 1, "ip": "10.12.0.1", "status": "Offline"})
+    body = exporter.render()
+
+    assert exporter.render() is body
+    assert gzip.decompress(exporter.render(gzipped=True)) == body
+
+    exporter.on_event("machine", {"id": 1, "status": "Online"})
+    assert exporter.render() != body
+    exporter.on_event("deleted", {"id": 1})
+    assert "10.12.0.1" not in exporter.render().decode()
+
+
+def test_event_during_load_is_not_overwritten(insert_machine, racing_session, monkeypatch):
+    machine = insert_machine("10.12.0.2", status="Online")
+    exporter = MetricsExporter()
+    RacingSession = racing_session(
+        metrics_exporter_module.Session,
+        lambda: exporter.on_event("machine", {"id": machine.id, "status": "Offline"}),
+    )
+
+    monkeypatch.setattr(metrics_exporter_module, "Session", RacingSession)
+    exporter.load()
+    RacingSession.racer.join(5)
+
+    assert samples(exporter)[f'gpu_monitor_machine_up{{machine_id="{machine.id}",ip="10.12.0.2"}}'] == "0"
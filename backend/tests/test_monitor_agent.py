@@ -0,0 +1,50 @@
+import io
+import json
+import urllib.error
+
+import pytest
+
+from agent import monitor_agent
+
+CONFIG = {"server_url": "http://monitor:8000", "token": "t1", "ip": "10.5.0.1", "command": "true", "delimiter": "|"}
+
+
+def fail_with(code):
+    def urlopen(request, timeout=None):
+        raise urllib.error.HTTPError(request.full_url, code, "error", {}, io.BytesIO(b""))
+    return urlopen
+
+
+@pytest.mark.parametrize("code, outcome", [
+    (401, monitor_agent.PUSH_AUTH_FAILED),
+    (403, monitor_agent.PUSH_AUTH_FAILED),
+    (400, monitor_agent.PUSH_REJECTED),
+    (413, monitor_agent.PUSH_REJECTED),
+    (503, monitor_agent.PUSH_RETRY),
+])
+def test_push_outcome_by_status(monkeypatch, code, outcome):
+    monkeypatch.setattr(monitor_agent.urllib.request, "urlopen", fail_with(code))
+    assert monitor_agent.push(dict(CONFIG), [{"ip": "10.5.0.1"}]) == outcome
+
+
+def test_push_keeps_batch_when_server_is_unreachable(monkeypatch):
+    def urlopen(request, timeout=None):
+        raise urllib.error.URLError("connection refused")
+    monkeypatch.setattr(monitor_agent.urllib.request, "urlopen", urlopen)
+    assert monitor_agent.push(dict(CONFIG), []) == monitor_agent.PUSH_RETRY
+
+
+def test_auth_backoff_grows_to_a_cap():
+    delays = [monitor_agent.auth_backoff_seconds(n, 60) for n in range(1, 6)]
+    assert delays == [120, 240, 480, 600, 600]
+
+
+def test_reload_token_picks_up_rotated_token(tmp_path):
+    path = tmp_path / "agent.json"
+    path.write_text(json.dumps(CONFIG))
+    config = dict(CONFIG)
+    assert not monitor_agent.reload_token(config, str(path))
+
+    path.write_text(json.dumps({**CONFIG, "token": "t2"}))
+    assert monitor_agent.reload_token(config, str(path))
+    assert config["token"] == "t2"
@@ -0,0 +1,56 @@
+import re
+import time
+from types import SimpleNamespace
+
+from sqlmodel import Session
+
+import database
+from models import Machine, Settings
+from services import monitor_service
+from services.stream_collector import stream_collector
+
+
+def test_poll_cycle_counts_only_agents_in_this_partition(clean_db, monkeypatch):
+    with Session(database.engine) as session:
+        session.add_all([Machine(id=i, ip=f"10.15.0.{i}", username="root", password="pw") for i in range(1, 11)])
+        session.commit()
+    polled, logged = [], []
+    monkeypatch.setattr(monitor_service, "check_log_rotation", lambda: None)
+    monkeypatch.setattr(monitor_service.cluster, "owns", lambda machine_id: machine_id <= 5)
+    # Agents report machines 4..8; only 4 and 5 belong to this instance
+    monkeypatch.setattr(monitor_service.agent_presence, "fresh_ids", lambda now=None: {4, 5, 6, 7, 8})
+    monkeypatch.setattr(monitor_service.adaptive_intervals, "is_due", lambda *args, **kwargs: True)
+    monkeypatch.setattr(
+        monitor_service, "poll_machines",
+        lambda machines, settings: polled.extend(m.id for m in machines) or SimpleNamespace(changed_count=0, heartbeat_count=0),
+    )
+    monkeypatch.setattr(monitor_service.logger, "info", logged.append)
+
+    monitor_service.update_all_machines()
+
+    assert polled == [1, 2, 3]
+    counts = re.search(r"\((\d+) reported by agents, (-?\d+) deferred by adaptive interval or live stream, (\d+) polled by other", logged[-1])
+    assert counts.groups() == ("2", "0", "5")
+
+
+def test_full_polls_of_streaming_hosts_are_spaced_out(clean_db, monkeypatch):
+    with Session(database.engine) as session:
+        session.add_all([Machine(id=i, ip=f"10.15.1.{i}", username="root", password="pw") for i in (1, 2)])
+        session.commit()
+    polled = []
+    monkeypatch.setattr(monitor_service, "check_log_rotation", lambda: None)
+    monkeypatch.setattr(monitor_service.agent_presence, "fresh_ids", lambda now=None: set())
+    monkeypatch.setattr(monitor_service, "get_poll_settings", lambda: Settings(interval_seconds=60))
+    monkeypatch.setattr(stream_collector, "is_streaming", lambda machine_id: machine_id == 2)
+    monkeypatch.setattr(
+        monitor_service, "poll_machines",
+        lambda machines, settings: polled.append([m.id for m in machines]) or SimpleNamespace(changed_count=0, heartbeat_count=0),
+    )
+    # Both were fully polled 5 intervals ago
+    monkeypatch.setattr(monitor_service.adaptive_intervals, "_state", {})
+    for machine_id in (1, 2):
+        monitor_service.adaptive_intervals.observe(Machine(id=machine_id, status="Online"), time.time() - 300)
+
+    monitor_service.update_all_machines()
+
+    assert polled == [[1]]
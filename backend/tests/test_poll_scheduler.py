@@ -0,0 +1,85 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlmodel import Session
+
+import database
+from models import Machine, Settings
+from services import poll_scheduler
+from services.poll_scheduler import StaggeredPollScheduler, next_slot, slot_offset
+
+INTERVAL = 60
+
+
+@pytest.mark.parametrize("machine_id", [1, 2, 17, 40000])
+def test_slots_are_stable_and_inside_the_interval(machine_id):
+    offset = slot_offset(machine_id, INTERVAL)
+
+    assert 0 <= offset < INTERVAL
+    assert slot_offset(machine_id, INTERVAL) == offset
+
+
+def test_next_slot_is_strictly_after_and_on_the_slot():
+    offset = slot_offset(5, INTERVAL)
+
+    for after_ts in (1000.0, 1000.0 + offset, 5000.5):
+        slot = next_slot(offset, INTERVAL, after_ts)
+        assert after_ts < slot <= after_ts + INTERVAL
+        assert (slot - offset) % INTERVAL == pytest.approx(0)
+
+
+def test_slots_spread_over_the_interval():
+    offsets = [slot_offset(machine_id, INTERVAL) for machine_id in range(1, 6001)]
+    per_ten_seconds = [sum(1 for o in offsets if start <= o < start + 10) for start in range(0, INTERVAL, 10)]
+
+    assert min(per_ten_seconds) > 800
+
+
+@pytest.fixture
+def clock(clean_db, monkeypatch):
+    now = [100000.0]
+    monkeypatch.setattr(poll_scheduler, "time", SimpleNamespace(time=lambda: now[0]))
+    monkeypatch.setattr(poll_scheduler, "get_poll_settings", lambda: Settings(interval_seconds=INTERVAL))
+    monkeypatch.setattr(poll_scheduler.telemetry_store, "flush", lambda: None)
+    with Session(database.engine) as session:
+        session.add_all([Machine(ip=f"10.10.0.{i}", username="root", password="pw") for i in range(1, 51)])
+        session.commit()
+    return now
+
+
+def test_each_machine_is_dispatched_once_per_interval_and_never_overlaps(clock):
+    scheduler = StaggeredPollScheduler()
+    dispatched = []
+    scheduler._dispatch = lambda machine_ids, settings: dispatched.extend(machine_ids)
+
+    # First sighting only assigns slots
+    scheduler.tick()
+    assert dispatched == []
+
+    for _ in range(INTERVAL):
+        clock[0] += 1
+        scheduler.tick()
+    assert sorted(dispatched) == sorted(set(dispatched)) and len(dispatched) == 50
+
+    # Nothing finished, so every slot of the next interval is an overrun, not a second poll
+    for _ in range(INTERVAL):
+        clock[0] += 1
+        scheduler.tick()
+    assert len(dispatched) == 50
+    assert scheduler.stats()["last_cycle"]["overruns"] + scheduler.stats()["current_cycle"]["overruns"] == 50
+
+
+def test_machines_reported_by_agents_are_not_dispatched(clock, monkeypatch):
+    pushed = {1, 2, 3}
+    monkeypatch.setattr(poll_scheduler.agent_presence, "fresh_ids", lambda now=None: pushed)
+    scheduler = StaggeredPollScheduler()
+    dispatched = []
+    scheduler._dispatch = lambda machine_ids, settings: dispatched.extend(machine_ids)
+
+    scheduler.tick()
+    for _ in range(INTERVAL):
+        clock[0] += 1
+        scheduler.tick()
+
+    assert len(dispatched) == 47
+    assert not pushed & set(dispatched)
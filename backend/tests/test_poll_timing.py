@@ -0,0 +1,56 @@
+import pytest
+
+from services.poll_timing import LatencyHistogram, PollTimings, BUCKET_BOUNDS, PHASE_CONNECT, PHASE_POLL
+
+
+def histogram(*samples) -> LatencyHistogram:
+    result = LatencyHistogram()
+    for seconds in samples:
+        result.observe(seconds)
+    return result
+
+
+def test_empty_histogram_has_no_percentiles():
+    assert LatencyHistogram().percentile(0.5) is None
+    assert LatencyHistogram().summary()["p50_ms"] is None
+
+
+def test_percentiles_never_exceed_the_largest_sample():
+    h = histogram(*[0.003] * 100)
+
+    assert h.percentile(0.5) == pytest.approx(0.003)
+    assert h.percentile(0.99) == pytest.approx(0.003)
+
+
+def test_percentiles_are_interpolated_within_their_bucket():
+    h = histogram(*([0.0015] * 90 + [1.0] * 10))
+
+    p50, p95, p99 = h.percentile(0.5), h.percentile(0.95), h.percentile(0.99)
+    assert 0.001 <= p50 <= 0.002
+    assert 0.512 <= p95 < p99 <= 1.0
+    assert h.summary()["max_ms"] == 1000.0
+
+
+def test_samples_beyond_the_last_bound_use_the_maximum():
+    slow = BUCKET_BOUNDS[-1] * 4
+    h = histogram(0.01, slow)
+
+    assert BUCKET_BOUNDS[-1] <= h.percentile(0.99) <= slow
+    assert h.percentile(1.0) == pytest.approx(slow)
+
+
+def test_phases_are_attributed_to_the_host_being_polled():
+    class Machine:
+        id, ip = 1, "10.5.0.1"
+
+    timings = PollTimings()
+    record = timings.begin_host(Machine())
+    timings.observe(PHASE_CONNECT, 0.25)
+    timings.end_host(record, "Online")
+
+    host = timings.host_record(1)
+    assert host["phases_ms"] == {PHASE_CONNECT: 250.0}
+    assert timings.report()["phases"][PHASE_POLL]["count"] == 1
+
+    timings.enabled = False
+    assert timings.begin_host(Machine()) is None
@@ -0,0 +1,141 @@
+import threading
+import time
+
+import pytest
+from sqlmodel import Session
+
+import database
+from models import Machine, RefreshJob
+from services import refresh_jobs as refresh_jobs_module
+from services.refresh_jobs import RefreshJobQueue, JOB_DONE, JOB_FAILED, JOB_RUNNING
+
+
+@pytest.fixture
+def machine_id(clean_db):
+    with Session(database.engine) as session:
+        machine = Machine(ip="10.6.0.1", username="root", password="pw")
+        session.add(machine)
+        session.commit()
+        session.refresh(machine)
+        return machine.id
+
+
+@pytest.fixture
+def queue():
+    queue = RefreshJobQueue(workers=1)
+    yield queue
+    queue._executor.shutdown(wait=True)
+
+
+def wait_for(queue, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job["state"] in (JOB_DONE, JOB_FAILED):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_job_runs_and_is_readable_by_a_fresh_queue(machine_id, queue, monkeypatch):
+    def fake_poll(machine, writer):
+        machine.status = "Online"
+        return True
+    monkeypatch.setattr(refresh_jobs_module, "poll_machine", fake_poll)
+
+    job, coalesced = queue.submit_machine(machine_id)
+    assert not coalesced
+    wait_for(queue, job["job_id"])
+
+    # Another instance, or this one after a restart, reads the same row
+    finished = RefreshJobQueue(workers=1).get(job["job_id"])
+    assert finished["state"] == JOB_DONE
+    assert finished["result"]["polled"] is True
+    assert finished["result"]["machine"]["status"] == "Online"
+
+
+def test_pending_job_is_shared_and_upgraded(machine_id, queue, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(refresh_jobs_module, "poll_machine", lambda machine, writer: release.wait(5) and False)
+
+    first, _ = queue.submit_machine(machine_id)
+    second, coalesced = queue.submit_machine(machine_id, force_topo=True)
+    release.set()
+
+    assert coalesced and second["job_id"] == first["job_id"]
+    assert (second["requests"], second["force_topo"]) == (2, True)
+    assert wait_for(queue, first["job_id"])["result"] == {"polled": False, "machine": None, "topo_queued": False}
+
+
+def test_forced_topo_is_queued_when_the_poll_is_skipped(machine_id, queue, monkeypatch):
+    with Session(database.engine) as session:
+        session.get(Machine, machine_id).status = "Online"
+        session.commit()
+    queued = []
+    monkeypatch.setattr(refresh_jobs_module, "poll_machine", lambda machine, writer: False)
+    monkeypatch.setattr(
+        refresh_jobs_module, "trigger_topo_update_async",
+        lambda machine_id, force, priority: queued.append((machine_id, force, priority)) or "queued",
+    )
+
+    job, _ = queue.submit_machine(machine_id, force_topo=True)
+
+    assert wait_for(queue, job["job_id"])["result"] == {"polled": False, "machine": None, "topo_queued": True}
+    assert queued == [(machine_id, True, refresh_jobs_module.TOPO_PRIORITY_USER)]
+
+
+def test_job_of_a_stopped_instance_is_reported_failed_and_replaced(machine_id, queue, monkeypatch):
+    monkeypatch.setattr(refresh_jobs_module, "poll_machine", lambda machine, writer: False)
+    with Session(database.engine) as session:
+        session.add(RefreshJob(
+            id="deadbeef", target=str(machine_id), machine_id=machine_id,
+            state=JOB_RUNNING, owner="old-host:1:000000", created_ts=time.time(),
+        ))
+        session.commit()
+
+    lost = queue.get("deadbeef")
+    assert lost["state"] == JOB_FAILED
+    assert "stopped" in lost["error"]
+
+    job, coalesced = queue.submit_machine(machine_id)
+    assert not coalesced and job["job_id"] != "deadbeef"
+    wait_for(queue, job["job_id"])
+
+
+def test_unknown_job_is_none(clean_db, queue):
+    assert queue.get("missing") is None
+
+
+def test_refresh_all_polls_this_partition_and_asks_the_others(clean_db, queue, monkeypatch):
+    polls, published = [], []
+    monkeypatch.setattr(refresh_jobs_module, "update_all_machines", lambda: polls.append("local"))
+    monkeypatch.setattr(refresh_jobs_module, "update_all_machines_topo", lambda force: 0)
+    monkeypatch.setattr(refresh_jobs_module.machine_events, "publish", lambda event_type, data: published.append((event_type, data)))
+
+    job, _ = queue.submit_all(force_topo=True)
+    wait_for(queue, job["job_id"])
+
+    assert polls == ["local"]
+    assert published == [(refresh_jobs_module.REFRESH_ALL_EVENT, {"origin": refresh_jobs_module.cluster.instance_id, "force_topo": True})]
+
+
+def test_peer_refresh_requests_run_this_partition_once(queue, monkeypatch):
+    release, started = threading.Event(), []
+    monkeypatch.setattr(refresh_jobs_module, "update_all_machines", lambda: started.append(1) or release.wait(5))
+    monkeypatch.setattr(refresh_jobs_module, "update_all_machines_topo", lambda force: started.append(force))
+    event = refresh_jobs_module.REFRESH_ALL_EVENT
+
+    queue.on_event(event, {"origin": refresh_jobs_module.cluster.instance_id, "force_topo": False})
+    assert started == []
+    # The executor has a single worker: the first blocks it, the next two share one pending refresh
+    queue.on_event(event, {"origin": "peer", "force_topo": True})
+    for _ in range(200):
+        if started:
+            break
+        time.sleep(0.01)
+    queue.on_event(event, {"origin": "peer", "force_topo": False})
+    queue.on_event(event, {"origin": "peer", "force_topo": False})
+    release.set()
+    queue._executor.shutdown(wait=True)
+
+    assert started == [1, True, 1, False]
@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlmodel import Session
+
+import database
+from models import Machine
+from services import topo_service
+from services.machine_events import machine_events
+from services.result_writer import MachineResultWriter, capture_monitor_fields
+
+
+@pytest.fixture
+def events(clean_db, monkeypatch):
+    monkeypatch.setattr(topo_service, "trigger_topo_update_async", lambda machine_id: None)
+    received = []
+    listener = lambda event_type, data: received.append((event_type, data))
+    machine_events.add_listener(listener)
+    yield received
+    machine_events.remove_listener(listener)
+
+
+def update_row(machine_id: int, **fields):
+    with Session(database.engine) as session:
+        machine = session.get(Machine, machine_id)
+        for name, value in fields.items():
+            setattr(machine, name, value)
+        session.add(machine)
+        session.commit()
+
+
+def load_row(machine_id: int) -> Machine:
+    with Session(database.engine) as session:
+        return session.get(Machine, machine_id)
+
+
+def write(machine: Machine, before: dict) -> MachineResultWriter:
+    with MachineResultWriter() as writer:
+        writer.add(machine, before)
+    return writer
+
+
+def test_unchanged_result_is_a_heartbeat(events, insert_machine):
+    machine = insert_machine(status="Online", arch="aarch64", accelerator_count=8)
+    before = capture_monitor_fields(machine)
+    machine.last_updated = datetime.now()
+
+    writer = write(machine, before)
+
+    assert (writer.changed_count, writer.heartbeat_count) == (0, 1)
+    assert load_row(machine.id).last_updated == machine.last_updated
+    assert [event_type for event_type, _ in events] == ["heartbeat"]
+
+
+def test_only_changed_columns_are_published(events, insert_machine):
+    machine = insert_machine(status="Online", accelerator_count=8, idle_count=8)
+    before = capture_monitor_fields(machine)
+    machine.idle_count = 6
+    machine.busy_count = 2
+    machine.last_updated = datetime.now()
+
+    writer = write(machine, before)
+
+    assert writer.changed_count == 1
+    event_type, data = events[-1]
+    assert event_type == "machine"
+    assert set(data) == {"id", "idle_count", "busy_count", "last_updated"}
+
+
+def test_value_equal_to_stale_baseline_still_overwrites_newer_row(events, insert_machine):
+    machine = insert_machine(status="Online", accelerator_count=4, idle_count=4)
+    before = capture_monitor_fields(machine)
+    # Another writer (stream flush, /ingest) commits while the poll runs
+    update_row(machine.id, accelerator_count=8, idle_count=8)
+    machine.last_updated = datetime.now()
+
+    write(machine, before)
+
+    row = load_row(machine.id)
+    assert (row.accelerator_count, row.idle_count) == (4, 4)
+
+
+def test_failed_poll_keeps_fields_it_did_not_observe(events, insert_machine):
+    machine = insert_machine(status="Online", accelerator_count=4)
+    before = capture_monitor_fields(machine)
+    update_row(machine.id, accelerator_count=8)
+    machine.status = "Offline"
+    machine.error_message = "Connection failed: timed out"
+    machine.last_updated = datetime.now()
+
+    write(machine, before)
+
+    row = load_row(machine.id)
+    assert (row.status, row.error_message, row.accelerator_count) == ("Offline", "Connection failed: timed out", 8)
+
+
+def test_online_written_by_another_writer_is_no_transition(events, insert_machine, monkeypatch):
+    triggered = []
+    monkeypatch.setattr(topo_service, "trigger_topo_update_async", triggered.append)
+    machine = insert_machine(status="Offline")
+    before = capture_monitor_fields(machine)
+    # /ingest marked it Online during the poll; the poll's Online is no transition
+    update_row(machine.id, status="Online")
+    machine.status = "Online"
+    machine.last_updated = datetime.now() + timedelta(seconds=1)
+
+    write(machine, before)
+
+    assert triggered == []
+
+
+def test_deleted_machine_is_skipped(events, insert_machine):
+    machine = insert_machine(status="Online")
+    before = capture_monitor_fields(machine)
+    with Session(database.engine) as session:
+        session.delete(session.get(Machine, machine.id))
+        session.commit()
+    machine.status = "Offline"
+
+    writer = write(machine, before)
+
+    assert (writer.changed_count, writer.heartbeat_count) == (0, 0)
+    assert events == []
+
+
+def test_hardware_change_on_an_online_machine_triggers_topo(events, insert_machine, monkeypatch):
+    triggered = []
+    monkeypatch.setattr(topo_service, "trigger_topo_update_async", triggered.append)
+    machine = insert_machine(status="Online", hw_fingerprint="a")
+    before = capture_monitor_fields(machine)
+    machine.last_updated = datetime.now()
+
+    write(machine, before)
+    assert triggered == []
+
+    machine.hw_fingerprint = "b"
+    write(machine, capture_monitor_fields(load_row(machine.id)))
+    assert triggered == [machine.id]
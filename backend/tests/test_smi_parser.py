@@ -0,0 +1,49 @@
+import os
+import sys
+
+import pytest
+
+from services.smi_parser import parse_huawei_output, parse_nvidia_output
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks")
+CORPUS_DIR = os.path.join(BENCH_DIR, "corpus")
+sys.path.insert(0, BENCH_DIR)
+
+import legacy_smi_parser as legacy  # noqa: E402
+
+PARSERS = {
+    "nvidia": (parse_nvidia_output, legacy.parse_nvidia_output),
+    "npu": (parse_huawei_output, legacy.parse_huawei_output),
+}
+
+
+def read_sample(file_name: str) -> str:
+    with open(os.path.join(CORPUS_DIR, file_name), encoding="utf-8") as f:
+        # check_machine strips each section before parsing
+        return f.read().strip()
+
+
+@pytest.mark.parametrize("file_name", sorted(os.listdir(CORPUS_DIR)))
+def test_matches_the_original_parser_on_full_and_truncated_output(file_name):
+    parse, original = PARSERS[file_name.split("_", 1)[0]]
+    lines = read_sample(file_name).splitlines()
+
+    for end in range(1, len(lines) + 1):
+        text = "\n".join(lines[:end])
+        assert parse(text) == original(text), f"first {end} lines"
+
+
+def test_npu_warning_cards_are_counted_once():
+    result = parse_huawei_output(read_sample("npu_910b4_warning.txt"))
+
+    assert result["accelerator_type"] == "Ascend 910B4"
+    assert (result["accelerator_count"], result["idle_count"], result["busy_count"], result["warning_count"]) == (8, 5, 1, 2)
+    assert [card["health"] for card in result["accelerator_status"]].count("Warning") == 2
+
+
+def test_nvidia_mixed_models_are_listed_by_short_name():
+    result = parse_nvidia_output(read_sample("nvidia_mixed_consumer.txt"))
+
+    assert result["accelerator_type"] == "L40S, RTX 3090, RTX 4090, RTX A6000, V100-PCIE-32GB"
+    assert result["accelerator_status"][2]["temp"] == "N/A"
+    assert result["accelerator_count"] == result["idle_count"] + result["busy_count"] + result["warning_count"]
@@ -0,0 +1,134 @@
+import paramiko
+import pytest
+
+from models import Machine
+from services import monitor_service
+from services.ssh_pool import SSHConnectionPool, SSHConnectionLost
+
+
+class FakeTransport:
+    def __init__(self, alive=True, peer_alive=True):
+        self.alive = alive
+        self.peer_alive = peer_alive
+        self.sessions_opened = 0
+
+    def is_active(self):
+        return self.alive
+
+    def set_keepalive(self, interval):
+        pass
+
+    def open_session(self, timeout=None):
+        if not self.peer_alive:
+            raise paramiko.SSHException("Timeout opening channel.")
+        self.sessions_opened += 1
+        return self
+
+    def close(self):
+        pass
+
+
+class FakeStream:
+    def __init__(self, data):
+        self._data = data
+
+    def read(self):
+        return self._data.encode("utf-8")
+
+
+class FakeClient:
+    def __init__(self, output="", transport=None, broken=False):
+        self.output = output
+        self.transport = transport or FakeTransport()
+        self.broken = broken
+        self.closed = False
+
+    def get_transport(self):
+        return self.transport
+
+    def exec_command(self, command, timeout=None):
+        if self.broken:
+            raise paramiko.SSHException("SSH session not active")
+        return None, FakeStream(self.output), FakeStream("")
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(results):
+    """Pool whose connect() hands out `results` in order."""
+    results = list(results)
+    pool = SSHConnectionPool(connect=lambda *args: results.pop(0), key_func=lambda m: m.ip, health_check_after=0)
+    return pool
+
+
+def make_machine(**fields):
+    return Machine(ip="10.0.0.1", port=22, username="root", password="pw", **fields)
+
+
+def test_execute_reuses_pooled_connection():
+    client = FakeClient(output="aarch64")
+    pool = make_pool([(client, None, None)])
+    machine = make_machine()
+    for _ in range(2):
+        with pool.lease(machine) as conn:
+            assert conn.execute("uname -m") == ("aarch64", "")
+    assert pool.stats()["connections"] == 1
+
+
+def test_execute_reconnects_stale_transport():
+    pool = make_pool([(FakeClient(broken=True), None, None), (FakeClient(output="ok"), None, None)])
+    with pool.lease(make_machine()) as conn:
+        assert conn.execute("true") == ("ok", "")
+
+
+def test_execute_raises_when_reconnect_fails():
+    pool = make_pool([(FakeClient(broken=True), None, None), (None, "auth", "Authentication failed.")])
+    with pool.lease(make_machine()) as conn:
+        with pytest.raises(SSHConnectionLost) as excinfo:
+            conn.execute("true")
+    assert excinfo.value.error_type == "auth"
+    assert pool.stats()["connections"] == 0
+
+
+def test_key_locks_are_dropped_when_no_connect_uses_them():
+    pool = make_pool([
+        (FakeClient(output="ok"), None, None),
+        (FakeClient(broken=True), None, None),
+        (None, "timeout", "timed out"),
+    ])
+    with pool.lease(make_machine()):
+        pass
+    with pool.lease(Machine(ip="10.0.0.2", port=22, username="root", password="pw")) as conn:
+        with pytest.raises(SSHConnectionLost):
+            conn.execute("true")
+    assert pool._key_locks == {}
+
+
+def test_health_check_replaces_connection_with_dead_peer():
+    dead = FakeClient(transport=FakeTransport(peer_alive=False))
+    fresh = FakeClient(output="ok")
+    pool = make_pool([(dead, None, None), (fresh, None, None)])
+    machine = make_machine()
+    with pool.lease(machine):
+        pass
+    with pool.lease(machine) as conn:
+        assert conn.client is fresh
+    assert dead.closed
+
+
+def test_lost_connection_goes_through_failure_path(monkeypatch):
+    pool = make_pool([(FakeClient(broken=True), None, None), (None, "auth", "Authentication failed.")])
+    monkeypatch.setattr(monitor_service, "ssh_pool", pool)
+    machine = make_machine(id=9001, status="Online", arch="aarch64", accelerator_count=8)
+    try:
+        monitor_service.check_machine(machine)
+        assert machine.status == "Offline"
+        assert machine.error_message.startswith("Authentication failed")
+        # Nothing was parsed from the empty output
+        assert machine.arch == "aarch64"
+        assert machine.accelerator_count == 8
+        skip_retry, _, fail_count = monitor_service._get_auth_backoff_info(machine)
+        assert skip_retry and fail_count == 1
+    finally:
+        monitor_service._clear_auth_failure(machine)
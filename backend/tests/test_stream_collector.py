@@ -0,0 +1,68 @@
+import time
+
+import pytest
+from sqlmodel import Session
+
+import database
+from models import Machine
+from services import stream_collector as stream_collector_module
+from services.stream_collector import RecordBuffer, StreamCollector, STREAM_RECORD_DELIM
+
+DELIM = STREAM_RECORD_DELIM.encode()
+
+
+def test_feed_returns_only_complete_records():
+    buffer = RecordBuffer()
+
+    assert buffer.feed(b"first" + DELIM + b"sec") == ["first"]
+    assert buffer.feed(b"ond" + DELIM + DELIM + b"third") == ["second", ""]
+    assert buffer.feed(DELIM) == ["third"]
+
+
+def test_feed_handles_a_delimiter_split_across_chunks():
+    buffer = RecordBuffer()
+    data = b"a" + DELIM + b"b" + DELIM
+
+    records = []
+    for i in range(len(data)):
+        records += buffer.feed(data[i:i + 1])
+
+    assert records == ["a", "b"]
+
+
+def test_feed_keeps_multibyte_text_split_across_chunks():
+    buffer = RecordBuffer()
+    data = "温度".encode() + DELIM
+
+    assert buffer.feed(data[:2]) == []
+    assert buffer.feed(data[2:]) == ["温度"]
+
+
+def test_feed_rejects_an_oversized_record_and_recovers():
+    buffer = RecordBuffer(max_bytes=16)
+
+    with pytest.raises(ValueError):
+        buffer.feed(b"x" * 17)
+    assert buffer.feed(b"ok" + DELIM) == ["ok"]
+
+
+def test_flush_counts_only_written_records(clean_db, monkeypatch):
+    with Session(database.engine) as session:
+        session.add_all([Machine(id=i, ip=f"10.16.0.{i}", username="root", password="pw") for i in (1, 2)])
+        session.commit()
+
+    def merge(machine, nvidia_out, npu_out):
+        if nvidia_out == "garbage":
+            raise ValueError("unparseable")
+    monkeypatch.setattr(stream_collector_module, "merge_accelerator_data", merge)
+    monkeypatch.setattr(stream_collector_module.telemetry_store, "record", lambda machine: None)
+    collector = StreamCollector()
+    collector.submit(1, "garbage", time.time())
+    collector.submit(2, "", time.time())
+
+    collector.flush()
+
+    assert collector.flushed == 1
+    with Session(database.engine) as session:
+        assert session.get(Machine, 1).status != "Online"
+        assert session.get(Machine, 2).status == "Online"
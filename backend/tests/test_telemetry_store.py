@@ -0,0 +1,91 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from models import Machine
+from services.telemetry_store import RAW_CHUNK_SECONDS, TelemetryStore
+
+BASE_TS = 1_700_000_000 // 86400 * 86400
+
+
+def sample(ts: int, cards) -> Machine:
+    return Machine(
+        id=1,
+        ip="10.7.0.1",
+        username="root",
+        password="pw",
+        status="Online",
+        accelerator_status=json.dumps(cards),
+        last_updated=datetime.fromtimestamp(ts),
+    )
+
+
+def card(card_id=0, temp="45C", used=1000, busy=False, health="OK") -> dict:
+    return {"id": card_id, "temp": temp, "memory_used": used, "memory_total": 65536, "busy": busy, "health": health}
+
+
+@pytest.fixture
+def store(clean_db):
+    return TelemetryStore()
+
+
+def test_open_and_flushed_samples_are_queried_together(store):
+    store.record(sample(BASE_TS, [card(used=100)]))
+    store.record(sample(BASE_TS + 30, [card(used=200, busy=True)]))
+    store.flush(force=True)
+    store.record(sample(BASE_TS + 60, [card(temp="N/A", health="Warning")]))
+
+    result = store.query(1, start_ts=BASE_TS, end_ts=BASE_TS + 120, resolution="raw")
+
+    points = result["cards"]["0"]
+    assert [p["ts"] for p in points] == [BASE_TS, BASE_TS + 30, BASE_TS + 60]
+    assert [p["state"] for p in points] == ["idle", "busy", "warning"]
+    assert [p["temp"] for p in points] == [45, 45, None]
+    assert points[1]["memory_used"] == 200
+
+
+def test_chunks_close_at_the_hour_boundary_and_duplicate_ids_get_a_suffix(store):
+    store.record(sample(BASE_TS, [card(0), card(0)]))
+    store.record(sample(BASE_TS + RAW_CHUNK_SECONDS, [card(0)]))
+
+    assert store.stats() == {"open_series": 2, "pending_chunks": 1}
+    store.flush(force=True)
+
+    cards = store.query(1, start_ts=BASE_TS, end_ts=BASE_TS + RAW_CHUNK_SECONDS, resolution="raw")["cards"]
+    assert sorted(cards) == ["0", "0#1"]
+    assert len(cards["0"]) == 2
+
+
+def test_offline_or_unparsable_results_are_not_recorded(store):
+    machine = sample(BASE_TS, [card()])
+    machine.status = "Offline"
+    store.record(machine)
+    store.record(Machine(id=1, ip="x", username="u", password="p", status="Online", accelerator_status="not json"))
+
+    assert store.stats()["open_series"] == 0
+
+
+def test_compaction_folds_raw_samples_into_15_minute_buckets(store):
+    store.record(sample(BASE_TS, [card(temp="40C", used=100)]))
+    store.record(sample(BASE_TS + 60, [card(temp="60C", used=300, busy=True)]))
+    store.record(sample(BASE_TS + 900, [card(temp="50C", used=500)]))
+    store.flush(force=True)
+
+    store.compact(now_ts=BASE_TS + 3 * 86400)
+
+    assert store.query(1, start_ts=BASE_TS, end_ts=BASE_TS + 3600, resolution="raw")["cards"] == {}
+    buckets = store.query(1, start_ts=BASE_TS, end_ts=BASE_TS + 3600, resolution="15m")["cards"]["0"]
+    assert [b["ts"] for b in buckets] == [BASE_TS, BASE_TS + 900]
+    assert buckets[0] == {
+        "ts": BASE_TS,
+        "samples": 2,
+        "memory_used_avg": 200,
+        "memory_used_max": 300,
+        "memory_total": 65536,
+        "temp_avg": 50,
+        "temp_max": 60,
+        "busy_ratio": 0.5,
+        "warning_ratio": 0,
+    }
+    assert buckets[1]["samples"] == 1
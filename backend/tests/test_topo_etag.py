@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlmodel import Session
+from starlette.requests import Request
+
+import database
+from models import Machine, MachineTopology
+from routers.machines import get_machine_topo
+
+
+def make_request() -> Request:
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": []})
+
+
+def get_topo(machine_id: int, if_none_match: str = None):
+    with Session(database.engine) as session:
+        return get_machine_topo(machine_id, make_request(), if_none_match, session)
+
+
+def save_topology(machine_id: int, updated_at: datetime):
+    with Session(database.engine) as session:
+        session.merge(MachineTopology(machine_id=machine_id, pci_topo_json='{"nodes": []}', updated_at=updated_at))
+        session.commit()
+
+
+@pytest.fixture
+def machine_id(clean_db):
+    with Session(database.engine) as session:
+        machine = Machine(ip="10.3.0.1", username="root", password="pw")
+        session.add(machine)
+        session.commit()
+        session.refresh(machine)
+        save_topology(machine.id, datetime(2026, 10, 18, 12, 0, 0))
+        return machine.id
+
+
+def test_etag_comes_from_the_stored_topology(machine_id):
+    first = get_topo(machine_id)
+    # A fresh process (or another instance) derives the same tag
+    assert get_topo(machine_id).headers["etag"] == first.headers["etag"]
+    assert get_topo(machine_id, first.headers["etag"]).status_code == 304
+
+    save_topology(machine_id, datetime(2026, 10, 18, 12, 0, 0) + timedelta(minutes=5))
+    second = get_topo(machine_id, first.headers["etag"])
+    assert second.status_code == 200
+    assert second.headers["etag"] != first.headers["etag"]
+
+
+def test_deleted_machine_is_404_even_with_matching_etag(machine_id):
+    etag = get_topo(machine_id).headers["etag"]
+    with Session(database.engine) as session:
+        session.delete(session.get(Machine, machine_id))
+        session.commit()
+
+    with pytest.raises(HTTPException) as excinfo:
+        get_topo(machine_id, etag)
+    assert excinfo.value.status_code == 404
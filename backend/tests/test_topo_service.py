@@ -0,0 +1,199 @@
+import io
+import json
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+from sqlmodel import Session
+
+import database
+from models import Machine, MachineTopology
+from services import topo_service
+from services.monitor_service import compute_hardware_fingerprint
+from services.topo_service import (
+    REMOTE_TOOL_DIR,
+    TOPO_PRIORITY_EVENT,
+    TOPO_PRIORITY_SWEEP,
+    TOPO_PRIORITY_USER,
+    TopoScheduler,
+    get_tool_bundle,
+    topo_is_current,
+)
+
+TOPOLOGY = {"nodes": [{"id": "0000:00:00.0"}], "edges": []}
+
+
+@pytest.fixture
+def tool_tree(tmp_path, monkeypatch):
+    (tmp_path / "pcietopo").mkdir()
+    (tmp_path / "pcietopo" / "__main__.py").write_text("print('topo')\n")
+    (tmp_path / "tests").mkdir()
+    (tmp_path / "tests" / "test_x.py").write_text("")
+    monkeypatch.setattr(topo_service, "LIB_PATH", tmp_path)
+    monkeypatch.setattr(topo_service, "_bundle_cache", {"signature": None, "version": None, "zip": None, "checked_ts": 0})
+    return tmp_path
+
+
+def test_bundle_is_built_once_and_rebuilt_when_the_tree_changes(tool_tree, monkeypatch):
+    version, content = get_tool_bundle()
+    assert zipfile.ZipFile(io.BytesIO(content)).namelist() == ["pcietopo/__main__.py"]
+    assert get_tool_bundle() == (version, content)
+
+    (tool_tree / "pcietopo" / "__main__.py").write_text("print('topo v2')\n")
+    # Still inside the recheck window
+    assert get_tool_bundle()[0] == version
+
+    monkeypatch.setattr(topo_service, "BUNDLE_RECHECK_SECONDS", 0)
+    assert get_tool_bundle()[0] != version
+
+
+class FakeSFTP:
+    def __init__(self, host):
+        self.host = host
+
+    def file(self, path, mode):
+        host = self.host
+
+        class Upload(io.BytesIO):
+            def __exit__(self, *exc):
+                host.uploads.append(path)
+                return super().__exit__(*exc)
+
+        return Upload()
+
+    def close(self):
+        pass
+
+
+class FakeHost:
+    """A remote that answers the topo command according to the installed bundle version."""
+
+    def __init__(self):
+        self.installed = None
+        self.commands = []
+        self.uploads = []
+
+    def execute(self, command, timeout=10):
+        self.commands.append(command)
+        if command.startswith(f"cd ~/{REMOTE_TOOL_DIR} 2>/dev/null"):
+            if self.installed is None or f'= "{self.installed}" ]' not in command:
+                return "BUNDLE_MISSING", ""
+            return json.dumps(TOPOLOGY), ""
+        if "> .bundle_version" in command:
+            self.installed = command.split("echo ")[-1].split(" >")[0]
+        return "", ""
+
+    def open_sftp(self):
+        return FakeSFTP(self)
+
+
+def test_bundle_is_uploaded_only_to_hosts_without_the_current_version(tool_tree, clean_db):
+    machine = Machine(ip="10.8.0.1", username="root", password="pw", status="Online", hw_fingerprint="hw-1")
+    host = FakeHost()
+    with Session(database.engine) as session:
+        session.add(machine)
+        session.commit()
+        session.refresh(machine)
+
+        topo_service._run_topo_job(session, machine, host)
+        assert host.uploads == [f"{REMOTE_TOOL_DIR}/tool.zip"]
+        assert len(host.commands) == 4
+        # A private directory in the home of the login user, not a shared one
+        assert not REMOTE_TOOL_DIR.startswith("/")
+        assert f"chmod 700 ~/{REMOTE_TOOL_DIR}" in host.commands[1]
+
+        host.commands.clear()
+        topo_service._run_topo_job(session, machine, host)
+        assert len(host.commands) == 1
+        assert len(host.uploads) == 1
+
+        stored = session.get(MachineTopology, machine.id)
+        assert json.loads(stored.pci_topo_json) == TOPOLOGY
+        assert session.get(Machine, machine.id).topo_fingerprint == "hw-1"
+
+
+def test_hardware_fingerprint_ignores_card_order_and_utilisation():
+    cards = [
+        {"id": 0, "name": "Ascend910B3", "memory_total": 65536, "memory_used": 10, "busy": True},
+        {"id": 1, "name": "Ascend910B3", "memory_total": 65536, "memory_used": 0, "busy": False},
+    ]
+    idle = [dict(card, memory_used=0, busy=False) for card in reversed(cards)]
+    fingerprint = compute_hardware_fingerprint("pci-digest", cards)
+
+    assert compute_hardware_fingerprint("pci-digest", idle) == fingerprint
+    assert compute_hardware_fingerprint("other-digest", cards) != fingerprint
+    assert compute_hardware_fingerprint("pci-digest", cards[:1]) != fingerprint
+
+
+@pytest.mark.parametrize("hw, topo, current", [
+    ("a", "a", True),
+    ("b", "a", False),
+    ("a", None, False),
+    (None, None, False),
+])
+def test_topo_is_current(hw, topo, current):
+    machine = Machine(ip="10.8.0.2", username="root", password="pw", hw_fingerprint=hw, topo_fingerprint=topo)
+    assert topo_is_current(machine) is current
+
+
+@pytest.mark.parametrize("force, connected", [(False, False), (True, True)])
+def test_unchanged_hardware_skips_the_topo_job_unless_forced(clean_db, monkeypatch, force, connected):
+    machine = Machine(ip="10.8.0.3", username="root", password="pw", status="Online", hw_fingerprint="a", topo_fingerprint="a")
+    with Session(database.engine) as session:
+        session.add(machine)
+        session.commit()
+        session.refresh(machine)
+    leased = []
+
+    @contextmanager
+    def lease(machine):
+        leased.append(machine.ip)
+        yield SimpleNamespace(client=None, error_message="offline")
+
+    monkeypatch.setattr(topo_service.ssh_pool, "lease", lease)
+    topo_service.update_machine_topo(machine.id, force=force)
+
+    assert bool(leased) is connected
+
+
+def test_scheduler_runs_by_priority_and_coalesces_requests(monkeypatch):
+    release = threading.Event()
+    started = threading.Event()
+    ran = []
+
+    def update(machine_id, force):
+        ran.append((machine_id, force))
+        if machine_id == 1:
+            started.set()
+            release.wait(5)
+
+    monkeypatch.setattr(topo_service, "update_machine_topo", update)
+    scheduler = TopoScheduler(workers=1, queue_limit=3)
+    try:
+        assert scheduler.submit(1, priority=TOPO_PRIORITY_SWEEP) == "queued"
+        assert started.wait(5)
+
+        assert scheduler.submit(2, priority=TOPO_PRIORITY_SWEEP) == "queued"
+        assert scheduler.submit(3, priority=TOPO_PRIORITY_EVENT) == "queued"
+        assert scheduler.submit(4, priority=TOPO_PRIORITY_USER) == "queued"
+        assert scheduler.submit(2, force=True, priority=TOPO_PRIORITY_USER) == "updated"
+        assert scheduler.submit(1) == "running"
+        # The queue is full for background sweeps, never for users
+        assert scheduler.submit(5, priority=TOPO_PRIORITY_SWEEP) == "dropped"
+        assert scheduler.submit(6, priority=TOPO_PRIORITY_USER) == "queued"
+        assert scheduler.stats()["queued_by_priority"] == {"user": 3, "event": 1, "sweep": 0}
+
+        release.set()
+        deadline = time.time() + 5
+        while scheduler.stats()["completed"] < 5 and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        release.set()
+        scheduler.stop()
+
+    assert ran == [(1, False), (4, False), (2, True), (6, False), (3, False)]
+    stats = scheduler.stats()
+    assert (stats["coalesced"], stats["dropped"]) == (2, 1)